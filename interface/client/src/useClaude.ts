@@ -181,6 +181,9 @@ export const useClaude = (options: ClaudeOptions = {}): ClaudeHook => {
   const pendingDeltas = useRef(new Map<string, string>());
   const rafId = useRef<number | null>(null);
 
+  // invoke_agent_graph progress for the status line (agent_graph events)
+  const graphProgress = useRef<{ total: number; done: number; running: string[] } | null>(null);
+
   // Guard flag: when true, streaming events are ignored until the 'state' response arrives.
   // This prevents the race condition where stale/early events corrupt state during chat switching.
   const awaitingStateResponse = useRef(false);
@@ -772,6 +775,29 @@ export const useClaude = (options: ClaudeOptions = {}): ClaudeHook => {
           lastActivityTime.current = Date.now();
           break;
 
+        case 'agent_graph': {
+          // invoke_agent_graph node progress, shown in the status line while the tool runs
+          const graph = graphProgress.current;
+          if (data.event === 'graph_started') {
+            graphProgress.current = { total: data.nodes?.length || 0, done: 0, running: [] };
+          } else if (data.event === 'graph_completed') {
+            graphProgress.current = null;
+            setStatusText(`Agent graph finished: ${data.succeeded}/${data.total} nodes succeeded`);
+          } else if (graph && data.event === 'node_started') {
+            graph.running = [...graph.running, `${data.node} (${data.agent})`];
+          } else if (graph && data.event === 'node_completed') {
+            graph.running = graph.running.filter(n => n !== `${data.node} (${data.agent})`);
+            graph.done += 1;
+          }
+          const current = graphProgress.current;
+          if (current) {
+            const running = current.running.length ? ` — running ${current.running.join(', ')}` : '';
+            setStatusText(`Agent graph: ${current.done}/${current.total} nodes done${running}`);
+          }
+          lastActivityTime.current = Date.now();
+          break;
+        }
+
         case 'truncate':
           // BACKEND-AUTHORITATIVE: Server truncated - just accept the new state
           // This is broadcast to ALL clients, ensuring multi-device consistency
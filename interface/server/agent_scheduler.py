@@ -0,0 +1,540 @@
+"""
+Agent Scheduler - Process-wide admission control for agent runs.
+
+Every agent run is a separate CLI subprocess with a large RSS, but each
+invoke tool managed concurrency on its own (invoke_agent_parallel made a
+fresh Semaphore(5) per call; everything else was unbounded). All agent
+runs now ask this scheduler for a lease first:
+
+- Capacity is measured in slots (AGENT_MAX_SLOTS, default 5) and
+  estimated memory (AGENT_RSS_ESTIMATE_MB per run against
+  AGENT_MEMORY_BUDGET_MB); a run is admitted only when both fit
+- Priority classes: foreground > scheduled > background (ping/trust)
+- Fair queuing: within a class, waiting runs are admitted round-robin
+  across source chats, so one chat fanning out can't starve another
+- position(lease) gives callers their place in the admission order
+- Foreground runs hold their lease for the duration of the call. A nested
+  foreground run (requested while lease_token names an admitted lease,
+  i.e. an agent invoking an agent) borrows its parent's slot, which sits
+  idle while the parent waits, so nested calls can't deadlock with every
+  slot held by a waiting parent; a parent lends to one child at a time,
+  and other waiting runs are never admitted over capacity. Ping, trust and chain runs return immediately from the
+  runner, so their lease is held until the process registry entries they
+  create have all deregistered (or a timeout). Entries are matched to
+  leases by the token bound_to() puts in process_registry.lease_token
+  while the runner starts; a chain's lease covers each of its agents in
+  turn. A finished ping run publishes to the notification bus, so its
+  completion is delivered without waiting for a sweep
+- Background runs are held in the queue while the usage budget guard
+  reports spend or load over its limits (usage_store.BudgetGuard)
+- Every admitted run is recorded in the usage store when its lease is
+  released: latency, plus the tokens/cost of its runs. The runner reports
+  those when a run deregisters (process_registry.deregister_process(
+  reg_id, usage=...)), so background ping/trust/chain/scheduled runs count
+  toward the budget guard too; callers holding a result pass it to
+  record_result() instead. Per lease, whichever reports first owns the
+  totals, so a run is never counted twice
+- snapshot() feeds process_list with running and queued runs
+
+Runs on the event loop; request()/slot() must be called from the loop.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger("agent_scheduler")
+
+PRIORITY_FOREGROUND = 0
+PRIORITY_SCHEDULED = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {
+    PRIORITY_FOREGROUND: "foreground",
+    PRIORITY_SCHEDULED: "scheduled",
+    PRIORITY_BACKGROUND: "background",
+}
+MODE_PRIORITY = {
+    "foreground": PRIORITY_FOREGROUND,
+    "scheduled": PRIORITY_SCHEDULED,
+    "ping": PRIORITY_BACKGROUND,
+    "trust": PRIORITY_BACKGROUND,
+}
+
+MAX_SLOTS = int(os.environ.get("AGENT_MAX_SLOTS", "5"))
+MEMORY_BUDGET_MB = int(os.environ.get("AGENT_MEMORY_BUDGET_MB", "4096"))
+RSS_ESTIMATE_MB = int(os.environ.get("AGENT_RSS_ESTIMATE_MB", "500"))
+
+THROTTLE_RECHECK = 60.0        # Re-check the budget guard while background runs are held
+
+BIND_TIMEOUT = 60.0            # Background lease not matched to a registry entry in time: release
+RUN_GAP_TIMEOUT = 30.0         # Chain: next agent not registered this long after the last ended
+LEASE_TIMEOUT = 30 * 60.0      # Upper bound per registry entry a background lease expects
+
+# Usage fields summed over a lease's runs (a chain reports one result per agent)
+USAGE_TOTALS = ("input_tokens", "output_tokens", "cache_read_tokens", "cost_usd")
+
+
+@dataclass
+class Lease:
+    """One agent run's claim on scheduler capacity."""
+    id: int
+    agent: str
+    mode: str
+    priority: int
+    source_chat_id: str
+    memory_mb: int
+    requested: float
+    admitted_at: Optional[float] = None
+    admitted: asyncio.Future = field(default=None, repr=False)
+    token: str = ""                    # Matches process registry entries to this lease
+    runs: int = 1                      # Registry entries expected (chains: one per agent)
+    reg_ids: Set[str] = field(default_factory=set)   # Live registry entries bound to the lease
+    finished: int = 0                  # Bound entries that have deregistered
+    held: bool = False                 # Background: released by registry events, not the caller
+    gap_timer: Optional[asyncio.TimerHandle] = field(default=None, repr=False)
+    released: bool = False
+    usage: Dict[str, Any] = field(default_factory=dict)   # Tokens/cost/model recorded on release
+    usage_source: str = ""             # "runner" or "caller": who reports this lease's tokens/cost
+    parent: Optional["Lease"] = field(default=None, repr=False)   # Admitted lease this run is nested in
+    borrowed: bool = False             # Admitted on its parent's slot
+    lending: bool = False              # This lease's slot is lent to a nested run
+
+    @property
+    def waited(self) -> float:
+        return (self.admitted_at or time.time()) - self.requested
+
+
+class AgentScheduler:
+    """Slot + memory admission control with per-chat fair queuing."""
+
+    def __init__(self, max_slots: int = MAX_SLOTS, memory_budget_mb: int = MEMORY_BUDGET_MB):
+        self.max_slots = max(1, max_slots)
+        self.memory_budget_mb = memory_budget_mb
+        self._ids = itertools.count(1)
+        # priority -> chat -> FIFO of waiting leases (chat order = round-robin order)
+        self._queues: Dict[int, "OrderedDict[str, Deque[Lease]]"] = {
+            p: OrderedDict() for p in PRIORITY_NAMES
+        }
+        self._running: Dict[int, Lease] = {}
+        self._by_token: Dict[str, Lease] = {}   # Unreleased leases by token
+        self._by_reg: Dict[str, Lease] = {}     # Registry entry id -> bound lease
+        self._unbound: Deque[Lease] = deque()   # Held leases with no entry yet (name fallback)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {"admitted": 0, "queued": 0, "total_wait": 0.0, "timeouts": 0, "borrowed": 0}
+        self._listening = False
+        self._throttled: Optional[str] = None
+        self._recheck: Optional[asyncio.TimerHandle] = None
+
+    # ── Capacity ──────────────────────────────────────────────────────────────
+
+    def _used(self):
+        slots = sum(
+            1 for l in self._running.values()
+            if not (l.borrowed and l.parent.id in self._running)
+        )
+        return slots, sum(l.memory_mb for l in self._running.values())
+
+    def _fits(self, lease: Lease) -> bool:
+        slots, memory = self._used()
+        if slots >= self.max_slots:
+            return False
+        # A single run is always allowed when nothing else is running
+        return not self._running or memory + lease.memory_mb <= self.memory_budget_mb
+
+    # ── Queue order ───────────────────────────────────────────────────────────
+
+    def _order(self) -> List[Lease]:
+        """Waiting leases in admission order (priority, then round-robin by chat)."""
+        order: List[Lease] = []
+        for priority in sorted(self._queues):
+            lanes = [list(q) for q in self._queues[priority].values()]
+            for depth in range(max((len(l) for l in lanes), default=0)):
+                order.extend(lane[depth] for lane in lanes if depth < len(lane))
+        return order
+
+    def position(self, lease: Lease) -> int:
+        """1-based position in the admission queue (0 once admitted)."""
+        if lease.admitted_at is not None:
+            return 0
+        for index, waiting in enumerate(self._order(), 1):
+            if waiting is lease:
+                return index
+        return 0
+
+    def _pump(self):
+        """Admit waiting leases while capacity allows."""
+        while True:
+            lease = None
+            for priority in sorted(self._queues):
+                lanes = self._queues[priority]
+                if lanes:
+                    chat, lane = next(iter(lanes.items()))
+                    lease = lane[0]
+                    break
+            if lease is None or not self._fits(lease):
+                return
+            if lease.priority == PRIORITY_BACKGROUND and self._throttle():
+                return
+            lane.popleft()
+            # Round-robin: this chat goes to the back of its class
+            del lanes[chat]
+            if lane:
+                lanes[chat] = lane
+            self._admit(lease)
+
+    def _throttle(self) -> Optional[str]:
+        """Budget guard verdict for background runs; re-pumps later while held."""
+        try:
+            from usage_store import get_budget_guard
+            self._throttled = get_budget_guard().throttle_reason()
+        except Exception as e:
+            logger.debug(f"Budget guard unavailable: {e}")
+            self._throttled = None
+        if self._throttled and self._recheck is None and self._loop is not None:
+            self._recheck = self._loop.call_later(THROTTLE_RECHECK, self._recheck_throttle)
+        return self._throttled
+
+    def _recheck_throttle(self):
+        self._recheck = None
+        self._pump()
+
+    def _admit(self, lease: Lease):
+        lease.admitted_at = time.time()
+        self._running[lease.id] = lease
+        self._stats["admitted"] += 1
+        self._stats["total_wait"] += lease.waited
+        if not lease.admitted.done():
+            lease.admitted.set_result(lease)
+
+    # ── Leases ────────────────────────────────────────────────────────────────
+
+    def request(self, agent: str, mode: str = "foreground", source_chat_id: Optional[str] = None,
+                memory_mb: Optional[int] = None, runs: int = 1) -> Lease:
+        """
+        Queue a run; lease.admitted resolves when it may start.
+
+        runs is how many process registry entries a background run creates
+        one after another (a chain's length); its lease is held through all of them.
+        """
+        self._ensure_listening()
+        lease_id = next(self._ids)
+        lease = Lease(
+            id=lease_id, agent=agent, mode=mode,
+            priority=MODE_PRIORITY.get(mode, PRIORITY_BACKGROUND),
+            source_chat_id=source_chat_id or "",
+            memory_mb=memory_mb or RSS_ESTIMATE_MB,
+            requested=time.time(),
+            admitted=asyncio.get_running_loop().create_future(),
+            token=f"{os.getpid()}-{lease_id}",
+            runs=max(1, runs),
+        )
+        from process_registry import lease_token
+        parent = self._by_token.get(lease_token.get() or "")
+        if parent is not None and parent.admitted_at is not None and not parent.released:
+            lease.parent = parent
+        self._by_token[lease.token] = lease
+        lanes = self._queues[lease.priority]
+        lanes.setdefault(lease.source_chat_id, deque()).append(lease)
+        self._pump()
+        if lease.admitted_at is None:
+            self._stats["queued"] += 1
+            logger.info(f"Agent '{agent}' ({mode}) queued at position {self.position(lease)}")
+        return lease
+
+    def release(self, lease: Lease):
+        """Give the lease's capacity back (idempotent; also cancels a waiting lease)."""
+        if lease.released:
+            return
+        lease.released = True
+        if lease.admitted_at is None:
+            lanes = self._queues[lease.priority]
+            lane = lanes.get(lease.source_chat_id)
+            if lane and lease in lane:
+                lane.remove(lease)
+                if not lane:
+                    del lanes[lease.source_chat_id]
+            if not lease.admitted.done():
+                lease.admitted.cancel()
+        elif self._running.pop(lease.id, None) is not None:
+            self._record_usage(lease)
+        if lease in self._unbound:
+            self._unbound.remove(lease)
+        self._by_token.pop(lease.token, None)
+        for reg_id in lease.reg_ids:
+            self._by_reg.pop(reg_id, None)
+        if lease.gap_timer is not None:
+            lease.gap_timer.cancel()
+            lease.gap_timer = None
+        if lease.borrowed and lease.parent.lending:
+            lease.parent.lending = False
+            self._lend_to_next_child(lease.parent)
+        self._pump()
+
+    def _record_usage(self, lease: Lease):
+        try:
+            from usage_store import get_usage_store
+            get_usage_store().record_run(
+                kind=lease.mode,
+                agent=lease.agent,
+                chat_id=lease.source_chat_id or None,
+                duration_ms=int((time.time() - lease.admitted_at) * 1000),
+                **lease.usage,
+            )
+        except Exception as e:
+            logger.debug(f"Could not record usage for agent '{lease.agent}': {e}")
+
+    # ── Usage ─────────────────────────────────────────────────────────────────
+
+    def record_result(self, result: Any, lease: Optional[Lease] = None, model: Optional[str] = None):
+        """
+        Add a caller's run result (runner AgentResult) to its lease.
+
+        The lease defaults to the one bound to the current context. When the
+        runner already reported the run's tokens/cost at deregistration, only
+        model and error status are taken from the result.
+        """
+        if lease is None:
+            from process_registry import lease_token
+            lease = self._by_token.get(lease_token.get() or "")
+        if lease is None or lease.released:
+            return
+        from usage_store import usage_from_result
+        self._add_usage(lease, "caller", usage_from_result(result), model)
+
+    def _add_usage(self, lease: Lease, source: str, fields: Dict[str, Any], model: Optional[str] = None):
+        """Sum reported usage into the lease; the first source to report owns the totals."""
+        if not lease.usage_source:
+            lease.usage_source = source
+        if lease.usage_source == source:
+            for key in USAGE_TOTALS:
+                lease.usage[key] = lease.usage.get(key, 0) + (fields.get(key) or 0)
+        if fields.get("is_error"):
+            lease.usage["is_error"] = True
+        model = model or fields.get("model")
+        if model and not lease.usage.get("model"):
+            lease.usage["model"] = model
+
+    @contextmanager
+    def bound_to(self, lease: Lease):
+        """Tag process registry entries created in this context with the lease's token."""
+        from process_registry import lease_token
+        reset = lease_token.set(lease.token)
+        try:
+            yield lease
+        finally:
+            lease_token.reset(reset)
+
+    @asynccontextmanager
+    async def slot(self, agent: str, mode: str = "foreground", source_chat_id: Optional[str] = None,
+                   timeout: Optional[float] = None):
+        """
+        Hold a lease for the duration of a (blocking) agent run.
+
+        timeout bounds the wait for admission of a background lease; on expiry
+        the queued lease is withdrawn and asyncio.TimeoutError is raised.
+        """
+        lease = self.request(agent, mode, source_chat_id)
+        try:
+            if lease.priority == PRIORITY_FOREGROUND and lease.admitted_at is None:
+                if lease.parent is not None and not lease.parent.lending:
+                    self._borrow(lease)
+                await lease.admitted
+            elif timeout is not None:
+                await asyncio.wait_for(asyncio.shield(lease.admitted), max(0.0, timeout))
+            else:
+                await lease.admitted
+            with self.bound_to(lease):
+                yield lease
+        finally:
+            self.release(lease)
+
+    def _borrow(self, lease: Lease):
+        """Admit a waiting nested lease on its parent's (idle) slot."""
+        lanes = self._queues[lease.priority]
+        lane = lanes.get(lease.source_chat_id)
+        if lane and lease in lane:
+            lane.remove(lease)
+            if not lane:
+                del lanes[lease.source_chat_id]
+        lease.borrowed = True
+        lease.parent.lending = True
+        self._stats["borrowed"] += 1
+        logger.info(f"Agent '{lease.agent}' runs on the slot of its caller '{lease.parent.agent}'")
+        self._admit(lease)
+
+    def _lend_to_next_child(self, parent: Lease):
+        """The parent's slot is free again: lend it to its next waiting nested run."""
+        if parent.released or parent.lending:
+            return
+        for lease in self._order():
+            if lease.parent is parent and lease.priority == PRIORITY_FOREGROUND:
+                self._borrow(lease)
+                return
+
+    # ── Background runs (bound to the process registry) ──────────────────────
+
+    def hold_until_finished(self, lease: Lease):
+        """
+        Keep a background lease until the registry entries its run creates
+        (lease.runs of them, tagged with its token) have all gone away.
+        Start the run inside bound_to(lease) so its entries carry the token.
+        """
+        if lease.released:
+            return
+        lease.held = True
+        if not lease.reg_ids and lease.finished == 0:
+            self._unbound.append(lease)
+        loop = asyncio.get_running_loop()
+        loop.call_later(BIND_TIMEOUT, self._bind_timeout, lease)
+        loop.call_later(LEASE_TIMEOUT * lease.runs, self._lease_timeout, lease)
+        self._check_finished(lease)
+
+    def _bind_timeout(self, lease: Lease):
+        if not lease.released and not lease.reg_ids and lease.finished == 0:
+            logger.debug(f"Agent '{lease.agent}' never registered; releasing its lease")
+            self.release(lease)
+
+    def _lease_timeout(self, lease: Lease):
+        if not lease.released:
+            self._stats["timeouts"] += 1
+            logger.warning(f"Agent '{lease.agent}' lease expired after {LEASE_TIMEOUT * lease.runs:.0f}s")
+            self.release(lease)
+
+    def _gap_timeout(self, lease: Lease):
+        lease.gap_timer = None
+        if not lease.released and not lease.reg_ids:
+            # A chain that stopped early (e.g. alert_and_stop after a failure)
+            self._finish(lease)
+
+    def _check_finished(self, lease: Lease):
+        """Release a held lease once its last expected entry has deregistered."""
+        if not lease.held or lease.released or lease.reg_ids or lease.finished == 0:
+            return
+        if lease.finished >= lease.runs:
+            self._finish(lease)
+        elif lease.gap_timer is None and self._loop is not None:
+            lease.gap_timer = self._loop.call_later(RUN_GAP_TIMEOUT, self._gap_timeout, lease)
+
+    def _finish(self, lease: Lease):
+        self.release(lease)
+        if lease.mode == "ping":
+            self._publish_completion(lease)
+
+    def _publish_completion(self, lease: Lease):
+        """A ping run finished: wake its chat's notification delivery now."""
+        try:
+            from notification_bus import get_notification_bus
+            get_notification_bus().publish(lease.source_chat_id)
+        except Exception as e:
+            logger.debug(f"Could not publish completion of agent '{lease.agent}': {e}")
+
+    def _on_registry_event(self, event: str, reg_id: str, agent: Optional[str], token: Optional[str],
+                           usage: Optional[Dict[str, Any]] = None):
+        if event == "registered":
+            if token:
+                lease = self._by_token.get(token)
+            else:
+                # Registered outside any lease context (e.g. another process): fall back
+                # to the oldest held lease for this agent that has no entry yet
+                lease = next((l for l in self._unbound if l.agent == agent), None)
+            if lease is None or lease.released:
+                return
+            lease.reg_ids.add(reg_id)
+            self._by_reg[reg_id] = lease
+            if lease in self._unbound:
+                self._unbound.remove(lease)
+            if lease.gap_timer is not None:
+                lease.gap_timer.cancel()
+                lease.gap_timer = None
+        elif event == "deregistered":
+            lease = self._by_reg.pop(reg_id, None)
+            if lease is None:
+                return
+            lease.reg_ids.discard(reg_id)
+            lease.finished += 1
+            if usage:
+                self._add_usage(lease, "runner", usage)
+            self._check_finished(lease)
+
+    def _registry_listener(self, event: str, reg_id: str, agent: Optional[str], token: Optional[str] = None,
+                           usage: Optional[Dict[str, Any]] = None):
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._on_registry_event(event, reg_id, agent, token, usage)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._on_registry_event, event, reg_id, agent, token, usage)
+            except RuntimeError:
+                pass
+
+    def _ensure_listening(self):
+        if self._listening:
+            return
+        self._loop = asyncio.get_running_loop()
+        try:
+            from process_registry import add_listener
+            add_listener(self._registry_listener)
+        except ImportError:
+            logger.warning("process_registry unavailable; background leases release on timeout")
+        self._listening = True
+
+    # ── Introspection ─────────────────────────────────────────────────────────
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Running and queued runs plus capacity, for process_list and stats."""
+        now = time.time()
+        slots, memory = self._used()
+        running = [
+            {"agent": l.agent, "mode": l.mode, "chat": l.source_chat_id or None,
+             "running_for": round(now - l.admitted_at, 1)}
+            for l in self._running.values()
+        ]
+        queued = [
+            {"position": i, "agent": l.agent, "mode": l.mode, "chat": l.source_chat_id or None,
+             "waiting_for": round(now - l.requested, 1)}
+            for i, l in enumerate(self._order(), 1)
+        ]
+        admitted = self._stats["admitted"]
+        return {
+            "slots": {"used": slots, "max": self.max_slots},
+            "memory_mb": {"used": memory, "budget": self.memory_budget_mb},
+            "running": running,
+            "queued": queued,
+            "throttled": self._throttled,
+            "stats": {
+                "admitted": admitted,
+                "queued": self._stats["queued"],
+                "avg_wait_seconds": round(self._stats["total_wait"] / admitted, 2) if admitted else 0.0,
+                "lease_timeouts": self._stats["timeouts"],
+                "borrowed_slots": self._stats["borrowed"],
+            },
+        }
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_scheduler: Optional[AgentScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_agent_scheduler() -> AgentScheduler:
+    """Get or create the process-wide agent scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = AgentScheduler()
+    return _scheduler
@@ -0,0 +1,399 @@
+"""
+ANN Index - IVF-PQ approximate nearest-neighbour search in NumPy.
+
+Sits on top of a VectorStore so large stores do not need a full linear scan:
+
+1. Coarse quantizer: spherical k-means centroids (nlist ≈ 4·sqrt(N)).
+   Each vector is filed in the inverted list of its nearest centroid.
+2. Product quantization of the residual (vector - centroid): the residual
+   is split into m sub-vectors, each encoded as one byte (256 codewords).
+3. Search probes the nprobe best lists and scores their entries with
+   asymmetric distance computation: q·c + Σ_j LUT[j][code_j].
+4. The best candidates are re-ranked with exact scores from the store.
+
+Incremental: add() encodes new vectors against the trained codebooks and
+remove() tombstones IDs. needs_rebuild() reports when the index has drifted
+far enough (growth or deletions) that it should be retrained.
+
+Files (next to the vector store):
+    model.npz      centroids + PQ codebooks + training size
+    lists.bin      int32 list number per entry
+    ids.bin        int64 ID per entry
+    codes.bin      uint8[m] PQ code per entry
+    deleted.bin    int64 IDs removed since training
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("ann_index")
+
+KMEANS_ITERATIONS = 15
+TRAIN_SAMPLE = 25000        # Max vectors used to train centroids/codebooks
+PQ_CODEWORDS = 256
+DEFAULT_NPROBE = 16
+RERANK_FACTOR = 8           # Candidates re-ranked exactly = k * RERANK_FACTOR
+REBUILD_GROWTH = 4.0        # Retrain when N exceeds this multiple of the training size
+REBUILD_DELETED_FRACTION = 0.2
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest sub-quantizer count ≤ 32 that divides dim."""
+    for m in (32, 16, 8, 4, 2, 1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def _kmeans(x, n_clusters: int, spherical: bool, iterations: int = KMEANS_ITERATIONS, seed: int = 0):
+    """Lloyd k-means. Spherical mode maximizes dot product on normalized centroids."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(x))
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _assign(x, centroids, spherical)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=n_clusters).astype(np.float32)
+        empty = counts == 0
+        counts[empty] = 1.0
+        new = sums / counts[:, None]
+        # Re-seed empty clusters with random points
+        if empty.any():
+            new[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        if spherical:
+            norms = np.linalg.norm(new, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            new /= norms
+        centroids = new.astype(np.float32)
+    return centroids
+
+
+def _assign(x, centroids, spherical: bool, chunk: int = 8192):
+    """Nearest centroid per row (max dot product if spherical, else min L2)."""
+    import numpy as np
+
+    out = np.empty(len(x), dtype=np.int32)
+    c_norms = None if spherical else (centroids ** 2).sum(axis=1)
+    for start in range(0, len(x), chunk):
+        block = x[start:start + chunk]
+        sims = block @ centroids.T
+        if spherical:
+            out[start:start + chunk] = np.argmax(sims, axis=1)
+        else:
+            out[start:start + chunk] = np.argmin(c_norms[None, :] - 2 * sims, axis=1)
+    return out
+
+
+class IVFPQIndex:
+    """Inverted-file index with product-quantized residuals."""
+
+    def __init__(self, directory: str, nprobe: int = DEFAULT_NPROBE):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+
+        self.centroids = None   # (nlist, d)
+        self.codebooks = None   # (m, 256, d/m)
+        self.trained_size = 0
+
+        # Entries (in memory; codes are m bytes/vector so this stays small)
+        self._lists = None
+        self._ids = None
+        self._codes = None
+        self._deleted: set = set()
+        # CSR view grouped by list, rebuilt lazily after inserts
+        self._csr = None
+
+        self._load()
+
+    # ── Persistence ───────────────────────────────────────────────────────────
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _load(self):
+        import numpy as np
+
+        model_path = self._path("model.npz")
+        if not os.path.exists(model_path):
+            return
+        try:
+            model = np.load(model_path)
+            self.centroids = model["centroids"]
+            self.codebooks = model["codebooks"]
+            self.trained_size = int(model["trained_size"])
+            m = self.codebooks.shape[0]
+            self._lists = np.fromfile(self._path("lists.bin"), dtype=np.int32)
+            self._ids = np.fromfile(self._path("ids.bin"), dtype=np.int64)
+            self._codes = np.fromfile(self._path("codes.bin"), dtype=np.uint8).reshape(-1, m)
+            n = min(len(self._lists), len(self._ids), len(self._codes))
+            self._lists, self._ids, self._codes = self._lists[:n], self._ids[:n], self._codes[:n]
+            if os.path.exists(self._path("deleted.bin")):
+                self._deleted = set(np.fromfile(self._path("deleted.bin"), dtype=np.int64).tolist())
+            logger.info(f"ANN index loaded: {n} entries, {len(self.centroids)} lists")
+        except Exception as e:
+            logger.warning(f"ANN index at {self.directory} unreadable, will rebuild: {e}")
+            self.centroids = None
+
+    def _save_model(self):
+        import numpy as np
+
+        tmp = self._path("model.tmp.npz")
+        np.savez(tmp, centroids=self.centroids, codebooks=self.codebooks,
+                 trained_size=np.int64(self.trained_size))
+        os.replace(tmp, self._path("model.npz"))
+
+    # ── Build / insert / delete ───────────────────────────────────────────────
+
+    def build(self, store) -> int:
+        """Train on a sample of the store and index all of its live vectors."""
+        import numpy as np
+
+        started = time.time()
+        n_total = len(store)
+        if n_total == 0:
+            return 0
+
+        # Reservoir-ish sample: take every k-th chunk row to stay under TRAIN_SAMPLE
+        stride = max(1, n_total // TRAIN_SAMPLE)
+        sample = np.vstack([vecs[::stride] for _, vecs in store.iter_chunks()])[:TRAIN_SAMPLE]
+
+        nlist = max(1, min(int(4 * np.sqrt(n_total)), len(sample) // 39 or 1))
+        centroids = _kmeans(sample, nlist, spherical=True)
+        residuals = sample - centroids[_assign(sample, centroids, spherical=True)]
+
+        dim = sample.shape[1]
+        m = _pq_subquantizers(dim)
+        sub = dim // m
+        codebooks = np.zeros((m, PQ_CODEWORDS, sub), dtype=np.float32)
+        for j in range(m):
+            part = np.ascontiguousarray(residuals[:, j * sub:(j + 1) * sub])
+            cb = _kmeans(part, PQ_CODEWORDS, spherical=False, seed=j)
+            codebooks[j, :len(cb)] = cb
+
+        with self._lock:
+            self.centroids, self.codebooks = centroids, codebooks
+            self.trained_size = n_total
+            self._lists = np.empty(0, dtype=np.int32)
+            self._ids = np.empty(0, dtype=np.int64)
+            self._codes = np.empty((0, m), dtype=np.uint8)
+            self._deleted = set()
+            self._csr = None
+            for name in ("lists.bin", "ids.bin", "codes.bin", "deleted.bin"):
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+            self._save_model()
+            for ids, vecs in store.iter_chunks():
+                self.add(ids, vecs)
+
+        logger.info(
+            f"ANN index built: {n_total} vectors, {nlist} lists, m={m} "
+            f"in {time.time() - started:.1f}s"
+        )
+        return n_total
+
+    def _encode(self, vectors):
+        """Return (list numbers, PQ codes) for float32 vectors."""
+        import numpy as np
+
+        lists = _assign(vectors, self.centroids, spherical=True)
+        residuals = vectors - self.centroids[lists]
+        m, _, sub = self.codebooks.shape
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for j in range(m):
+            codes[:, j] = _assign(
+                np.ascontiguousarray(residuals[:, j * sub:(j + 1) * sub]),
+                self.codebooks[j], spherical=False,
+            )
+        return lists, codes
+
+    def add(self, ids: Sequence[int], vectors):
+        """Encode and append vectors (no-op until the index is trained)."""
+        import numpy as np
+
+        if not self.is_trained or len(ids) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            lists, codes = self._encode(vectors)
+            with open(self._path("lists.bin"), "ab") as f:
+                f.write(lists.tobytes())
+            with open(self._path("ids.bin"), "ab") as f:
+                f.write(ids.tobytes())
+            with open(self._path("codes.bin"), "ab") as f:
+                f.write(codes.tobytes())
+            self._lists = np.concatenate([self._lists, lists])
+            self._ids = np.concatenate([self._ids, ids])
+            self._codes = np.concatenate([self._codes, codes])
+            self._deleted.difference_update(ids.tolist())
+            self._csr = None
+
+    def remove(self, ids: Sequence[int]):
+        """Tombstone IDs (persisted; purged on the next rebuild)."""
+        import numpy as np
+
+        ids = [int(i) for i in ids]
+        if not self.is_trained or not ids:
+            return
+        with self._lock:
+            self._deleted.update(ids)
+            with open(self._path("deleted.bin"), "ab") as f:
+                f.write(np.asarray(ids, dtype=np.int64).tobytes())
+
+    def needs_rebuild(self, store_size: int) -> bool:
+        """True if untrained, grown well past the training size, or heavily deleted."""
+        if not self.is_trained:
+            return True
+        if store_size > self.trained_size * REBUILD_GROWTH:
+            return True
+        n = len(self._ids) if self._ids is not None else 0
+        return n > 0 and len(self._deleted) > n * REBUILD_DELETED_FRACTION
+
+    # ── Search ────────────────────────────────────────────────────────────────
+
+    def _grouped(self):
+        """CSR view: (order, offsets) so list i's entries are order[offsets[i]:offsets[i+1]]."""
+        import numpy as np
+
+        if self._csr is None:
+            order = np.argsort(self._lists, kind="stable")
+            counts = np.bincount(self._lists, minlength=len(self.centroids))
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            self._csr = (order, offsets)
+        return self._csr
+
+    def search_candidates(self, query, k: int, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Approximate top-k (id, score) from PQ codes alone."""
+        import numpy as np
+
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if not self.is_trained or self._ids is None or len(self._ids) == 0:
+                return []
+            nprobe = min(nprobe or self.nprobe, len(self.centroids))
+            order, offsets = self._grouped()
+
+            coarse = self.centroids @ query
+            probe = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+            entries = np.concatenate([order[offsets[l]:offsets[l + 1]] for l in probe])
+            if len(entries) == 0:
+                return []
+
+            m, _, sub = self.codebooks.shape
+            lut = np.einsum("jcs,js->jc", self.codebooks, query.reshape(m, sub))
+            codes = self._codes[entries]
+            scores = coarse[self._lists[entries]] + lut[np.arange(m), codes].sum(axis=1)
+            ids = self._ids[entries]
+
+            if self._deleted:
+                live = ~np.isin(ids, np.fromiter(self._deleted, dtype=np.int64))
+                scores, ids = scores[live], ids[live]
+            if len(scores) == 0:
+                return []
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def search(self, store, query, k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k (id, score): PQ candidates re-ranked with exact scores from the store."""
+        import numpy as np
+
+        candidates = self.search_candidates(query, k * RERANK_FACTOR, nprobe=nprobe)
+        if not candidates:
+            return []
+        ids, vectors = store.get_vectors([i for i, _ in candidates])
+        if len(ids) == 0:
+            return []
+        exact = vectors @ np.asarray(query, dtype=np.float32).reshape(-1)
+        top = np.argsort(-exact)[:k]
+        return [(int(ids[i]), float(exact[i])) for i in top]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "trained": self.is_trained,
+            "lists": 0 if self.centroids is None else len(self.centroids),
+            "entries": 0 if self._ids is None else len(self._ids),
+            "deleted": len(self._deleted),
+            "trained_size": self.trained_size,
+        }
+
+
+# ── Benchmark ─────────────────────────────────────────────────────────────────
+
+def benchmark(store, index: IVFPQIndex, n_queries: int = 100, k: int = 10,
+              nprobes: Sequence[int] = (4, 8, 16, 32)) -> List[Dict[str, float]]:
+    """
+    Measure recall@k and latency of the ANN index against exact store search.
+
+    Queries are vectors sampled from the store itself (self-matches included,
+    which is how real queries against paraphrased content behave too).
+    """
+    import numpy as np
+
+    queries = []
+    for _, vecs in store.iter_chunks():
+        queries.extend(vecs[:: max(1, len(store) // n_queries)])
+        if len(queries) >= n_queries:
+            break
+    queries = queries[:n_queries]
+    if not queries:
+        return []
+
+    exact, exact_ms = [], []
+    for q in queries:
+        t = time.perf_counter()
+        exact.append({i for i, _ in store.search(q, k=k)})
+        exact_ms.append((time.perf_counter() - t) * 1000)
+
+    rows = []
+    for nprobe in nprobes:
+        recalls, ann_ms = [], []
+        for q, truth in zip(queries, exact):
+            t = time.perf_counter()
+            got = {i for i, _ in index.search(store, q, k=k, nprobe=nprobe)}
+            ann_ms.append((time.perf_counter() - t) * 1000)
+            recalls.append(len(got & truth) / max(1, len(truth)))
+        rows.append({
+            "nprobe": nprobe,
+            f"recall@{k}": float(np.mean(recalls)),
+            "ann_p50_ms": float(np.percentile(ann_ms, 50)),
+            "ann_p95_ms": float(np.percentile(ann_ms, 95)),
+            "exact_p50_ms": float(np.percentile(exact_ms, 50)),
+            "exact_p95_ms": float(np.percentile(exact_ms, 95)),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    # Usage: python ann_index.py [chat_index_dir]
+    import sys
+
+    from vector_store import VectorStore
+
+    logging.basicConfig(level=logging.INFO)
+    base = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "../../.claude/chat_index"
+    )
+    vstore = VectorStore(os.path.join(base, "vectors"))
+    ann = IVFPQIndex(os.path.join(base, "ann"))
+    if ann.needs_rebuild(len(vstore)):
+        ann.build(vstore)
+    print(f"{len(vstore)} vectors, {ann.stats()}")
+    for row in benchmark(vstore, ann):
+        print("  ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                        for key, value in row.items()))
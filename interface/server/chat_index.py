@@ -0,0 +1,708 @@
+"""
+Chat Search Index - Persistent hybrid (BM25 + embedding) index over chat history.
+
+Replaces the manually-refreshed searcher behind /api/chat/search with an index
+that ChatManager.save_chat keeps current:
+
+- Keyword layer: SQLite FTS5 table (on-disk inverted index, ranked with bm25())
+- Semantic layer: per-message embeddings in a memory-mapped, quantized
+  VectorStore (vector_store.py), scored with a chunked matrix product and
+  prefiltered by date via its sorted timestamp array. Once the store is
+  large, undated queries go through an IVF-PQ ANN index (ann_index.py)
+  that is updated incrementally and retrained in the background
+- Fusion: reciprocal-rank fusion (RRF) of both rankings into one response
+
+Updates are incremental. Each indexed message stores a content hash, so
+re-saving a chat only tokenizes and embeds messages that are new or changed;
+messages that disappeared (edit/regenerate truncation) are removed. A
+message's has_vector flag is set only once its vector is persisted, so
+messages whose embedding failed (model unavailable, crash between the
+SQLite commit and the vector write) are backfilled by refresh().
+
+Writes are queued and applied by a single background thread, so save_chat
+never blocks on tokenizing or embedding. refresh() runs on its caller's
+thread; every write (the worker's and refresh's) holds one write lock
+from its read of the existing rows through embedding to its insert, and
+each SQLite write is rolled back if it fails.
+
+Data: .claude/chat_index/index.db (metadata + FTS), .claude/chat_index/vectors/
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from ann_index import IVFPQIndex
+from vector_store import VectorStore
+
+logger = logging.getLogger("chat_index")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+DEFAULT_CHATS_DIR = os.path.join(ROOT_DIR, ".claude", "chats")
+
+RRF_K = 60                 # Standard RRF damping constant
+CANDIDATE_MULTIPLIER = 3   # Each layer contributes limit * N candidates to fusion
+PREVIEW_CHARS = 200
+SEARCHABLE_ROLES = ("user", "assistant")
+VECTOR_DTYPE = os.environ.get("CHAT_INDEX_VECTOR_DTYPE", "int8")  # int8 or float16
+ANN_MIN_VECTORS = 20000    # Below this, an exact scan is faster than probing the ANN index
+BACKFILL_BATCH = 256       # Messages embedded per backfill step
+
+
+@dataclass
+class ChatSearchFilters:
+    """Filters applied to both keyword and semantic candidates."""
+    exclude_system: bool = True
+    roles: Optional[List[str]] = None
+    date_from: Optional[float] = None
+    date_to: Optional[float] = None
+
+
+@dataclass
+class ChatSearchHit:
+    """A single fused search result."""
+    message_id: str
+    chat_id: str
+    chat_title: str
+    role: str
+    content_preview: str
+    timestamp: float
+    score: float
+    match_type: str  # keyword, semantic, both
+
+
+@dataclass
+class ChatMessageMeta:
+    """Metadata for one indexed message (used by search_conversation_history)."""
+    chat_id: str
+    chat_title: str
+    message_index: int
+    role: str
+    timestamp: float
+    content_preview: str
+
+
+# ── Text extraction ───────────────────────────────────────────────────────────
+
+def strip_tool_markers(content: str) -> str:
+    """Remove inline tool status markers (*Running: `x`...*, *Result:* ...) from text."""
+    content = re.sub(r'\n*\*Running:\s*`[^`]+`\.\.\.?\*\n*', '', content)
+    content = re.sub(r'\*Result:\*\s*```[\s\S]*?```\s*', '', content)
+    content = re.sub(r'\*Result:\*[^\n]*\n?', '', content)
+    content = re.sub(r'\n{3,}', '\n\n', content)
+    return content.strip()
+
+
+def message_text(msg: Dict[str, Any]) -> str:
+    """Extract searchable plain text from a stored chat message ('' if not searchable)."""
+    if msg.get("role") not in SEARCHABLE_ROLES or msg.get("hidden", False):
+        return ""
+    content = msg.get("content", "")
+    if isinstance(content, list):
+        parts = []
+        for block in content:
+            if isinstance(block, dict) and block.get("type") == "text":
+                parts.append(block.get("text", ""))
+            elif isinstance(block, str):
+                parts.append(block)
+        content = "\n".join(parts)
+    if not isinstance(content, str):
+        return ""
+    return strip_tool_markers(content)
+
+
+def message_timestamp(msg: Dict[str, Any], fallback: float) -> float:
+    """Best-effort timestamp for a message (created_at, timestamp, or ms-epoch ID)."""
+    for key in ("created_at", "timestamp"):
+        value = msg.get(key)
+        if isinstance(value, (int, float)) and value > 0:
+            return float(value)
+    msg_id = msg.get("id", "")
+    if isinstance(msg_id, str) and msg_id.isdigit() and len(msg_id) >= 13:
+        return int(msg_id) / 1000.0
+    return fallback
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _fts_query(query: str) -> str:
+    """Turn free text into a safe FTS5 OR-query of quoted tokens."""
+    tokens = re.findall(r"\w+", query.lower())
+    return " OR ".join(f'"{t}"' for t in dict.fromkeys(tokens))
+
+
+# ── Index ─────────────────────────────────────────────────────────────────────
+
+class ChatSearchIndex:
+    """
+    Hybrid keyword + semantic index over all saved chats.
+
+    Thread-safe: a single SQLite connection is guarded by a lock, and
+    writes (queued ones on the background worker, refresh() on its caller)
+    are serialized by a write lock.
+    """
+
+    def __init__(self, chats_dir: str, index_dir: Optional[str] = None):
+        self.chats_dir = chats_dir
+        self.index_dir = index_dir or os.path.join(os.path.dirname(chats_dir), "chat_index")
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.db_path = os.path.join(self.index_dir, "index.db")
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()   # One writer at a time, read-embed-insert included
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+        # Embeddings live outside SQLite in a memory-mapped store keyed by message row ID
+        self._store = VectorStore(os.path.join(self.index_dir, "vectors"), dtype=VECTOR_DTYPE)
+        self._migrate_embeddings_table()
+        self._migrate_has_vector()
+        self._ann = IVFPQIndex(os.path.join(self.index_dir, "ann"))
+        self._ann_building = False
+
+        # Bumped on every content change; lets callers key result caches on it
+        self.version = 0
+
+        # Pending writes: chat_id -> snapshot dict (or None for delete)
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def _init_schema(self):
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chats (
+                    chat_id   TEXT PRIMARY KEY,
+                    title     TEXT,
+                    is_system INTEGER DEFAULT 0,
+                    mtime     REAL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id       TEXT NOT NULL,
+                    message_index INTEGER NOT NULL,
+                    message_id    TEXT,
+                    role          TEXT,
+                    timestamp     REAL,
+                    content_hash  TEXT,
+                    preview       TEXT,
+                    UNIQUE(chat_id, message_index)
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    content, tokenize='porter unicode61'
+                );
+            """)
+            self._conn.commit()
+
+    def _migrate_embeddings_table(self):
+        """Move vectors from the old in-SQLite embeddings table into the vector store."""
+        with self._lock:
+            has_table = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embeddings'"
+            ).fetchone()
+            if not has_table:
+                return
+            try:
+                import numpy as np
+                rows = self._conn.execute(
+                    "SELECT e.id, e.vector, m.timestamp FROM embeddings e "
+                    "JOIN messages m ON m.id = e.id ORDER BY e.id"
+                ).fetchall()
+                if rows:
+                    self._store.add(
+                        [r[0] for r in rows],
+                        np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in rows]),
+                        [r[2] or 0.0 for r in rows],
+                    )
+                logger.info(f"Chat index: migrated {len(rows)} embeddings to vector store")
+            except ImportError:
+                logger.warning("Chat index: numpy unavailable, dropping legacy embeddings table")
+            self._conn.execute("DROP TABLE embeddings")
+            self._conn.commit()
+
+    def _migrate_has_vector(self):
+        """Add the has_vector column, marking rows whose vector is already stored."""
+        with self._lock:
+            columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(messages)")}
+            if "has_vector" in columns:
+                return
+            self._conn.execute("ALTER TABLE messages ADD COLUMN has_vector INTEGER DEFAULT 0")
+            for ids, _ in self._store.iter_chunks():
+                self._conn.executemany(
+                    "UPDATE messages SET has_vector = 1 WHERE id = ?", [(int(i),) for i in ids]
+                )
+            self._conn.commit()
+
+    # ── Write path ────────────────────────────────────────────────────────────
+
+    @contextmanager
+    def _transaction(self):
+        """The connection under the lock; commits on success, rolls back on error."""
+        with self._lock:
+            try:
+                yield self._conn
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def enqueue_update(self, chat_id: str, data: Dict[str, Any]):
+        """Queue a chat for incremental re-indexing (non-blocking)."""
+        snapshot = {
+            "title": data.get("title", "Untitled Chat"),
+            "is_system": bool(data.get("is_system", False)),
+            "last_message_at": data.get("last_message_at") or time.time(),
+            "messages": list(data.get("messages", [])),
+        }
+        with self._pending_lock:
+            self._pending[chat_id] = snapshot
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def enqueue_delete(self, chat_id: str):
+        """Queue a chat for removal from the index (non-blocking)."""
+        with self._pending_lock:
+            self._pending[chat_id] = None
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._worker_loop, name="chat-index-writer", daemon=True
+            )
+            self._worker.start()
+
+    def _worker_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                with self._pending_lock:
+                    if not self._pending:
+                        break
+                    chat_id, snapshot = self._pending.popitem()
+                try:
+                    if snapshot is None:
+                        self.remove_chat(chat_id)
+                    else:
+                        self.update_chat(chat_id, snapshot)
+                except Exception as e:
+                    logger.warning(f"Chat index update failed for {chat_id}: {e}")
+            self._maybe_rebuild_ann()
+
+    def _maybe_rebuild_ann(self):
+        """Retrain the ANN index in the background once it is needed and stale."""
+        if self._ann_building or len(self._store) < ANN_MIN_VECTORS:
+            return
+        if not self._ann.needs_rebuild(len(self._store)):
+            return
+        self._ann_building = True
+
+        def _build():
+            try:
+                self._ann.build(self._store)
+            except Exception as e:
+                logger.warning(f"Chat index ANN build failed: {e}")
+            finally:
+                self._ann_building = False
+
+        threading.Thread(target=_build, name="chat-index-ann-build", daemon=True).start()
+
+    def update_chat(self, chat_id: str, data: Dict[str, Any]) -> int:
+        """
+        Incrementally index one chat. Returns the number of (re)indexed messages.
+
+        Only messages whose content hash changed are re-tokenized and re-embedded.
+        """
+        with self._write_lock:
+            return self._update_chat(chat_id, data)
+
+    def _update_chat(self, chat_id: str, data: Dict[str, Any]) -> int:
+        fallback_ts = float(data.get("last_message_at") or time.time())
+        wanted: Dict[int, Tuple[Dict[str, Any], str, str]] = {}
+        for i, msg in enumerate(data.get("messages", [])):
+            text = message_text(msg)
+            if text:
+                wanted[i] = (msg, text, _hash_text(text))
+
+        with self._lock:
+            existing = {
+                row["message_index"]: (row["id"], row["content_hash"])
+                for row in self._conn.execute(
+                    "SELECT id, message_index, content_hash FROM messages WHERE chat_id = ?",
+                    (chat_id,),
+                )
+            }
+
+        changed = [i for i, (_, _, h) in wanted.items() if existing.get(i, (None, None))[1] != h]
+        stale_ids = [row_id for i, (row_id, _) in existing.items() if i not in wanted]
+
+        vectors = None
+        if changed:
+            vectors = self._embed([wanted[i][1] for i in changed])
+
+        try:
+            mtime = os.path.getmtime(os.path.join(self.chats_dir, f"{chat_id}.json"))
+        except OSError:
+            mtime = fallback_ts
+
+        new_vectors: List[Tuple[int, int, float]] = []  # (row_id, vector index, timestamp)
+        replaced_ids = []
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO chats (chat_id, title, is_system, mtime) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET title = excluded.title, "
+                "is_system = excluded.is_system, mtime = excluded.mtime",
+                (chat_id, data.get("title", "Untitled Chat"), int(bool(data.get("is_system"))), mtime),
+            )
+            for row_id in stale_ids:
+                self._delete_row(row_id)
+            for n, i in enumerate(changed):
+                msg, text, content_hash = wanted[i]
+                old = existing.get(i)
+                if old:
+                    self._delete_row(old[0])
+                    replaced_ids.append(old[0])
+                ts = message_timestamp(msg, fallback_ts)
+                cur = conn.execute(
+                    "INSERT INTO messages (chat_id, message_index, message_id, role, timestamp, "
+                    "content_hash, preview, has_vector) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                    (
+                        chat_id, i, str(msg.get("id", "")), msg.get("role", ""),
+                        ts, content_hash, text[:PREVIEW_CHARS],
+                    ),
+                )
+                row_id = cur.lastrowid
+                conn.execute("INSERT INTO messages_fts (rowid, content) VALUES (?, ?)", (row_id, text))
+                new_vectors.append((row_id, n, ts))
+
+        self._store.delete(stale_ids + replaced_ids)
+        self._ann.remove(stale_ids + replaced_ids)
+        if vectors is not None and new_vectors:
+            new_ids = [row_id for row_id, _, _ in new_vectors]
+            new_matrix = vectors[[n for _, n, _ in new_vectors]]
+            self._store_vectors(new_ids, new_matrix, [ts for _, _, ts in new_vectors])
+
+        if changed or stale_ids:
+            self.version += 1
+            logger.debug(f"Chat index: {chat_id} +{len(changed)} -{len(stale_ids)} messages")
+        return len(changed)
+
+    def _store_vectors(self, ids: List[int], matrix, timestamps: List[float]):
+        """Persist vectors, then mark their rows as embedded."""
+        self._store.add(ids, matrix, timestamps)
+        self._ann.add(ids, matrix)
+        with self._transaction() as conn:
+            conn.executemany("UPDATE messages SET has_vector = 1 WHERE id = ?", [(i,) for i in ids])
+
+    def backfill_vectors(self) -> int:
+        """Embed indexed messages that have no stored vector yet. Returns the number embedded."""
+        with self._write_lock:
+            return self._backfill_vectors()
+
+    def _backfill_vectors(self) -> int:
+        done = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT m.id, m.timestamp, f.content FROM messages m "
+                    "JOIN messages_fts f ON f.rowid = m.id "
+                    "WHERE m.has_vector = 0 ORDER BY m.id LIMIT ?",
+                    (BACKFILL_BATCH,),
+                ).fetchall()
+            if not rows:
+                break
+            vectors = self._embed([r["content"] for r in rows])
+            if vectors is None:
+                break  # Still unavailable; the next refresh retries
+            self._store_vectors([r["id"] for r in rows], vectors, [r["timestamp"] or 0.0 for r in rows])
+            done += len(rows)
+        if done:
+            self.version += 1
+            logger.info(f"Chat index: backfilled {done} message embeddings")
+        return done
+
+    def _delete_row(self, row_id: int):
+        """Delete one message row from the SQLite tables. Caller holds the lock."""
+        self._conn.execute("DELETE FROM messages WHERE id = ?", (row_id,))
+        self._conn.execute("DELETE FROM messages_fts WHERE rowid = ?", (row_id,))
+
+    def remove_chat(self, chat_id: str):
+        """Remove a chat and all of its messages from the index."""
+        with self._write_lock:
+            with self._transaction() as conn:
+                ids = [r["id"] for r in conn.execute(
+                    "SELECT id FROM messages WHERE chat_id = ?", (chat_id,)
+                )]
+                for row_id in ids:
+                    self._delete_row(row_id)
+                conn.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+            self._store.delete(ids)
+            self._ann.remove(ids)
+            self.version += 1
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Reconcile the index with the chats directory.
+
+        Re-indexes chats whose file mtime changed since they were indexed
+        (e.g. written by another process) and drops chats whose file is gone.
+        """
+        with self._lock:
+            indexed = {
+                row["chat_id"]: row["mtime"]
+                for row in self._conn.execute("SELECT chat_id, mtime FROM chats")
+            }
+
+        seen = set()
+        updated = 0
+        for path in glob.glob(os.path.join(self.chats_dir, "*.json")):
+            chat_id = os.path.splitext(os.path.basename(path))[0]
+            seen.add(chat_id)
+            try:
+                if indexed.get(chat_id) == os.path.getmtime(path):
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.update_chat(chat_id, data)
+                updated += 1
+            except Exception as e:
+                logger.warning(f"Chat index refresh skipped {chat_id}: {e}")
+
+        removed = 0
+        for chat_id in set(indexed) - seen:
+            self.remove_chat(chat_id)
+            removed += 1
+
+        backfilled = self.backfill_vectors()
+        logger.info(f"Chat index refresh: {updated} chats updated, {removed} removed, {backfilled} embeddings backfilled")
+        self._maybe_rebuild_ann()
+        return {"updated": updated, "removed": removed, "backfilled": backfilled}
+
+    # ── Read path ─────────────────────────────────────────────────────────────
+
+    def message_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def embedded_count(self) -> int:
+        return len(self._store)
+
+    def _embed(self, texts: List[str], is_query: bool = False):
+        try:
+            from embedding_queue import get_embedding_queue
+            # Queries are interactive and jump ahead of background indexing
+            return get_embedding_queue().encode(texts, is_query=is_query, background=not is_query)
+        except Exception as e:
+            logger.debug(f"Embedding unavailable: {e}")
+            return None
+
+    def _filter_sql(self, filters: ChatSearchFilters) -> Tuple[str, list]:
+        clauses, params = [], []
+        if filters.exclude_system:
+            clauses.append("c.is_system = 0")
+        if filters.roles:
+            clauses.append(f"m.role IN ({','.join('?' * len(filters.roles))})")
+            params.extend(filters.roles)
+        if filters.date_from is not None:
+            clauses.append("m.timestamp >= ?")
+            params.append(filters.date_from)
+        if filters.date_to is not None:
+            clauses.append("m.timestamp <= ?")
+            params.append(filters.date_to)
+        return (" AND " + " AND ".join(clauses)) if clauses else "", params
+
+    def keyword_search(self, query: str, filters: ChatSearchFilters, limit: int) -> List[int]:
+        """BM25-ranked message row IDs matching the query."""
+        match = _fts_query(query)
+        if not match:
+            return []
+        where, params = self._filter_sql(filters)
+        sql = (
+            "SELECT m.id FROM messages_fts f "
+            "JOIN messages m ON m.id = f.rowid "
+            "JOIN chats c ON c.chat_id = m.chat_id "
+            f"WHERE messages_fts MATCH ?{where} "
+            "ORDER BY bm25(messages_fts) LIMIT ?"
+        )
+        with self._lock:
+            return [r[0] for r in self._conn.execute(sql, [match, *params, limit])]
+
+    def semantic_search(self, query: str, filters: ChatSearchFilters, limit: int) -> List[Tuple[int, float]]:
+        """Cosine-ranked (row_id, score) pairs for the query."""
+        query_vec = self._embed([query], is_query=True)
+        if query_vec is None or len(query_vec) == 0:
+            return []
+
+        date_range = None
+        if filters.date_from is not None or filters.date_to is not None:
+            date_range = (filters.date_from, filters.date_to)
+        # Over-fetch so that role/system filtering still leaves enough candidates.
+        # Date-filtered queries stay exact: the timestamp prefilter already bounds the scan.
+        if date_range is None and self._use_ann():
+            candidates = self._ann.search(self._store, query_vec[0], k=limit * 4)
+        else:
+            candidates = self._store.search(query_vec[0], k=limit * 4, date_range=date_range)
+
+        allowed = set(self._rows_matching(
+            [row_id for row_id, _ in candidates], filters
+        ))
+        return [(row_id, s) for row_id, s in candidates if row_id in allowed][:limit]
+
+    def _use_ann(self) -> bool:
+        return (
+            not self._ann_building
+            and self._ann.is_trained
+            and len(self._store) >= ANN_MIN_VECTORS
+        )
+
+    def _rows_matching(self, row_ids: List[int], filters: ChatSearchFilters) -> List[int]:
+        if not row_ids:
+            return []
+        where, params = self._filter_sql(filters)
+        sql = (
+            "SELECT m.id FROM messages m JOIN chats c ON c.chat_id = m.chat_id "
+            f"WHERE m.id IN ({','.join('?' * len(row_ids))}){where}"
+        )
+        with self._lock:
+            return [r[0] for r in self._conn.execute(sql, [*row_ids, *params])]
+
+    def _hydrate(self, row_ids: List[int]) -> Dict[int, sqlite3.Row]:
+        if not row_ids:
+            return {}
+        sql = (
+            "SELECT m.id, m.chat_id, m.message_id, m.role, m.timestamp, m.preview, c.title "
+            "FROM messages m JOIN chats c ON c.chat_id = m.chat_id "
+            f"WHERE m.id IN ({','.join('?' * len(row_ids))})"
+        )
+        with self._lock:
+            return {r["id"]: r for r in self._conn.execute(sql, row_ids)}
+
+    def search_messages(
+        self,
+        query: str,
+        k: int = 20,
+        date_range: Optional[Dict[str, float]] = None,
+        exclude_system: bool = False,
+    ) -> List[Tuple[ChatMessageMeta, float]]:
+        """
+        Semantic message search returning (ChatMessageMeta, score) pairs.
+
+        Used by search_conversation_history, which groups hits by conversation.
+        date_range is {"start": ts, "end": ts} with either key optional.
+        """
+        date_range = date_range or {}
+        filters = ChatSearchFilters(
+            exclude_system=exclude_system,
+            date_from=date_range.get("start"),
+            date_to=date_range.get("end"),
+        )
+        ranked = self.semantic_search(query, filters, k)
+        if not ranked:
+            # No embeddings available: fall back to BM25 ranking
+            ranked = [(row_id, 1.0 / (RRF_K + rank + 1))
+                      for rank, row_id in enumerate(self.keyword_search(query, filters, k))]
+
+        ids = [row_id for row_id, _ in ranked]
+        sql = (
+            "SELECT m.id, m.chat_id, m.message_index, m.role, m.timestamp, m.preview, c.title "
+            "FROM messages m JOIN chats c ON c.chat_id = m.chat_id "
+            f"WHERE m.id IN ({','.join('?' * len(ids))})"
+        )
+        with self._lock:
+            rows = {r["id"]: r for r in self._conn.execute(sql, ids)} if ids else {}
+
+        hits = []
+        for row_id, score in ranked:
+            row = rows.get(row_id)
+            if row is None:
+                continue
+            hits.append((ChatMessageMeta(
+                chat_id=row["chat_id"],
+                chat_title=row["title"] or "Untitled Chat",
+                message_index=row["message_index"],
+                role=row["role"] or "",
+                timestamp=row["timestamp"] or 0.0,
+                content_preview=row["preview"] or "",
+            ), score))
+        return hits
+
+    def search(
+        self,
+        query: str,
+        filters: Optional[ChatSearchFilters] = None,
+        limit: int = 20,
+        semantic_only: bool = False,
+    ) -> List[ChatSearchHit]:
+        """
+        Hybrid search: BM25 and embedding rankings merged with reciprocal-rank fusion.
+
+        Semantic ranking is skipped silently if the embedding model is unavailable.
+        """
+        filters = filters or ChatSearchFilters()
+        n_candidates = limit * CANDIDATE_MULTIPLIER
+
+        keyword_ids = [] if semantic_only else self.keyword_search(query, filters, n_candidates)
+        semantic = self.semantic_search(query, filters, n_candidates)
+        semantic_ids = [row_id for row_id, _ in semantic]
+
+        fused: Dict[int, float] = {}
+        for rank, row_id in enumerate(keyword_ids):
+            fused[row_id] = fused.get(row_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        for rank, row_id in enumerate(semantic_ids):
+            fused[row_id] = fused.get(row_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        ranked = sorted(fused.items(), key=lambda x: x[1], reverse=True)[:limit]
+        rows = self._hydrate([row_id for row_id, _ in ranked])
+        keyword_set, semantic_set = set(keyword_ids), set(semantic_ids)
+
+        hits = []
+        for row_id, score in ranked:
+            row = rows.get(row_id)
+            if row is None:
+                continue
+            in_kw, in_sem = row_id in keyword_set, row_id in semantic_set
+            hits.append(ChatSearchHit(
+                message_id=row["message_id"] or "",
+                chat_id=row["chat_id"],
+                chat_title=row["title"] or "Untitled Chat",
+                role=row["role"] or "",
+                content_preview=row["preview"] or "",
+                timestamp=row["timestamp"] or 0.0,
+                score=score,
+                match_type="both" if in_kw and in_sem else ("keyword" if in_kw else "semantic"),
+            ))
+        return hits
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_index: Optional[ChatSearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_chat_index(chats_dir: Optional[str] = None) -> ChatSearchIndex:
+    """Get or create the process-wide chat search index."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ChatSearchIndex(chats_dir or DEFAULT_CHATS_DIR)
+    return _index
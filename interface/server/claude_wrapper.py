@@ -262,15 +262,11 @@ class ClaudeWrapper:
     def _load_agent_working_memory(self, agent_name: str) -> str:
         """Load per-agent working memory and format as a prompt block."""
         try:
-            import sys
-            scripts_dir = Path(self.cwd) / ".claude" / "scripts"
-            if str(scripts_dir) not in sys.path:
-                sys.path.insert(0, str(scripts_dir))
-            from working_memory import get_store
-            store = get_store(agent_name=agent_name)
-            wm_block = store.format_prompt_block()
+            from working_memory_service import get_working_memory_service
+            service = get_working_memory_service()
+            wm_block = service.format_prompt_block(agent_name)
             if wm_block:
-                logger.info(f"Agent '{agent_name}': loaded working memory ({len(store.list_items())} items)")
+                logger.info(f"Agent '{agent_name}': loaded working memory ({len(service.list_items(agent_name))} items)")
                 return f"\n\n<working-memory>\n{wm_block}\n</working-memory>"
         except Exception as e:
             logger.debug(f"Agent '{agent_name}': could not load working memory: {e}")
@@ -296,6 +292,22 @@ class ClaudeWrapper:
             logger.warning(f"Skill menu generation failed for agent '{agent_config.name}': {e}")
             return ""
 
+    def _load_always_load_memories(self, agent_config, memories_path: Path) -> str:
+        """Packed always_load memory block, within the memory token budget (ALWAYS_LOAD_TOKEN_BUDGET)."""
+        try:
+            from memory_packer import get_packed_memories
+            packed = get_packed_memories(memories_path)
+        except Exception as e:
+            logger.warning(f"Agent '{agent_config.name}': could not read memories.json: {e}")
+            return ""
+        if packed.included:
+            dropped = f", dropped {len(packed.dropped)} over budget" if packed.dropped else ""
+            logger.info(
+                f"Agent '{agent_config.name}': loaded {len(packed.included)} always_load memories "
+                f"(~{packed.tokens}/{packed.budget} tokens{dropped})"
+            )
+        return packed.text
+
     def _build_system_prompt(self, agent_config, agent_list_block: str = "") -> str:
         """Build system prompt for a chattable agent (prompt.md + always_load memories).
 
@@ -312,23 +324,12 @@ class ClaudeWrapper:
         # Agent list sits above memory in the system prompt
         if agent_list_block:
             parts.append(agent_list_block)
-        # Per-agent always_load memories from memories.json
+        # Per-agent always_load memories from memories.json (token-budgeted)
         memories_path = Path(self.cwd) / ".claude" / "agents" / agent_config.name / "memories.json"
         if memories_path.exists():
-            try:
-                all_memories = json.loads(memories_path.read_text())
-                always_load = [m for m in all_memories if m.get("always_load")]
-                if always_load:
-                    lines = [f"- {m['content']}" for m in always_load]
-                    memory_block = "\n".join(lines)
-                    parts.append(
-                        "\n---\n\n"
-                        "Your persistent memory (notes you've saved across conversations):\n\n"
-                        f"{memory_block}"
-                    )
-                    logger.info(f"Agent '{agent_config.name}': loaded {len(always_load)} always_load memories")
-            except Exception as e:
-                logger.warning(f"Agent '{agent_config.name}': could not read memories.json: {e}")
+            memory_block = self._load_always_load_memories(agent_config, memories_path)
+            if memory_block:
+                parts.append(memory_block)
         else:
             # Fallback: legacy memory.md
             memory_path = Path(self.cwd) / ".claude" / "agents" / agent_config.name / "memory.md"
@@ -366,23 +367,12 @@ class ClaudeWrapper:
         # Agent list sits above memory in the system prompt
         if agent_list_block:
             append_parts.append(agent_list_block)
-        # Per-agent always_load memories from memories.json
+        # Per-agent always_load memories from memories.json (token-budgeted)
         memories_path = Path(self.cwd) / ".claude" / "agents" / agent_config.name / "memories.json"
         if memories_path.exists():
-            try:
-                all_memories = json.loads(memories_path.read_text())
-                always_load = [m for m in all_memories if m.get("always_load")]
-                if always_load:
-                    lines = [f"- {m['content']}" for m in always_load]
-                    memory_block = "\n".join(lines)
-                    append_parts.append(
-                        "\n---\n\n"
-                        "Your persistent memory (notes you've saved across conversations):\n\n"
-                        f"{memory_block}"
-                    )
-                    logger.info(f"Agent '{agent_config.name}': loaded {len(always_load)} always_load memories for preset append")
-            except Exception as e:
-                logger.warning(f"Agent '{agent_config.name}': could not read memories.json: {e}")
+            memory_block = self._load_always_load_memories(agent_config, memories_path)
+            if memory_block:
+                append_parts.append(memory_block)
         else:
             # Fallback: legacy memory.md
             memory_path = Path(self.cwd) / ".claude" / "agents" / agent_config.name / "memory.md"
@@ -563,11 +553,29 @@ class ClaudeWrapper:
                 raw_query = str(prompt)
             raw_query = raw_query[-1000:]
 
-            retrieval_queries = await rewrite_query_for_retrieval(raw_query, self._conversation_history)
-            ctx_block = auto_retrieve_context(
-                query=retrieval_queries,
-                agent_name=agent_config.name,
+            # Per-chat cache: short continuations reuse the previous rewrite,
+            # and near-identical rewritten queries reuse the previous block
+            from retrieval_cache import get_retrieval_cache
+            retrieval_cache = get_retrieval_cache()
+            cache_key = self.chat_id or self.session_id
+            retrieval_queries = retrieval_cache.previous_queries(cache_key, agent_config.name, raw_query)
+            if retrieval_queries is None:
+                retrieval_queries = await rewrite_query_for_retrieval(raw_query, self._conversation_history)
+            cached = await asyncio.to_thread(
+                retrieval_cache.lookup, cache_key, agent_config.name, retrieval_queries
             )
+            if cached.hit:
+                ctx_block = cached.block
+                logger.info(
+                    f"Agent '{agent_config.name}': contextual memory cache hit "
+                    f"(similarity={cached.similarity:.3f})"
+                )
+            else:
+                ctx_block = auto_retrieve_context(
+                    query=retrieval_queries,
+                    agent_name=agent_config.name,
+                )
+                retrieval_cache.store(cache_key, agent_config.name, cached, ctx_block)
             if ctx_block:
                 if isinstance(options.system_prompt, dict):
                     existing = options.system_prompt.get("append", "")
@@ -682,6 +690,23 @@ class ClaudeWrapper:
                     cache_read = usage.get("cache_read_input_tokens", 0)
                     cache_creation = usage.get("cache_creation_input_tokens", 0)
 
+                    try:
+                        from usage_store import get_usage_store
+                        get_usage_store().record_run(
+                            kind="chat",
+                            agent=agent_config.name,
+                            model=agent_config.model,
+                            chat_id=self.chat_id or session_id,
+                            input_tokens=input_tokens + cache_creation,
+                            output_tokens=output_tokens,
+                            cache_read_tokens=cache_read,
+                            cost_usd=message.total_cost_usd or 0,
+                            duration_ms=message.duration_ms or 0,
+                            is_error=bool(message.is_error),
+                        )
+                    except Exception as e:
+                        logger.debug(f"Usage recording failed: {e}")
+
                     yield {
                         "type": "result_meta",
                         "session_id": session_id,
@@ -796,6 +821,13 @@ class ChatManager:
         except Exception as e:
             logger.debug(f"Failed to update room metadata: {e}")
 
+        # Queue incremental search indexing (only new/changed messages are re-indexed)
+        try:
+            from chat_index import get_chat_index
+            get_chat_index(self.chats_dir).enqueue_update(session_id, data)
+        except Exception as e:
+            logger.debug(f"Failed to queue chat for search indexing: {e}")
+
     def delete_chat(self, session_id: str) -> bool:
         """Delete a chat from disk and its room metadata."""
         path = self.get_chat_path(session_id)
@@ -815,6 +847,12 @@ class ChatManager:
             except Exception as e:
                 logger.debug(f"Failed to delete room metadata: {e}")
 
+            try:
+                from chat_index import get_chat_index
+                get_chat_index(self.chats_dir).enqueue_delete(session_id)
+            except Exception as e:
+                logger.debug(f"Failed to queue chat for search index removal: {e}")
+
             return True
         return False
 
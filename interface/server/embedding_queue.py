@@ -0,0 +1,290 @@
+"""
+Embedding Queue - Batched background embedding jobs with a persistent cache.
+
+All chat and memory indexing goes through one job queue drained by a single
+worker thread, instead of each caller encoding inline:
+
+- Jobs are split into batch-sized chunks and coalesced across callers, so
+  the model always sees full batches
+- Two priority classes: interactive (search queries) jump ahead of
+  background indexing, so a search never waits behind a large backlog
+- Identical texts are deduplicated by hash within a batch and against a
+  persisted text-hash → vector cache, so re-indexing unchanged text is free
+- stats() reports queue depth, cache/dedupe hits and throughput
+
+The model itself runs in this process (torch releases the GIL while
+encoding); the worker thread keeps encoding off request handlers.
+
+Data: .claude/embedding_cache/cache.db
+"""
+
+import hashlib
+import itertools
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("embedding_queue")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+DEFAULT_CACHE_DIR = os.path.join(ROOT_DIR, ".claude", "embedding_cache")
+
+MAX_BATCH = 64                # Texts per model call
+LINGER_SECONDS = 0.01         # Wait this long for more work to fill a batch
+MAX_CACHE_ROWS = 500_000      # Oldest cache rows are pruned beyond this
+THROUGHPUT_WINDOW = 60.0      # Seconds of history for texts/sec
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+
+def _text_hash(text: str, is_query: bool) -> str:
+    prefix = "q:" if is_query else "d:"
+    return hashlib.sha1((prefix + text).encode("utf-8", "replace")).hexdigest()
+
+
+class _Job:
+    """One submit() call: results are filled in chunk by chunk."""
+
+    def __init__(self, count: int):
+        self.future: Future = Future()
+        self.results: List[Any] = [None] * count
+        self.remaining = count
+        self.lock = threading.Lock()
+
+    def fill(self, index: int, vector):
+        with self.lock:
+            self.results[index] = vector
+            self.remaining -= 1
+            done = self.remaining == 0
+        if done and not self.future.done():
+            import numpy as np
+            self.future.set_result(np.stack(self.results).astype(np.float32))
+
+    def fail(self, error: Exception):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class EmbeddingCache:
+    """Persistent text-hash → float16 vector cache (SQLite)."""
+
+    def __init__(self, cache_dir: Optional[str] = None, model: str = ""):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.model = model
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.cache_dir, "cache.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS vectors (
+                model     TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector    BLOB NOT NULL,
+                created   REAL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.commit()
+        self._inserts = 0
+
+    def get_many(self, hashes: List[str]) -> Dict[str, Any]:
+        import numpy as np
+
+        found: Dict[str, Any] = {}
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM vectors WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [self.model, *chunk],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        return found
+
+    def put_many(self, items: Dict[str, Any]):
+        import numpy as np
+
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (model, text_hash, vector, created) VALUES (?, ?, ?, ?)",
+                [(self.model, h, np.asarray(v, dtype=np.float16).tobytes(), now) for h, v in items.items()],
+            )
+            self._conn.commit()
+            self._inserts += len(items)
+            if self._inserts >= 10_000:
+                self._inserts = 0
+                self._prune_locked()
+
+    def _prune_locked(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        if count > MAX_CACHE_ROWS:
+            self._conn.execute(
+                "DELETE FROM vectors WHERE rowid IN "
+                "(SELECT rowid FROM vectors ORDER BY created LIMIT ?)",
+                (count - MAX_CACHE_ROWS,),
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+class EmbeddingQueue:
+    """Priority job queue drained by one batching worker thread."""
+
+    def __init__(self, cache: Optional[EmbeddingCache] = None):
+        if cache is None:
+            import embedding_service
+            cache = EmbeddingCache(model=embedding_service.EMBEDDING_MODEL)
+        self._cache = cache
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._depth = 0  # texts waiting
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "encoded": 0, "cache_hits": 0, "deduped": 0, "batches": 0}
+        self._recent: List[tuple] = []  # (finished_at, texts_encoded)
+
+    # ── Submit ────────────────────────────────────────────────────────────────
+
+    def submit(self, texts: List[str], is_query: bool = False, background: bool = True) -> Future:
+        """Queue texts for encoding. The future resolves to a float32 (n, dim) array, or None."""
+        job = _Job(len(texts))
+        if not texts:
+            job.future.set_result(None)
+            return job.future
+        priority = PRIORITY_BACKGROUND if background else PRIORITY_INTERACTIVE
+        with self._stats_lock:
+            self._stats["submitted"] += len(texts)
+            self._depth += len(texts)
+        for start in range(0, len(texts), MAX_BATCH):
+            chunk = [(job, i, texts[i]) for i in range(start, min(start + MAX_BATCH, len(texts)))]
+            self._queue.put((priority, next(self._seq), is_query, chunk))
+        self._ensure_worker()
+        return job.future
+
+    def encode(self, texts: List[str], is_query: bool = False, background: bool = True,
+               timeout: Optional[float] = None):
+        """Blocking submit(); returns the (n, dim) array or None if the model is unavailable."""
+        return self.submit(texts, is_query=is_query, background=background).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._worker_loop, name="embedding-worker", daemon=True)
+                self._worker.start()
+
+    # ── Worker ────────────────────────────────────────────────────────────────
+
+    def _next_batch(self):
+        """Block for one chunk, then coalesce queued chunks of the same kind up to MAX_BATCH."""
+        priority, _, is_query, items = self._queue.get()
+        deferred = []
+        deadline = time.monotonic() + LINGER_SECONDS
+        while len(items) < MAX_BATCH:
+            try:
+                entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if entry[2] != is_query or entry[0] != priority or len(items) + len(entry[3]) > MAX_BATCH:
+                deferred.append(entry)
+                break
+            items = items + entry[3]
+        for entry in deferred:
+            self._queue.put(entry)
+        return is_query, items
+
+    def _worker_loop(self):
+        while True:
+            is_query, items = self._next_batch()
+            try:
+                self._process(is_query, items)
+            except Exception as e:
+                logger.warning(f"Embedding batch failed ({len(items)} texts): {e}")
+                for job, _, _ in items:
+                    job.fail(e)
+            finally:
+                with self._stats_lock:
+                    self._depth -= len(items)
+
+    def _process(self, is_query: bool, items: List[tuple]):
+        import embedding_service
+
+        hashes = [_text_hash(text, is_query) for _, _, text in items]
+        unique: Dict[str, str] = {}
+        for h, (_, _, text) in zip(hashes, items):
+            unique.setdefault(h, text)
+
+        vectors = self._cache.get_many(list(unique))
+        misses = [h for h in unique if h not in vectors]
+        encoded = 0
+        if misses:
+            matrix = embedding_service.encode([unique[h] for h in misses], is_query=is_query)
+            if matrix is None:
+                # Model unavailable: every job in this batch resolves to None
+                for job, _, _ in items:
+                    if not job.future.done():
+                        job.future.set_result(None)
+                return
+            fresh = {h: matrix[i] for i, h in enumerate(misses)}
+            self._cache.put_many(fresh)
+            vectors.update(fresh)
+            encoded = len(misses)
+
+        for h, (job, index, _) in zip(hashes, items):
+            job.fill(index, vectors[h])
+
+        now = time.time()
+        with self._stats_lock:
+            self._stats["encoded"] += encoded
+            self._stats["cache_hits"] += len(unique) - encoded
+            self._stats["deduped"] += len(items) - len(unique)
+            self._stats["batches"] += 1
+            self._recent.append((now, len(items)))
+            cutoff = now - THROUGHPUT_WINDOW
+            while self._recent and self._recent[0][0] < cutoff:
+                self._recent.pop(0)
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._depth
+            window = sum(n for _, n in self._recent)
+            stats["texts_per_sec"] = round(window / THROUGHPUT_WINDOW, 2)
+        stats["avg_batch"] = round(
+            (stats["encoded"] + stats["cache_hits"] + stats["deduped"]) / stats["batches"], 1
+        ) if stats["batches"] else 0.0
+        stats["cache_rows"] = len(self._cache)
+        return stats
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_queue: Optional[EmbeddingQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_embedding_queue() -> EmbeddingQueue:
+    """Get or create the process-wide embedding queue."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = EmbeddingQueue()
+    return _queue
@@ -0,0 +1,89 @@
+"""
+Embedding Service - Shared text encoder for chat and memory search.
+
+Wraps a sentence-transformers model behind a small API so every index in the
+server process shares one loaded model instead of each loading its own copy.
+
+The model is loaded lazily on first use. If the ML dependencies are missing,
+`is_available()` returns False and callers fall back to keyword-only search.
+
+Model name is configurable via the EMBEDDING_MODEL env var.
+"""
+
+import logging
+import os
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger("embedding_service")
+
+DEFAULT_MODEL = "Qwen/Qwen3-Embedding-0.6B"
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", DEFAULT_MODEL)
+ENCODE_BATCH_SIZE = 32
+
+_model = None
+_model_failed = False
+_model_lock = threading.Lock()
+
+
+def _load_model():
+    """Load the embedding model once. Returns None if unavailable."""
+    global _model, _model_failed
+    if _model is not None or _model_failed:
+        return _model
+    with _model_lock:
+        if _model is not None or _model_failed:
+            return _model
+        try:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+            logger.info(f"Loaded embedding model {EMBEDDING_MODEL} (dim={_model.get_sentence_embedding_dimension()})")
+        except Exception as e:
+            logger.warning(f"Embedding model unavailable ({EMBEDDING_MODEL}): {e}")
+            _model_failed = True
+    return _model
+
+
+def is_available() -> bool:
+    """True if the embedding model can be (or has been) loaded."""
+    return _load_model() is not None
+
+
+def get_dimension() -> Optional[int]:
+    """Embedding dimension of the loaded model, or None if unavailable."""
+    model = _load_model()
+    if model is None:
+        return None
+    return int(model.get_sentence_embedding_dimension())
+
+
+def encode(texts: List[str], is_query: bool = False):
+    """
+    Encode texts into L2-normalized float32 vectors.
+
+    Args:
+        texts: Texts to encode
+        is_query: Use the model's query prompt (asymmetric retrieval models)
+
+    Returns:
+        numpy array of shape (len(texts), dim), or None if the model is unavailable
+    """
+    import numpy as np
+
+    model = _load_model()
+    if model is None:
+        return None
+    if not texts:
+        return np.zeros((0, get_dimension() or 0), dtype=np.float32)
+
+    kwargs = {
+        "batch_size": ENCODE_BATCH_SIZE,
+        "normalize_embeddings": True,
+        "convert_to_numpy": True,
+        "show_progress_bar": False,
+    }
+    if is_query and "query" in (getattr(model, "prompts", None) or {}):
+        kwargs["prompt_name"] = "query"
+
+    vectors = model.encode(texts, **kwargs)
+    return np.asarray(vectors, dtype=np.float32)
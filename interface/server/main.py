@@ -27,7 +27,7 @@ import hashlib
 from datetime import datetime
 from pathlib import Path
 from dataclasses import dataclass, field
-from typing import Optional, Dict, Any, List, Set, Tuple
+from typing import Optional, Dict, Any, List, Tuple
 from contextlib import asynccontextmanager
 from collections import defaultdict
 
@@ -35,7 +35,8 @@ from claude_wrapper import ClaudeWrapper, ChatManager, ConversationState
 from notifications import should_notify, send_notification, NotificationDecision
 from message_wal import init_wal, get_wal, MessageWAL
 from tool_serializers import serialize_tool_call, format_tool_for_history
-from process_registry import register_process, deregister_by_pid, clear_registry
+from process_registry import register_process, deregister_by_pid, clear_registry, serve as serve_process_registry
+from presence import get_presence
 
 
 # --- Client Session Tracking (for notifications) ---
@@ -1339,20 +1340,10 @@ def get_room_history(room_id: str):
 
 # --- Chat Search API ---
 
-# Initialize chat search (lazy loaded)
-_chat_searcher = None
-
 def get_chat_searcher():
-    """Get or create the chat searcher instance."""
-    global _chat_searcher
-    if _chat_searcher is None:
-        import sys
-        scripts_dir = os.path.join(ROOT_DIR, ".claude", "scripts")
-        if scripts_dir not in sys.path:
-            sys.path.insert(0, scripts_dir)
-        from chat_search.searcher import get_searcher
-        _chat_searcher = get_searcher()
-    return _chat_searcher
+    """Get the persistent hybrid chat search index (kept current by ChatManager.save_chat)."""
+    from chat_index import get_chat_index
+    return get_chat_index(CHATS_DIR)
 
 
 class ChatSearchResult(BaseModel):
@@ -1384,7 +1375,10 @@ def search_chats(
     limit: int = 20
 ):
     """
-    Search chat history with keyword and/or semantic search.
+    Search chat history with hybrid keyword (BM25) + semantic ranking.
+
+    Both rankings are fused with reciprocal-rank fusion and returned in a
+    single response, so semantic_pending is always False.
 
     Args:
         q: Search query
@@ -1392,33 +1386,26 @@ def search_chats(
         date_to: ISO date string for end filter
         roles: Comma-separated roles to filter (e.g., "user,assistant")
         exclude_system: Exclude system/scheduled chats
-        semantic_only: If True, only return semantic results (for progressive loading)
+        semantic_only: If True, skip the keyword layer (kept for older clients)
         limit: Maximum results to return
 
     Returns:
-        Search results with scores and match types
+        Search results with fused scores and match types
     """
     import time
     start_time = time.time()
 
-    searcher = get_chat_searcher()
-
-    # Build filters
-    from chat_search.searcher import SearchFilters
+    from chat_index import ChatSearchFilters
     from datetime import datetime as dt
 
-    filters = SearchFilters(
+    filters = ChatSearchFilters(
         exclude_system=exclude_system,
         roles=roles.split(",") if roles else None,
         date_from=dt.fromisoformat(date_from).timestamp() if date_from else None,
         date_to=dt.fromisoformat(date_to).timestamp() if date_to else None,
     )
 
-    # Perform search
-    if semantic_only:
-        results = searcher.semantic_search(q, filters, k=limit)
-    else:
-        results = searcher.keyword_search(q, filters, limit=limit)
+    results = get_chat_searcher().search(q, filters, limit=limit, semantic_only=semantic_only)
 
     query_time = (time.time() - start_time) * 1000
 
@@ -1437,17 +1424,95 @@ def search_chats(
             for r in results
         ],
         total_count=len(results),
-        semantic_pending=not semantic_only,  # Semantic still pending if this was keyword-only
+        semantic_pending=False,
         query_time_ms=query_time
     )
 
 
 @app.post("/api/chat/search/refresh")
 def refresh_search_index():
-    """Manually refresh the search index."""
-    searcher = get_chat_searcher()
-    searcher.refresh()
-    return {"status": "ok", "message": "Index refreshed"}
+    """Reconcile the search index with chat files changed outside save_chat."""
+    stats = get_chat_searcher().refresh()
+    return {"status": "ok", "message": "Index refreshed", **stats}
+
+
+@app.get("/api/embeddings/stats")
+def embedding_stats():
+    """Embedding queue depth, cache/dedupe hits and throughput."""
+    from embedding_queue import get_embedding_queue
+    return get_embedding_queue().stats()
+
+
+@app.get("/api/retrieval/stats")
+def retrieval_stats():
+    """Contextual memory retrieval cache hit rate and rewrite skips."""
+    from retrieval_cache import get_retrieval_cache
+    return get_retrieval_cache().stats()
+
+
+@app.get("/api/cache/stats")
+def result_cache_stats():
+    """Agent/LLM result cache hits, misses and saved run time and cost."""
+    from result_cache import get_result_cache
+    return get_result_cache().stats()
+
+
+@app.get("/api/scheduler/stats")
+def scheduler_stats():
+    """Scheduled task timer state, dispatch lateness and executor run history."""
+    from task_executor import get_task_executor
+    from task_scheduler import get_task_scheduler
+    return {**get_task_scheduler().stats(), "executor": get_task_executor().stats()}
+
+
+@app.get("/api/agents/scheduler")
+def agent_scheduler_state():
+    """Agent run capacity, running leases, the admission queue and process registry counters."""
+    from agent_scheduler import get_agent_scheduler
+    from process_registry import registry_stats
+    return {**get_agent_scheduler().snapshot(), "registry": registry_stats()}
+
+
+@app.get("/api/usage")
+def usage_rollup(
+    bucket: str = "hour",
+    hours: Optional[float] = None,
+    group_by: str = "agent",
+    agent: Optional[str] = None,
+    chat_id: Optional[str] = None,
+):
+    """
+    Tokens, cost and latency of chat turns and agent runs, plus per-process
+    CPU/RSS, rolled up by hour or day.
+
+    Args:
+        bucket: "hour" or "day"
+        hours: How far back to look (default: 48h for hourly, 30 days for daily)
+        group_by: "agent", "model", "chat" or "kind"
+        agent / chat_id: Optional filters
+    """
+    from usage_store import get_budget_guard, get_usage_store
+    since = time.time() - hours * 3600 if hours else None
+    try:
+        rollup = get_usage_store().query(bucket=bucket, since=since, group_by=group_by,
+                                         agent=agent, chat_id=chat_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**rollup, "budget": get_budget_guard().status()}
+
+
+@app.get("/api/notifications/bus/stats")
+def notification_bus_stats():
+    """Agent completion notifications published, batched and recovered."""
+    from notification_bus import get_notification_bus
+    return get_notification_bus().stats()
+
+
+@app.get("/api/notifications/dispatch/stats")
+def notification_dispatch_stats():
+    """Outbound notification emails sent, digested, retried and failed."""
+    from notification_dispatcher import get_notification_dispatcher
+    return get_notification_dispatcher().stats()
 
 
 
@@ -1565,16 +1630,18 @@ def cancel_chess_game():
 
 # --- WebSocket Chat ---
 
-# Track connected clients with their visibility state
-client_sessions: Dict[WebSocket, ClientSession] = {}
+# Track connected clients with their visibility state. The dict is owned by
+# the presence index, which keeps its viewer/subscriber indexes in sync.
+presence = get_presence()
+client_sessions: Dict[WebSocket, ClientSession] = presence.clients
 active_conversations: Dict[str, ConversationState] = {}
 # Track all currently processing sessions (supports concurrent chats)
 # Maps chat_id -> start_time for each active processing session
 active_processing_sessions: Dict[str, float] = {}
 
 # --- Session-Scoped Client Registry (for broadcast) ---
-# Track all WebSocket connections per session for multi-device sync
-session_clients: Dict[str, Set[WebSocket]] = defaultdict(set)
+# WebSocket connections per session (multi-device sync) live in the presence
+# index: presence.subscribe / presence.subscribers
 
 
 def _find_chat_with_message(msg_id: str) -> Optional[str]:
@@ -1628,7 +1695,7 @@ async def broadcast_to_session(session_id: str, message: dict):
     if not session_id:
         return
 
-    clients = session_clients.get(session_id)
+    clients = presence.subscribers(session_id)
     if not clients:
         return
 
@@ -1637,18 +1704,15 @@ async def broadcast_to_session(session_id: str, message: dict):
         message = {**message, "sessionId": session_id}
 
     dead = set()
-    for ws in list(clients):  # snapshot to avoid concurrent modification
+    for ws in clients:  # subscribers() is already a snapshot
         try:
             await ws.send_json(message)
         except Exception:
             dead.add(ws)
 
-    # Clean up dead connections
-    if dead:
-        session_clients[session_id] -= dead
-        # Also clean up from client_sessions
-        for ws in dead:
-            client_sessions.pop(ws, None)
+    # Clean up dead connections (subscriptions and client_sessions)
+    for ws in dead:
+        presence.disconnect(ws)
 
 
 async def broadcast_chat_created(chat_id: str, title: str, agent: str = None,
@@ -1672,15 +1736,7 @@ def register_client(ws: WebSocket, session_id: str):
     Called when client subscribes to a session. Removes from any
     previous session first (client can only view one chat at a time).
     """
-    # Remove from all other sessions
-    for sid, clients in list(session_clients.items()):
-        clients.discard(ws)
-        # Clean up empty sets
-        if not clients:
-            del session_clients[sid]
-
-    # Add to new session
-    session_clients[session_id].add(ws)
+    presence.subscribe(ws, session_id)
 
 # Track active ClaudeWrapper instances for interrupt capability
 active_claude_wrappers: Dict[str, ClaudeWrapper] = {}
@@ -1982,12 +2038,6 @@ def _build_history_context(messages: List[Dict[str, Any]], current_message: str,
     return f"[Previous conversation for context - continue naturally]\n{history}\n\n[Current message]\n{current_message}"
 
 
-# Serialize prompt-type scheduled tasks so only one ClaudeWrapper runs at a time.
-# Agent-type tasks bypass this lock because they use the agent runner which manages
-# its own concurrency.  This prevents the "conversation not found" errors that
-# occur when two prompt tasks race to create SDK sessions simultaneously.
-scheduled_prompt_lock = asyncio.Lock()
-
 # Per-chat locks to serialize message processing and prevent race conditions
 # This ensures concurrent messages to the same chat are processed sequentially
 chat_processing_locks: Dict[str, asyncio.Lock] = {}
@@ -2033,7 +2083,7 @@ async def websocket_endpoint(websocket: WebSocket):
 
     await websocket.accept()
     # Create client session for visibility tracking
-    client_sessions[websocket] = ClientSession(websocket=websocket)
+    presence.connect(websocket, ClientSession(websocket=websocket))
 
     # Notify client if server was restarted
     if server_restart_info:
@@ -2170,7 +2220,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 if session:
                     is_active = data.get("isActive", False)
                     chat_id = data.get("chatId")
-                    session.update_visibility(is_active=is_active, chat_id=chat_id)
+                    presence.heartbeat(websocket, is_active=is_active, chat_id=chat_id)
                     logger.info(f"Visibility update: active={is_active}, chat={chat_id}")
 
                     # Update active room tracking if user is focused on a specific chat
@@ -2192,12 +2242,7 @@ async def websocket_endpoint(websocket: WebSocket):
         except Exception:
             pass
     finally:
-        client_sessions.pop(websocket, None)
-        # Also remove from session_clients
-        for sid, clients in list(session_clients.items()):
-            clients.discard(websocket)
-            if not clients:
-                del session_clients[sid]
+        presence.disconnect(websocket)
 
 
 async def handle_subscribe(websocket: WebSocket, data: dict):
@@ -2214,10 +2259,7 @@ async def handle_subscribe(websocket: WebSocket, data: dict):
 
     # For intentional new chat: unregister from all sessions, return empty state
     if intent == "new_chat":
-        for sid, clients in list(session_clients.items()):
-            clients.discard(websocket)
-            if not clients:
-                del session_clients[sid]
+        presence.unsubscribe(websocket)
         logger.info(f"SUBSCRIBE: New chat requested (intent=new_chat), unregistered from all sessions")
         await websocket.send_json({
             "type": "state",
@@ -3464,15 +3506,12 @@ async def _handle_message_inner(websocket: WebSocket, data: dict, session_id: st
     conv.session_id = chat_id_for_storage
     active_conversations[chat_id_for_storage] = conv
 
-    # Advance working memory TTL after each completed exchange
+    # Advance working memory TTL after each completed exchange (one batched pass)
     try:
-        scripts_dir = os.path.join(ROOT_DIR, ".claude", "scripts")
-        if scripts_dir not in sys.path:
-            sys.path.insert(0, scripts_dir)
-        from working_memory import get_store
-        store = get_store()
-        if store.advance_exchange():
-            logger.info("Working memory: advanced exchange, some items may have expired")
+        from working_memory_service import get_working_memory_service
+        expired = get_working_memory_service().end_turn([agent_name])
+        if any(expired.values()):
+            logger.info(f"Working memory: advanced exchange, items expired for {[a for a, e in expired.items() if e]}")
     except Exception as e:
         logger.debug(f"Working memory advance_exchange failed: {e}")
 
@@ -4067,8 +4106,72 @@ def _build_agent_display_messages(prompt: str, result, agent_name: str) -> list:
     return [user_msg, assistant_msg]
 
 
+# How long a scheduled task may wait in the executor queue before it is dropped
+SCHEDULED_QUEUE_DEADLINE = 30 * 60
+MAINTENANCE_QUEUE_DEADLINE = 2 * 60 * 60
+
+
 async def _execute_scheduled_task(task_info):
-    """Execute a single scheduled task. Extracted from scheduler_loop to allow concurrent dispatch."""
+    """Queue a due scheduled task on the task executor.
+
+    Prompt-type tasks share the primary SDK session and run one at a time
+    (concurrent runs race to create sessions: "conversation not found").
+    Agent-type tasks are limited per agent here, but their global capacity is
+    the agent scheduler's: they take no global executor slot while waiting for
+    a lease, and the queue deadline carries over to that wait. Silent tasks
+    run in the maintenance class, behind user-visible ones.
+    """
+    from task_executor import PRIORITY_MAINTENANCE, PRIORITY_SCHEDULED, get_task_executor
+
+    if isinstance(task_info, dict):
+        task_type = task_info.get("type", "prompt")
+        key = f"agent:{task_info.get('agent')}" if task_type == "agent" else "prompt"
+        name = task_info.get("id") or task_info.get("prompt", "")[:40]
+        silent = task_info.get("silent", False)
+    else:
+        key, name, silent = "prompt", str(task_info)[:40], False
+
+    priority = PRIORITY_MAINTENANCE if silent else PRIORITY_SCHEDULED
+    deadline = time.time() + (MAINTENANCE_QUEUE_DEADLINE if silent else SCHEDULED_QUEUE_DEADLINE)
+    if key.startswith("agent:"):
+        get_task_executor().submit(
+            lambda: _run_scheduled_agent_task(task_info, deadline),
+            name=name, key=key, priority=priority, deadline=deadline, global_slot=False,
+        )
+    else:
+        get_task_executor().submit(
+            lambda: _run_scheduled_task(task_info),
+            name=name, key=key, priority=priority, deadline=deadline,
+        )
+
+
+async def _run_scheduled_agent_task(task_info, deadline=None):
+    """Run an agent-type scheduled task under a lease from the agent scheduler.
+
+    The wait for the lease is bounded by the task's queue deadline; a task
+    still waiting at that point is dropped as expired.
+    """
+    from agent_scheduler import get_agent_scheduler
+    from task_executor import DeadlineExpired
+
+    agent_name = task_info.get("agent")
+    timeout = deadline - time.time() if deadline is not None else None
+    admitted = False
+    try:
+        async with get_agent_scheduler().slot(
+            agent_name, "scheduled", task_info.get("room_id"), timeout=timeout,
+        ):
+            admitted = True
+            await _run_scheduled_task(task_info)
+    except asyncio.TimeoutError:
+        if admitted:
+            raise
+        logger.warning(f"Scheduled task for agent '{agent_name}' expired waiting for a lease")
+        raise DeadlineExpired(task_info.get("id") or agent_name)
+
+
+async def _run_scheduled_task(task_info):
+    """Execute a single scheduled task (run by the task executor)."""
     try:
         # Handle both old format (string) and new format (dict with metadata)
         if isinstance(task_info, str):
@@ -4316,10 +4419,9 @@ You are running as a scheduled task. Your output will be shown to the user in a
                 return
 
         # === Prompt task handling (skip for agent tasks — they're handled above) ===
-        # Prompt tasks use ClaudeWrapper which shares a single SDK session,
-        # so we serialize them to prevent "conversation not found" races.
+        # Prompt tasks use ClaudeWrapper which shares a single SDK session;
+        # the executor runs them one at a time ("prompt" key limit).
         if task_type != "agent":
-          async with scheduled_prompt_lock:
             target_room_id = task_info.get("room_id") if isinstance(task_info, dict) else None
             logger.info(f"Executing Scheduled Task (silent={is_silent}, room={target_room_id}): {prompt[:80]}...")
 
@@ -4407,7 +4509,7 @@ You are running as a scheduled task. Your output will be shown to the user in a
         decision = should_notify(
             chat_id=actual_session_id,
             is_silent=is_silent,
-            client_sessions=client_sessions
+            presence=presence
         )
 
         if decision.notify:
@@ -4453,30 +4555,29 @@ You are running as a scheduled task. Your output will be shown to the user in a
 
 
 async def scheduler_loop():
-    """Background task to check and execute scheduled tasks.
+    """Background task to dispatch scheduled tasks.
 
-    Dispatches each due task as a concurrent coroutine via asyncio.create_task()
-    so that a slow task doesn't block other scheduled tasks from starting.
+    Runs the timer-heap scheduler, which sleeps until the next task is due
+    (re-armed by the scheduler tools) and hands each due task to the task
+    executor, so a slow task doesn't block the others.
     """
     logger.info("Scheduler Loop Started")
 
-    while True:
-        try:
-            await asyncio.sleep(60)  # Check every minute
-
-            if not scheduler_tool:
-                continue
-
-            due_tasks = scheduler_tool.check_due_tasks()
-
-            for task_info in due_tasks:
-                asyncio.create_task(_execute_scheduled_task(task_info))
-
-            # Periodic maintenance: clean up stale chat locks
+    if not scheduler_tool:
+        # Nothing to schedule; keep the periodic maintenance running
+        while True:
+            await asyncio.sleep(60)
             _cleanup_chat_locks()
 
-        except Exception as e:
-            logger.error(f"Scheduler Error: {e}")
+    from task_scheduler import get_task_scheduler
+    scheduler = get_task_scheduler()
+    scheduler.tasks_path = str(getattr(scheduler_tool, "TASKS_FILE", scheduler.tasks_path))
+    await scheduler.run(
+        check_due=scheduler_tool.check_due_tasks,
+        dispatch=_execute_scheduled_task,
+        # Periodic maintenance: clean up stale chat locks
+        maintenance=_cleanup_chat_locks,
+    )
 
 
 async def restart_continuation_wakeup():
@@ -4598,65 +4699,28 @@ async def restart_continuation_wakeup():
 
 
 async def agent_notification_wakeup_loop():
-    """Background task to check for stale agent notifications and trigger wake-ups.
+    """Background task that wakes Claude up when ping-mode agents complete.
 
-    When ping mode agents complete but the user hasn't sent a message within 30 seconds,
-    this loop automatically wakes Claude up with the notifications as a hidden user message.
+    Completions are published to the in-process notification bus, which
+    debounces per chat and then hands the batch to _process_notification_batch
+    as a hidden user message.
 
     Key design decisions for concurrency safety:
-    - Uses claim_pending() to atomically transition notifications from "pending" to "injected"
-      under a file lock, preventing double-delivery with the inline injection path (Path A).
-    - Batches all notifications for the same chat_id into a single Claude call, so if 3 agents
-      complete around the same time, Claude gets one combined prompt instead of 3 serial ones.
-    - Holds chat_lock for the entire batch processing of a given chat, preventing user messages
-      from interleaving with the wake-up save.
+    - The bus claims notifications with claim_pending(), which atomically transitions
+      them from "pending" to "injected" under a file lock, preventing double-delivery
+      with the inline injection path (Path A).
+    - The per-chat debounce window batches all notifications for the same chat_id into
+      a single Claude call, so if 3 agents complete around the same time, Claude gets
+      one combined prompt instead of 3 serial ones.
+    - _process_notification_batch holds chat_lock for the entire batch, preventing user
+      messages from interleaving with the wake-up save.
+    - The file-backed queue is also swept for stale notifications every 15 seconds,
+      to recover anything written out of process or left behind by a crash.
     """
     logger.info("Agent Notification Wake-up Loop Started")
 
-    while True:
-        try:
-            await asyncio.sleep(15)  # Check every 15 seconds
-
-            # Import notification queue
-            try:
-                agents_dir = Path(ROOT_DIR) / ".claude" / "agents"
-                if str(agents_dir) not in sys.path:
-                    sys.path.insert(0, str(agents_dir))
-                from agent_notifications import get_notification_queue
-            except ImportError:
-                continue
-
-            queue = get_notification_queue()
-
-            # Atomically claim all stale notifications — this prevents Path A (inline
-            # injection) and future loop iterations from grabbing the same ones.
-            claimed = queue.claim_pending(threshold_seconds=30)
-
-            if not claimed:
-                continue
-
-            logger.info(f"Claimed {len(claimed)} stale agent notifications for wake-up")
-
-            # Group claimed notifications by target chat_id for batched delivery
-            from collections import defaultdict
-            by_chat: dict[str, list] = defaultdict(list)
-            for notification in claimed:
-                chat_id = notification.source_chat_id
-                if not chat_id:
-                    # No chat to wake up — already marked injected, just skip
-                    logger.warning(f"Notification {notification.id} has no source_chat_id, skipping")
-                    continue
-                by_chat[chat_id].append(notification)
-
-            # Process each chat's batch of notifications
-            for chat_id, notifications in by_chat.items():
-                try:
-                    await _process_notification_batch(chat_id, notifications, queue)
-                except Exception as e:
-                    logger.error(f"Error processing notification batch for chat {chat_id}: {e}", exc_info=True)
-
-        except Exception as e:
-            logger.error(f"Agent Notification Wake-up Error: {e}", exc_info=True)
+    from notification_bus import get_notification_bus
+    await get_notification_bus().run(_process_notification_batch)
 
 
 async def _process_notification_batch(chat_id: str, notifications: list, queue) -> None:
@@ -4955,7 +5019,7 @@ Please review the agent response(s) and take any necessary follow-up action. If
         decision = should_notify(
             chat_id=chat_id,
             is_silent=False,
-            client_sessions=client_sessions
+            presence=presence
         )
         if decision.notify:
             preview = assistant_response[:200] if assistant_response else f"{count_str} completed"
@@ -5038,17 +5102,42 @@ async def startup_event():
             f"(source={restart_continuation.get('source')}, reason={restart_continuation.get('reason')})"
         )
 
-    # Clear stale entries and register primary_claude in process registry
+    # Host the process registry in memory, clear stale entries and register primary_claude
     try:
+        await serve_process_registry()
         clear_registry()
         register_process("primary_claude", task="active")
         logger.info("Registered primary_claude in process registry")
     except Exception as e:
         logger.warning(f"Failed to register primary_claude in process registry: {e}")
 
+    # Digested notification emails skip chats the user has opened since
+    from notification_dispatcher import get_notification_dispatcher
+    get_notification_dispatcher().set_push_check(
+        lambda chat_id: should_notify(chat_id=chat_id, is_silent=False, presence=presence).use_push
+    )
+
+    try:
+        from usage_store import get_usage_store
+        get_usage_store().start()
+    except Exception as e:
+        logger.warning(f"Usage store unavailable: {e}")
+
     asyncio.create_task(scheduler_loop())
     asyncio.create_task(agent_notification_wakeup_loop())
 
+    # Stream invoke_agent_graph node progress to the chat that started the graph
+    try:
+        from mcp_tools.agents.graph import add_graph_listener
+        add_graph_listener(lambda chat_id, event: asyncio.create_task(
+            broadcast_to_session(chat_id, {"type": "agent_graph", **event})
+        ))
+    except Exception as e:
+        logger.warning(f"Agent graph progress events unavailable: {e}")
+
+    # Catch the chat search index up with chats written while the server was down
+    asyncio.get_event_loop().run_in_executor(None, lambda: get_chat_searcher().refresh())
+
     # If there's a restart continuation, launch the wakeup task
     if restart_continuation:
         asyncio.create_task(restart_continuation_wakeup())
@@ -5075,6 +5164,12 @@ async def shutdown_event():
     except Exception as e:
         logger.warning(f"Failed to deregister from process registry: {e}")
 
+    try:
+        from usage_store import get_usage_store
+        get_usage_store().stop()
+    except Exception as e:
+        logger.warning(f"Failed to flush usage store: {e}")
+
 
 # --- Message Sync API (for reconnection recovery) ---
 
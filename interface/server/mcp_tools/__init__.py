@@ -53,7 +53,7 @@ def _inject_chat_context(tools, chat_id: str):
     from claude_agent_sdk import SdkMcpTool
 
     # Tools that need to know their source chat_id
-    CONTEXT_TOOLS = {"invoke_agent", "invoke_agent_chain", "invoke_agent_parallel"}
+    CONTEXT_TOOLS = {"invoke_agent", "invoke_agent_chain", "invoke_agent_parallel", "invoke_agent_graph"}
 
     wrapped = []
     for t in tools:
@@ -84,14 +84,14 @@ def _inject_agent_context(tools, agent_name: str):
     """Wrap agent-context-sensitive tool handlers to inject the calling agent's name.
 
     Injects ``_agent_name`` into the args dict so that:
-    - ``memory_create/update/delete/search`` target ``.claude/agents/{name}/memories.json``.
+    - ``memory_create/update/delete/batch/search`` target ``.claude/agents/{name}/memories.json``.
     - ``schedule_self`` creates an agent-type scheduled task dispatched via the agent runner.
     """
     from claude_agent_sdk import SdkMcpTool
 
     AGENT_CONTEXT_TOOLS = {
         "memory_create", "memory_update", "memory_delete",
-        "memory_search", "memory_search_agent",
+        "memory_batch", "memory_find_duplicates", "memory_search", "memory_search_agent",
         "schedule_self",
         "working_memory_add", "working_memory_update",
         "working_memory_remove", "working_memory_list",
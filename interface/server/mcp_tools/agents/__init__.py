@@ -20,7 +20,7 @@ if AGENTS_DIR not in sys.path:
 
 
 # Agent tool names that signal "this agent has access to other agents"
-AGENT_TOOL_NAMES = {"invoke_agent", "invoke_agent_chain", "invoke_agent_parallel", "schedule_agent"}
+AGENT_TOOL_NAMES = {"invoke_agent", "invoke_agent_chain", "invoke_agent_parallel", "invoke_agent_graph", "schedule_agent"}
 
 # MCP-prefixed versions (mcp__brain__invoke_agent etc.)
 AGENT_MCP_TOOL_NAMES = {f"mcp__brain__{t}" for t in AGENT_TOOL_NAMES}
@@ -53,7 +53,7 @@ def build_agent_list_block() -> tuple[str, list[str]]:
     # All names (including hidden) for schema enum validation
     agent_names = list(combined.keys())
 
-    description_block = f"""Available agents (applies to invoke_agent, invoke_agent_chain, invoke_agent_parallel, and schedule_agent):
+    description_block = f"""Available agents (applies to invoke_agent, invoke_agent_chain, invoke_agent_parallel, invoke_agent_graph, and schedule_agent):
 {agent_list}"""
 
     return description_block, agent_names
@@ -82,12 +82,14 @@ def get_agent_list_for_prompt(tool_names: list[str]) -> str:
 
 
 from .invoke import invoke_agent, invoke_agent_chain, invoke_agent_parallel
+from .graph import invoke_agent_graph
 from .scheduler import schedule_agent
 
 __all__ = [
     "invoke_agent",
     "invoke_agent_chain",
     "invoke_agent_parallel",
+    "invoke_agent_graph",
     "schedule_agent",
     "build_agent_list_block",
     "get_agent_list_for_prompt",
@@ -0,0 +1,360 @@
+"""
+Agent graph tool.
+
+invoke_agent_graph runs a DAG of agent nodes:
+- Node prompts can reference upstream outputs with {{node_id}} templates;
+  references imply dependencies
+- Every node whose dependencies are done starts immediately, under the
+  process-wide agent scheduler (so the global agent limit still applies)
+- Per-node start/completion events are published to the source chat
+- With use_cache, successful node results are cached by content (agent,
+  model, rendered prompt) scoped to the graph definition, so re-running a
+  partially failed graph only runs the nodes that failed or whose inputs
+  changed. Off by default: agents have side effects (e.g. coder edits),
+  and an unrelated later graph must not replay them
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from claude_agent_sdk import tool
+
+from ..registry import register_tool
+from .invoke import _agent_definition, _fmt_duration
+
+logger = logging.getLogger("agents.graph")
+
+# Add agents directory to path
+AGENTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../../.claude/agents"))
+if AGENTS_DIR not in sys.path:
+    sys.path.insert(0, AGENTS_DIR)
+
+MAX_NODES = 20
+AGENT_TIMEOUT = 1200            # Per-node timeout, as in invoke_agent_parallel
+MAX_TEMPLATE_CHARS = 20000      # Upstream output inserted into a downstream prompt
+
+_TEMPLATE = re.compile(r"\{\{\s*([A-Za-z0-9_\-]+)\s*\}\}")
+
+# listener(chat_id, event) — main.py forwards these to the chat's clients
+GraphListener = Callable[[str, Dict[str, Any]], None]
+_listeners: List[GraphListener] = []
+
+
+def add_graph_listener(listener: GraphListener):
+    """Receive (source_chat_id, event) for every graph/node start and completion."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def _emit(chat_id: Optional[str], event: Dict[str, Any]):
+    if not chat_id:
+        return
+    for listener in list(_listeners):
+        try:
+            listener(chat_id, event)
+        except Exception as e:
+            logger.debug(f"Graph listener failed: {e}")
+
+
+# ── Graph validation ──────────────────────────────────────────────────────────
+
+def _build_graph(nodes: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Validate nodes and return {node_id: [dependency ids]}. Raises ValueError."""
+    if not nodes:
+        raise ValueError("nodes is required and must not be empty")
+    if len(nodes) > MAX_NODES:
+        raise ValueError(f"At most {MAX_NODES} nodes per graph")
+
+    ids = [str(n.get("id", "")) for n in nodes]
+    if any(not i for i in ids):
+        raise ValueError("Every node needs an id")
+    if len(set(ids)) != len(ids):
+        raise ValueError("Node ids must be unique")
+
+    deps: Dict[str, List[str]] = {}
+    for node in nodes:
+        node_id = str(node["id"])
+        if not node.get("agent") or not node.get("prompt"):
+            raise ValueError(f"Node '{node_id}' needs agent and prompt")
+        wanted = list(node.get("depends_on") or [])
+        wanted += _TEMPLATE.findall(node["prompt"])
+        unknown = [d for d in wanted if d not in ids]
+        if unknown:
+            raise ValueError(f"Node '{node_id}' references unknown node(s): {', '.join(sorted(set(unknown)))}")
+        if node_id in wanted:
+            raise ValueError(f"Node '{node_id}' depends on itself")
+        deps[node_id] = list(dict.fromkeys(wanted))
+
+    # Kahn's algorithm: every node must be reachable in topological order
+    indegree = {i: len(d) for i, d in deps.items()}
+    children = defaultdict(list)
+    for node_id, parents in deps.items():
+        for parent in parents:
+            children[parent].append(node_id)
+    ready = [i for i, n in indegree.items() if n == 0]
+    seen = 0
+    while ready:
+        current = ready.pop()
+        seen += 1
+        for child in children[current]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    if seen != len(deps):
+        cyclic = sorted(i for i, n in indegree.items() if n > 0)
+        raise ValueError(f"Graph has a cycle involving: {', '.join(cyclic)}")
+    return deps
+
+
+def _render(prompt: str, outputs: Dict[str, str]) -> str:
+    def replace(match):
+        text = outputs.get(match.group(1), "")
+        if len(text) > MAX_TEMPLATE_CHARS:
+            text = text[:MAX_TEMPLATE_CHARS] + "\n[...truncated]"
+        return text
+    return _TEMPLATE.sub(replace, prompt)
+
+
+# ── Tool ──────────────────────────────────────────────────────────────────────
+
+def _build_graph_tool_schema():
+    """Build tool schema for invoke_agent_graph."""
+    from . import build_agent_list_block
+
+    _, agent_names = build_agent_list_block()
+
+    description = """Run agents as a dependency graph (DAG): independent nodes run in parallel, dependent nodes start as soon as their inputs are ready.
+
+Reference an upstream node's output in a prompt with {{node_id}} — this also makes it a dependency.
+Use depends_on for ordering without inserting output.
+
+Example: research and web_research in parallel, then coder uses both:
+  nodes: [
+    {"id": "docs", "agent": "...", "prompt": "Summarize the API docs for X"},
+    {"id": "web", "agent": "...", "prompt": "Find known issues with X"},
+    {"id": "impl", "agent": "...", "prompt": "Implement Y.\\nDocs: {{docs}}\\nIssues: {{web}}"}
+  ]
+
+Failure handling: a failed node skips everything downstream of it; other branches continue.
+Set use_cache=true when re-running the same graph after a failure: nodes that succeeded
+last time are reused and only the failed part re-runs. Don't use it when nodes should
+redo their side effects (edits, messages).
+
+Returns the outputs of the graph's final nodes (nodes nothing depends on), or all nodes
+with return_all=true."""
+
+    schema = {
+        "type": "object",
+        "properties": {
+            "nodes": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string", "description": "Unique node id (letters, digits, _ or -)"},
+                        "agent": {"type": "string", "enum": agent_names, "description": "Agent to invoke"},
+                        "prompt": {"type": "string", "description": "Task for the agent; may contain {{node_id}} templates"},
+                        "depends_on": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Extra dependencies (node ids) not referenced in the prompt"
+                        },
+                        "model_override": {
+                            "type": "string",
+                            "enum": ["sonnet", "opus", "haiku"],
+                            "description": "Override the agent's default model (optional)"
+                        }
+                    },
+                    "required": ["id", "agent", "prompt"]
+                },
+                "minItems": 1,
+                "maxItems": MAX_NODES,
+                "description": "Graph nodes"
+            },
+            "use_cache": {
+                "type": "boolean",
+                "default": False,
+                "description": "Reuse results of identical nodes from an earlier run of this same graph (default: false)"
+            },
+            "return_all": {
+                "type": "boolean",
+                "default": False,
+                "description": "Return every node's output, not just the final nodes (default: false)"
+            }
+        },
+        "required": ["nodes"]
+    }
+
+    return description, schema
+
+
+_GRAPH_DESCRIPTION, _GRAPH_SCHEMA = _build_graph_tool_schema()
+
+
+@register_tool("agents")
+@tool(name="invoke_agent_graph", description=_GRAPH_DESCRIPTION, input_schema=_GRAPH_SCHEMA)
+async def invoke_agent_graph(args: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a DAG of agents, starting each node as soon as its dependencies finish."""
+    from agent_scheduler import get_agent_scheduler
+    from result_cache import config_hash, get_result_cache
+    from runner import invoke_agent as _invoke_agent
+
+    try:
+        nodes = args.get("nodes", [])
+        use_cache = args.get("use_cache", False)
+        return_all = args.get("return_all", False)
+
+        try:
+            deps = _build_graph(nodes)
+        except ValueError as e:
+            return {"content": [{"type": "text", "text": f"Error: {e}"}], "is_error": True}
+
+        # Get source chat ID: injected by MCP wrapper (concurrent-safe) or env var (fallback)
+        source_chat_id = args.pop("_source_chat_id", None) or os.environ.get("CURRENT_CHAT_ID")
+        scheduler = get_agent_scheduler()
+        cache = get_result_cache()
+        by_id = {str(n["id"]): n for n in nodes}
+        # Cache hits only come from reruns of this same graph definition
+        graph_key = config_hash({"nodes": [
+            [str(n["id"]), n["agent"], n["prompt"], sorted(n.get("depends_on") or []), n.get("model_override")]
+            for n in nodes
+        ]})
+        outputs: Dict[str, str] = {}
+        results: Dict[str, Dict[str, Any]] = {}
+        done = {node_id: asyncio.Event() for node_id in by_id}
+        total_start = time.monotonic()
+
+        _emit(source_chat_id, {"event": "graph_started", "nodes": list(by_id)})
+
+        async def _run_node(node_id: str):
+            node = by_id[node_id]
+            try:
+                for parent in deps[node_id]:
+                    await done[parent].wait()
+                failed = [p for p in deps[node_id] if results[p]["status"] != "success"]
+                if failed:
+                    results[node_id] = {"status": "skipped", "error": f"upstream failed: {', '.join(failed)}",
+                                        "duration": 0.0, "cached": False}
+                    return
+
+                agent_name = node["agent"]
+                model_override = node.get("model_override")
+                prompt = _render(node["prompt"], outputs)
+                cache_config = {"model_override": model_override, "graph": graph_key,
+                                "agent": _agent_definition(agent_name)}
+                cached = cache.get("invoke_agent_graph", agent_name, prompt, cache_config, bypass=not use_cache)
+                if cached is not None:
+                    outputs[node_id] = cached
+                    results[node_id] = {"status": "success", "duration": 0.0, "cached": True}
+                    return
+
+                async with scheduler.slot(agent_name, "foreground", source_chat_id) as lease:
+                    _emit(source_chat_id, {"event": "node_started", "node": node_id, "agent": agent_name})
+                    start = time.monotonic()
+                    try:
+                        result = await asyncio.wait_for(
+                            _invoke_agent(
+                                name=agent_name,
+                                prompt=prompt,
+                                mode="foreground",
+                                source_chat_id=source_chat_id,
+                                model_override=model_override,
+                            ),
+                            timeout=AGENT_TIMEOUT,
+                        )
+                    except asyncio.TimeoutError:
+                        result = {"error": f"Agent timed out after {AGENT_TIMEOUT}s"}
+                    duration = time.monotonic() - start
+                    scheduler.record_result(result, lease, model=model_override)
+
+                error = None
+                if hasattr(result, "status"):
+                    if result.status == "success":
+                        response = result.transcript or result.response or ""
+                    else:
+                        response, error = None, result.error or result.status
+                elif isinstance(result, dict) and "error" in result:
+                    response, error = None, result["error"]
+                else:
+                    response = str(result)
+
+                if response is None:
+                    results[node_id] = {"status": "error", "error": str(error), "duration": duration, "cached": False}
+                else:
+                    outputs[node_id] = response
+                    results[node_id] = {"status": "success", "duration": duration, "cached": False}
+                    cache.put("invoke_agent_graph", agent_name, prompt, response, cache_config,
+                              duration=duration, cost_usd=getattr(result, "cost_usd", None))
+            except Exception as e:
+                results[node_id] = {"status": "error", "error": str(e), "duration": 0.0, "cached": False}
+            finally:
+                done[node_id].set()
+                r = results.get(node_id, {})
+                _emit(source_chat_id, {
+                    "event": "node_completed", "node": node_id, "agent": node.get("agent"),
+                    "status": r.get("status"), "cached": r.get("cached", False),
+                    "duration": round(r.get("duration", 0.0), 1),
+                })
+
+        await asyncio.gather(*(_run_node(node_id) for node_id in by_id))
+        total_duration = time.monotonic() - total_start
+
+        succeeded = sum(1 for r in results.values() if r["status"] == "success")
+        _emit(source_chat_id, {"event": "graph_completed", "succeeded": succeeded, "total": len(by_id),
+                               "duration": round(total_duration, 1)})
+        logger.info(f"Agent graph complete: {succeeded}/{len(by_id)} nodes, {total_duration:.1f}s total")
+
+        formatted = _format_graph_results(nodes, deps, results, outputs, total_duration, return_all)
+        return {"content": [{"type": "text", "text": formatted}]}
+
+    except Exception as e:
+        import traceback
+        return {
+            "content": [{"type": "text", "text": f"Error in graph invocation: {str(e)}\n{traceback.format_exc()}"}],
+            "is_error": True
+        }
+
+
+def _format_graph_results(
+    nodes: List[Dict[str, Any]],
+    deps: Dict[str, List[str]],
+    results: Dict[str, Dict[str, Any]],
+    outputs: Dict[str, str],
+    total_duration: float,
+    return_all: bool,
+) -> str:
+    """Status line per node, then the outputs of the final (or all) nodes."""
+    has_children = {parent for parents in deps.values() for parent in parents}
+    succeeded = sum(1 for r in results.values() if r["status"] == "success")
+
+    parts = [f"## Graph Results ({succeeded}/{len(nodes)} nodes succeeded, {_fmt_duration(total_duration)} total)", ""]
+    for node in nodes:
+        node_id = str(node["id"])
+        r = results[node_id]
+        detail = "cached" if r.get("cached") else _fmt_duration(r["duration"])
+        marker = {"success": "✓", "skipped": "⏭", "error": "❌"}.get(r["status"], "?")
+        line = f"- {marker} **{node_id}** ({node['agent']}, {detail})"
+        if r["status"] != "success":
+            line += f" — {r.get('error', r['status'])}"
+        parts.append(line)
+    parts.append("")
+
+    for node in nodes:
+        node_id = str(node["id"])
+        if not return_all and node_id in has_children:
+            continue
+        parts.append("---")
+        parts.append(f"### {node_id}: {node['agent']}")
+        if node_id in outputs:
+            parts.append(outputs[node_id])
+        else:
+            parts.append(f"Error: {results[node_id].get('error', results[node_id]['status'])}")
+        parts.append("")
+
+    return "\n".join(parts)
@@ -8,10 +8,11 @@ Tools for invoking specialized agents:
 """
 
 import asyncio
+import logging
 import os
 import sys
 import time
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Set
 
 from claude_agent_sdk import tool
 
@@ -22,6 +23,89 @@ AGENTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../.
 if AGENTS_DIR not in sys.path:
     sys.path.insert(0, AGENTS_DIR)
 
+logger = logging.getLogger("agents.invoke")
+
+# Queued background starts, referenced until done so they can't be garbage-collected
+_queued_starts: Set[asyncio.Task] = set()
+
+
+def _agent_definition(agent_name: str) -> str:
+    """Hash of an agent's config.yaml and prompt.md, so edits to an agent miss the result cache."""
+    import hashlib
+
+    digest = hashlib.sha256()
+    for agent_dir in (os.path.join(AGENTS_DIR, agent_name), os.path.join(AGENTS_DIR, "background", agent_name)):
+        if not os.path.isdir(agent_dir):
+            continue
+        for filename in ("config.yaml", "prompt.md"):
+            try:
+                with open(os.path.join(agent_dir, filename), "rb") as f:
+                    digest.update(filename.encode() + b"\0" + f.read() + b"\0")
+            except OSError:
+                continue
+        break
+    return digest.hexdigest()[:16]
+
+
+def _queue_note(lease) -> str:
+    """Feedback line for runs that had to wait for agent capacity."""
+    if lease is None or lease.waited < 1:
+        return ""
+    return f"\n\n(Waited {_fmt_duration(lease.waited)} in the agent queue.)"
+
+
+async def _start_when_admitted(lease, start, description: str):
+    """Start a queued background run once the agent scheduler admits it.
+
+    ``start`` is a zero-arg coroutine factory that launches the run and
+    returns the runner's acknowledgment.
+    """
+    from agent_scheduler import get_agent_scheduler
+
+    scheduler = get_agent_scheduler()
+    try:
+        await lease.admitted
+        with scheduler.bound_to(lease):
+            result = await start()
+    except asyncio.CancelledError:
+        scheduler.release(lease)
+        raise
+    except Exception as e:
+        logger.error(f"Queued {description} failed to start: {e}")
+        scheduler.release(lease)
+        return
+    if isinstance(result, dict) and "error" in result:
+        logger.error(f"Queued {description} failed to start: {result['error']}")
+        scheduler.release(lease)
+        return
+    scheduler.hold_until_finished(lease)
+
+
+async def _launch_background(lease, start, description: str):
+    """Start a background (ping/trust/chain) run now if admitted, else queue it.
+
+    Returns the runner's acknowledgment dict, or None if the run was queued.
+    """
+    from agent_scheduler import get_agent_scheduler
+
+    scheduler = get_agent_scheduler()
+    if lease.admitted_at is None:
+        task = asyncio.create_task(_start_when_admitted(lease, start, description))
+        _queued_starts.add(task)
+        task.add_done_callback(_queued_starts.discard)
+        return None
+    try:
+        with scheduler.bound_to(lease):
+            result = await start()
+    except BaseException:
+        scheduler.release(lease)
+        raise
+    if isinstance(result, dict) and "error" in result:
+        scheduler.release(lease)
+    else:
+        scheduler.hold_until_finished(lease)
+    return result
+
 
 def _build_invoke_tool_schema():
     """Build tool schema dynamically from registry.
@@ -84,6 +168,11 @@ Use case examples:
                     {"type": "string"},
                     {"type": "array", "items": {"type": "string"}}
                 ]
+            },
+            "use_cache": {
+                "type": "boolean",
+                "description": "Foreground only: reuse the result of an identical earlier run (same agent, model, prompt and project) instead of running the agent again. Use for retries and repeated research, not for tasks whose answer changes over time. Default: false",
+                "default": False
             }
         },
         "required": ["agent", "prompt"]
@@ -107,6 +196,7 @@ async def invoke_agent(args: Dict[str, Any]) -> Dict[str, Any]:
         mode = args.get("mode", "foreground")
         model_override = args.get("model_override")
         project = args.get("project")
+        use_cache = args.get("use_cache", False) and mode == "foreground"
 
         if not agent_name:
             return {"content": [{"type": "text", "text": "Error: agent is required"}], "is_error": True}
@@ -117,21 +207,57 @@ async def invoke_agent(args: Dict[str, Any]) -> Dict[str, Any]:
         # Get source chat ID: injected by MCP wrapper (concurrent-safe) or env var (fallback)
         source_chat_id = args.pop("_source_chat_id", None) or os.environ.get("CURRENT_CHAT_ID")
 
-        result = await _invoke_agent(
-            name=agent_name,
-            prompt=prompt,
-            mode=mode,
-            source_chat_id=source_chat_id,
-            model_override=model_override,
-            project=project
-        )
+        if use_cache:
+            from result_cache import get_result_cache
+            cache_config = {"model_override": model_override, "project": project,
+                            "agent": _agent_definition(agent_name)}
+            cached = get_result_cache().get("invoke_agent", agent_name, prompt, cache_config)
+            if cached is not None:
+                return {"content": [{"type": "text", "text": cached + "\n\n(Cached result from an identical earlier run.)"}]}
+
+        from agent_scheduler import get_agent_scheduler
+        scheduler = get_agent_scheduler()
+
+        def _start():
+            return _invoke_agent(
+                name=agent_name,
+                prompt=prompt,
+                mode=mode,
+                source_chat_id=source_chat_id,
+                model_override=model_override,
+                project=project
+            )
+
+        # Every run takes a lease from the process-wide agent scheduler
+        if mode == "foreground":
+            async with scheduler.slot(agent_name, mode, source_chat_id) as lease:
+                started = time.time()
+                result = await _start()
+                scheduler.record_result(result, lease, model=model_override)
+        else:
+            lease = scheduler.request(agent_name, mode, source_chat_id)
+            result = await _launch_background(lease, _start, f"agent {agent_name}")
+            if result is None:
+                position = scheduler.position(lease)
+                when_done = " You'll be notified when it completes." if mode == "ping" else ""
+                return {"content": [{"type": "text", "text": (
+                    f"Agent {agent_name} is queued (position {position}) and will start "
+                    f"as soon as agent capacity frees up.{when_done}"
+                )}]}
 
         # Handle different result types based on mode
         if mode == "foreground":
             # AgentResult object
             if hasattr(result, "status"):
                 if result.status == "success":
-                    return {"content": [{"type": "text", "text": result.transcript or result.response}]}
+                    text = result.transcript or result.response
+                    if use_cache:
+                        get_result_cache().put(
+                            "invoke_agent", agent_name, prompt, text, cache_config,
+                            duration=time.time() - started,
+                            cost_usd=getattr(result, "cost_usd", None),
+                        )
+                    return {"content": [{"type": "text", "text": text + _queue_note(lease)}]}
                 else:
                     error_msg = f"Agent {agent_name} failed: {result.error or result.status}"
                     return {"content": [{"type": "text", "text": error_msg}], "is_error": True}
@@ -245,13 +371,28 @@ async def invoke_agent_chain(args: Dict[str, Any]) -> Dict[str, Any]:
         if not source_chat_id:
             return {"content": [{"type": "text", "text": "Error: source_chat_id required for chain notifications"}], "is_error": True}
 
-        # Delegate to runner (same pattern as ping mode)
-        result = await _invoke_chain(
-            chain=chain,
-            on_failure=on_failure,
-            summarize=summarize,
-            source_chat_id=source_chat_id,
+        def _start():
+            return _invoke_chain(
+                chain=chain,
+                on_failure=on_failure,
+                summarize=summarize,
+                source_chat_id=source_chat_id,
+            )
+
+        # Delegate to runner (same pattern as ping mode). The chain is admitted
+        # as one background run whose lease is held until its last agent finishes.
+        from agent_scheduler import get_agent_scheduler
+        scheduler = get_agent_scheduler()
+        lease = scheduler.request(
+            chain[0].get("agent", "chain"), "ping", source_chat_id,
+            runs=len(chain) + (1 if summarize else 0),
         )
+        result = await _launch_background(lease, _start, "agent chain")
+        if result is None:
+            return {"content": [{"type": "text", "text": (
+                f"Agent chain ({len(chain)} agents) is queued (position {scheduler.position(lease)}) "
+                f"and will start as soon as agent capacity frees up. You'll be notified when it completes."
+            )}]}
 
         if "error" in result:
             return {"content": [{"type": "text", "text": result["error"]}], "is_error": True}
@@ -328,7 +469,7 @@ _PARALLEL_DESCRIPTION, _PARALLEL_SCHEMA = _build_parallel_tool_schema()
 @tool(name="invoke_agent_parallel", description=_PARALLEL_DESCRIPTION, input_schema=_PARALLEL_SCHEMA)
 async def invoke_agent_parallel(args: Dict[str, Any]) -> Dict[str, Any]:
     """Run multiple agents in parallel and return all results."""
-    import logging
+    from agent_scheduler import get_agent_scheduler
     from runner import invoke_agent as _invoke_agent
 
     logger = logging.getLogger("agents.parallel")
@@ -341,8 +482,8 @@ async def invoke_agent_parallel(args: Dict[str, Any]) -> Dict[str, Any]:
         # Get source chat ID: injected by MCP wrapper (concurrent-safe) or env var (fallback)
         source_chat_id = args.pop("_source_chat_id", None) or os.environ.get("CURRENT_CHAT_ID")
 
-        # Hardcoded semaphore for system safety — not a user parameter
-        semaphore = asyncio.Semaphore(5)
+        # Concurrency is bounded process-wide by the agent scheduler
+        scheduler = get_agent_scheduler()
 
         # Per-agent timeout: 20 minutes (research/deep_think can legitimately take a while)
         AGENT_TIMEOUT = 1200
@@ -350,13 +491,14 @@ async def invoke_agent_parallel(args: Dict[str, Any]) -> Dict[str, Any]:
         total_start = time.monotonic()
 
         async def _run_one(idx: int, inv: Dict[str, str]):
-            """Run a single agent with semaphore + timeout."""
+            """Run a single agent with a scheduler lease + timeout."""
             agent_name = inv["agent"]
             prompt = inv["prompt"]
             model_override = inv.get("model_override")
-            start = time.monotonic()
 
-            async with semaphore:
+            async with scheduler.slot(agent_name, "foreground", source_chat_id) as lease:
+                start = time.monotonic()
+                queued = lease.waited
                 try:
                     result = await asyncio.wait_for(
                         _invoke_agent(
@@ -368,27 +510,28 @@ async def invoke_agent_parallel(args: Dict[str, Any]) -> Dict[str, Any]:
                         ),
                         timeout=AGENT_TIMEOUT,
                     )
+                    scheduler.record_result(result, lease, model=model_override)
 
                     duration = time.monotonic() - start
 
                     # Extract response from AgentResult or dict
                     if hasattr(result, "status"):
                         if result.status == "success":
-                            return {"idx": idx, "status": "success", "response": result.transcript or result.response, "duration": duration}
+                            return {"idx": idx, "status": "success", "response": result.transcript or result.response, "duration": duration, "queued": queued}
                         else:
                             error_msg = result.error or result.status
-                            return {"idx": idx, "status": "error", "error": error_msg, "duration": duration}
+                            return {"idx": idx, "status": "error", "error": error_msg, "duration": duration, "queued": queued}
                     elif isinstance(result, dict) and "error" in result:
-                        return {"idx": idx, "status": "error", "error": result["error"], "duration": duration}
+                        return {"idx": idx, "status": "error", "error": result["error"], "duration": duration, "queued": queued}
                     else:
-                        return {"idx": idx, "status": "success", "response": str(result), "duration": duration}
+                        return {"idx": idx, "status": "success", "response": str(result), "duration": duration, "queued": queued}
 
                 except asyncio.TimeoutError:
                     duration = time.monotonic() - start
-                    return {"idx": idx, "status": "error", "error": f"Agent timed out after {AGENT_TIMEOUT}s", "duration": duration}
+                    return {"idx": idx, "status": "error", "error": f"Agent timed out after {AGENT_TIMEOUT}s", "duration": duration, "queued": queued}
                 except Exception as e:
                     duration = time.monotonic() - start
-                    return {"idx": idx, "status": "error", "error": str(e), "duration": duration}
+                    return {"idx": idx, "status": "error", "error": str(e), "duration": duration, "queued": queued}
 
         # Launch all agents concurrently
         tasks = [_run_one(i, inv) for i, inv in enumerate(invocations)]
@@ -444,6 +587,8 @@ def _format_parallel_results(
         agent_name = inv["agent"]
         prompt_text = inv["prompt"]
         duration_fmt = _fmt_duration(r["duration"])
+        if r.get("queued", 0) >= 1:
+            duration_fmt += f", queued {_fmt_duration(r['queued'])}"
 
         # Truncate prompt to 120 chars
         prompt_preview = prompt_text[:120] + "..." if len(prompt_text) > 120 else prompt_text
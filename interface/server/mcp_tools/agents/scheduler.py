@@ -124,6 +124,12 @@ async def schedule_agent(args: Dict[str, Any]) -> Dict[str, Any]:
             project=project
         )
 
+        try:
+            from task_scheduler import rearm_scheduler
+            rearm_scheduler()
+        except Exception:
+            pass
+
         return {"content": [{"type": "text", "text": result}]}
 
     except Exception as e:
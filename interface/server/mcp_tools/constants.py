@@ -89,6 +89,8 @@ UNIFIED_MEMORY_TOOLS = [
     "memory_search",
     "memory_update",
     "memory_delete",
+    "memory_batch",
+    "memory_find_duplicates",
     "memory_search_agent",
 ]
 
@@ -120,6 +122,7 @@ AGENT_TOOLS = [
     "invoke_agent",
     "invoke_agent_chain",
     "invoke_agent_parallel",
+    "invoke_agent_graph",
     "schedule_agent",
 ]
 
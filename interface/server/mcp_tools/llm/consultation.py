@@ -13,6 +13,7 @@ import asyncio
 import logging
 import os
 import shlex
+import time
 from typing import Any, Dict
 
 from claude_agent_sdk import tool
@@ -245,6 +246,11 @@ Example prompts:
                 "description": "Timeout in seconds (default: 120)",
                 "default": 120,
             },
+            "use_cache": {
+                "type": "boolean",
+                "description": "Reuse the answer to an identical earlier consultation (same provider, model and prompt) instead of asking again. Default: false",
+                "default": False,
+            },
         },
         "required": ["provider", "prompt"],
     },
@@ -257,6 +263,7 @@ async def consult_llm(args: Dict[str, Any]) -> Dict[str, Any]:
     prompt = args.get("prompt", "")
     model = args.get("model")
     timeout = args.get("timeout", DEFAULT_TIMEOUT)
+    use_cache = args.get("use_cache", False)
     
     # Validate provider
     if provider not in PROVIDERS:
@@ -281,6 +288,14 @@ async def consult_llm(args: Dict[str, Any]) -> Dict[str, Any]:
     
     # Build system prompt
     system_prompt = SYSTEM_PROMPT_TEMPLATE.format(model=use_model)
+
+    if use_cache:
+        from result_cache import get_result_cache
+        cache_config = {"provider": provider, "system_prompt": system_prompt}
+        cached = get_result_cache().get("consult_llm", use_model, prompt, cache_config)
+        if cached is not None:
+            logger.info(f"Using cached response from {provider} ({use_model})")
+            return {"content": [{"type": "text", "text": f"**{use_model} says:** (cached)\n\n{cached}"}]}
     
     # Build command
     if provider == "gemini":
@@ -289,10 +304,14 @@ async def consult_llm(args: Dict[str, Any]) -> Dict[str, Any]:
         command = build_codex_command(prompt, use_model, system_prompt)
     
     # Run and get result
+    started = time.time()
     result = await run_llm_command(command, timeout=timeout)
     
     if result["success"]:
         logger.info(f"Got response from {provider} ({use_model})")
+        if use_cache:
+            get_result_cache().put("consult_llm", use_model, prompt, result["response"], cache_config,
+                                   duration=time.time() - started)
         response_text = f"**{use_model} says:**\n\n{result['response']}"
         return {
             "content": [{"type": "text", "text": response_text}]
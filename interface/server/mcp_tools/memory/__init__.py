@@ -11,6 +11,8 @@ from .unified import (
     memory_search,
     memory_update,
     memory_delete,
+    memory_batch,
+    memory_find_duplicates,
     memory_search_agent,
 )
 from .working import (
@@ -30,6 +32,8 @@ __all__ = [
     "memory_search",
     "memory_update",
     "memory_delete",
+    "memory_batch",
+    "memory_find_duplicates",
     "memory_search_agent",
     # Working Memory
     "working_memory_add",
@@ -3,17 +3,29 @@ Chat History Search MCP Tool
 
 Provides semantic search over raw conversation archives.
 Two-layer pipeline:
-  1. Qwen3 embedding search → top message-level hits grouped by conversation
+  1. Embedding search over the memory-mapped chat index (chat_index.py)
+     → top message-level hits grouped by conversation
   2. Haiku LLM extraction → structured excerpts with verbatim quotes
 
 Falls back to raw embedding snippets if Haiku extraction fails.
+
+Context windows are assembled in a thread pool: candidate chats are read
+concurrently, each file is stream-parsed only up to the last message the
+window needs, and assembly stops as soon as the total token budget is met.
+
+Two in-process caches keep repeat searches fast:
+  - Parsed chat message prefixes, LRU keyed by (chat_id, mtime)
+  - Final results, keyed by normalized query + date range + index version,
+    so a repeated or near-identical query skips both search and extraction
 """
 
 import json
 import logging
 import os
+import re
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -21,6 +33,8 @@ from pydantic import BaseModel, Field
 from claude_agent_sdk import tool
 
 from ..registry import register_tool
+from cache_utils import LRUCache
+from token_estimator import estimate_tokens, truncate_to_tokens
 
 logger = logging.getLogger("mcp_tools.memory.chat_search")
 
@@ -37,11 +51,116 @@ CHATS_DIR = os.path.join(CLAUDE_DIR, "chats")
 
 # ── Constants ──────────────────────────────────────────────────────────────────
 
-TOKENS_PER_CHAR = 0.25
 DEFAULT_WINDOW_SIZE = 5       # Messages before/after match
 MAX_CONVERSATIONS = 10        # Max conversations in Haiku call
 MAX_TOKENS_PER_WINDOW = 4000  # Token budget per conversation window
 MAX_TOTAL_TOKENS = 30000      # Total token budget for all windows
+MIN_TRUNCATED_TOKENS = 100    # Don't include a truncated message shorter than this
+CONTEXT_WORKERS = 6           # Concurrent chat reads while building windows
+STREAM_CHUNK_CHARS = 64 * 1024
+
+CHAT_CACHE_MAX_CHATS = 64                 # Parsed chat files kept in memory
+CHAT_CACHE_MAX_BYTES = 64 * 1024 * 1024   # ...bounded by on-disk JSON size
+RESULT_CACHE_TTL = 600                    # Seconds a search result stays valid
+RESULT_CACHE_MAX_ENTRIES = 128
+
+_chat_cache = LRUCache(max_entries=CHAT_CACHE_MAX_CHATS, max_bytes=CHAT_CACHE_MAX_BYTES)
+_result_cache = LRUCache(max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL)
+
+# Words dropped when normalizing queries, so near-repeats share a cache key
+_QUERY_STOPWORDS = {
+    "a", "an", "the", "about", "of", "on", "in", "to", "for", "with", "and", "or",
+    "we", "i", "you", "what", "when", "did", "do", "was", "were", "is", "are",
+    "discussion", "discussed", "conversation", "conversations", "talk", "talked",
+}
+
+
+# ── Caching helpers ──────────────────────────────────────────────────────────
+
+_decoder = json.JSONDecoder()
+
+
+def _stream_messages(path: Path, stop_after: Optional[int]) -> Tuple[List[Dict[str, Any]], bool, int]:
+    """
+    Incrementally parse the top-level "messages" array of a chat file.
+
+    Decodes one message at a time and stops once index stop_after has been
+    read, so the tail of a long chat is never read or parsed.
+
+    Returns:
+        (messages, complete, chars_read) — complete is True if the whole array was read
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        chars_read = 0
+        while True:
+            key = buf.find('"messages"')
+            bracket = buf.find("[", key) if key != -1 else -1
+            if bracket != -1:
+                break
+            chunk = f.read(STREAM_CHUNK_CHARS)
+            if not chunk:
+                return [], True, chars_read
+            chars_read += len(chunk)
+            buf += chunk
+
+        buf = buf[bracket + 1:]
+        messages: List[Dict[str, Any]] = []
+        while stop_after is None or len(messages) <= stop_after:
+            buf = buf.lstrip(" \t\r\n,")
+            if buf.startswith("]"):
+                return messages, True, chars_read
+            try:
+                msg, end = _decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                chunk = f.read(STREAM_CHUNK_CHARS)
+                if not chunk:
+                    raise
+                chars_read += len(chunk)
+                buf += chunk
+                continue
+            messages.append(msg)
+            buf = buf[end:]
+        return messages, False, chars_read
+
+
+def load_chat_messages(chat_id: str, upto: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Return the chat's messages, at least through index `upto` (all if None).
+
+    Served from the LRU cache while the file is unchanged; a cached prefix is
+    reused if it already covers `upto`, otherwise the file is stream-parsed
+    just far enough.
+    """
+    chat_path = Path(CHATS_DIR) / f"{chat_id}.json"
+    try:
+        stat = chat_path.stat()
+    except OSError:
+        return None
+
+    key = (chat_id, stat.st_mtime)
+    cached = _chat_cache.get(key)
+    if cached is not None:
+        messages, complete = cached
+        if complete or (upto is not None and len(messages) > upto):
+            return messages
+
+    try:
+        messages, complete, chars_read = _stream_messages(chat_path, upto)
+    except (json.JSONDecodeError, ValueError):
+        # Unusual layout: fall back to a full parse
+        with open(chat_path, "r", encoding="utf-8") as f:
+            messages, complete, chars_read = json.load(f).get("messages", []), True, stat.st_size
+
+    _chat_cache.set(key, (messages, complete), size=min(chars_read, stat.st_size))
+    return messages
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query: lowercase content words, deduplicated and sorted."""
+    words = re.findall(r"\w+", query.lower())
+    content = sorted({w for w in words if w not in _QUERY_STOPWORDS})
+    return " ".join(content) or " ".join(words)
 
 
 # ── Pydantic models for Haiku structured output ──────────────────────────────
@@ -94,7 +213,7 @@ def build_context_windows(
     Returns:
         List of window dicts: {chat_id, title, score, messages: [{role, content, is_match}]}
     """
-    from contextual_memory.chat_embedding_index import strip_tool_markers
+    from chat_index import strip_tool_markers
 
     # Group hits by chat_id, keeping max score per conversation
     chat_groups: Dict[str, Dict] = {}
@@ -117,97 +236,101 @@ def build_context_windows(
     sorted_groups = sorted(
         chat_groups.values(), key=lambda x: x["score"], reverse=True
     )[:max_conversations]
+    if not sorted_groups:
+        return []
+
+    def _build_window(group: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Load just the needed message range of one chat and build its window."""
+        match_indices = set(group["match_indices"])
+        min_idx = max(0, min(match_indices) - window_size)
+        last_idx = max(match_indices) + window_size
+
+        messages = load_chat_messages(group["chat_id"], upto=last_idx)
+        if messages is None:
+            return None
+        max_idx = min(len(messages), last_idx + 1)
+
+        # Extract messages in range (only user/assistant)
+        window_messages = []
+        window_tokens = 0
+
+        for i in range(min_idx, max_idx):
+            msg = messages[i]
+            role = msg.get("role", "")
+
+            if role not in ("user", "assistant"):
+                continue
+
+            # Skip hidden messages
+            if msg.get("hidden", False):
+                continue
+
+            content = msg.get("content", "")
+            if isinstance(content, list):
+                text_parts = []
+                for block in content:
+                    if isinstance(block, dict) and block.get("type") == "text":
+                        text_parts.append(block.get("text", ""))
+                    elif isinstance(block, str):
+                        text_parts.append(block)
+                content = "\n".join(text_parts)
+
+            if not isinstance(content, str):
+                continue
+
+            cleaned = strip_tool_markers(content)
+            if not cleaned:
+                continue
+
+            # Token budget per window
+            msg_tokens = estimate_tokens(cleaned)
+            if window_tokens + msg_tokens > max_tokens_per_window:
+                # Truncate this message to fit
+                remaining = max_tokens_per_window - window_tokens
+                if remaining > MIN_TRUNCATED_TOKENS:  # Only include if meaningful
+                    cleaned = truncate_to_tokens(cleaned, remaining)
+                    msg_tokens = remaining
+                else:
+                    break
 
-    # Load each chat and extract context windows
+            window_messages.append({
+                "role": role,
+                "content": cleaned,
+                "is_match": i in match_indices,
+            })
+            window_tokens += msg_tokens
+
+        if not window_messages:
+            return None
+        return {
+            "chat_id": group["chat_id"],
+            "title": group["title"],
+            "score": group["score"],
+            "timestamp": group.get("timestamp"),
+            "messages": window_messages,
+            "tokens": window_tokens,
+        }
+
+    # Read candidate chats concurrently; consume results in score order and
+    # cancel whatever hasn't started once the total budget is met.
     windows = []
     total_tokens = 0
-
-    for group in sorted_groups:
-        if total_tokens >= max_total_tokens:
-            break
-
-        chat_path = Path(CHATS_DIR) / f"{group['chat_id']}.json"
-        if not chat_path.exists():
-            continue
-
-        try:
-            with open(chat_path, "r", encoding="utf-8") as f:
-                chat_data = json.load(f)
-
-            messages = chat_data.get("messages", [])
-
-            # Determine the range of messages to include
-            match_indices = set(group["match_indices"])
-            min_idx = max(0, min(match_indices) - window_size)
-            max_idx = min(len(messages), max(match_indices) + window_size + 1)
-
-            # Extract messages in range (only user/assistant)
-            window_messages = []
-            window_tokens = 0
-
-            for i in range(min_idx, max_idx):
-                if i >= len(messages):
-                    break
-
-                msg = messages[i]
-                role = msg.get("role", "")
-
-                if role not in ("user", "assistant"):
-                    continue
-
-                # Skip hidden messages
-                if msg.get("hidden", False):
-                    continue
-
-                content = msg.get("content", "")
-                if isinstance(content, list):
-                    text_parts = []
-                    for block in content:
-                        if isinstance(block, dict) and block.get("type") == "text":
-                            text_parts.append(block.get("text", ""))
-                        elif isinstance(block, str):
-                            text_parts.append(block)
-                    content = "\n".join(text_parts)
-
-                if not isinstance(content, str):
-                    continue
-
-                cleaned = strip_tool_markers(content)
-                if not cleaned:
-                    continue
-
-                # Token budget per window
-                msg_tokens = int(len(cleaned) * TOKENS_PER_CHAR)
-                if window_tokens + msg_tokens > max_tokens_per_window:
-                    # Truncate this message to fit
-                    remaining = max_tokens_per_window - window_tokens
-                    if remaining > 100:  # Only include if meaningful
-                        char_limit = int(remaining / TOKENS_PER_CHAR)
-                        cleaned = cleaned[:char_limit] + "..."
-                        msg_tokens = remaining
-                    else:
-                        break
-
-                window_messages.append({
-                    "role": role,
-                    "content": cleaned,
-                    "is_match": i in match_indices,
-                })
-                window_tokens += msg_tokens
-
-            if window_messages:
-                windows.append({
-                    "chat_id": group["chat_id"],
-                    "title": group["title"],
-                    "score": group["score"],
-                    "timestamp": group.get("timestamp"),
-                    "messages": window_messages,
-                })
-                total_tokens += window_tokens
-
-        except Exception as e:
-            logger.warning(f"Error loading chat {group['chat_id']}: {e}")
-            continue
+    pool = ThreadPoolExecutor(max_workers=min(CONTEXT_WORKERS, len(sorted_groups)))
+    try:
+        futures = [pool.submit(_build_window, group) for group in sorted_groups]
+        for group, future in zip(sorted_groups, futures):
+            if total_tokens >= max_total_tokens:
+                break
+            try:
+                window = future.result()
+            except Exception as e:
+                logger.warning(f"Error loading chat {group['chat_id']}: {e}")
+                continue
+            if window:
+                total_tokens += window.pop("tokens")
+                windows.append(window)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
 
     return windows
 
@@ -441,11 +564,25 @@ async def search_conversation_history(args: Dict[str, Any]) -> Dict[str, Any]:
                 date_range = dr
 
         # Layer 1: Get embedding search results
-        from contextual_memory.chat_embedding_index import get_index, search
+        from chat_index import get_chat_index
+
+        index = get_chat_index(CHATS_DIR)
+
+        # Repeat / near-repeat query against an unchanged index: reuse the result
+        cache_key = (
+            normalize_query(search_query),
+            tuple(sorted(date_range.items())) if date_range else None,
+            max_results,
+            index.version,
+        )
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"search_conversation_history: cache hit for {cache_key[0]!r}")
+            return cached
 
-        index = get_index()
+        index_size = index.message_count()
 
-        if not index.metadata:
+        if not index_size:
             return {"content": [{"type": "text", "text": (
                 "Chat index is empty — no conversations have been indexed yet. "
                 "The index will be built automatically on next use."
@@ -453,7 +590,7 @@ async def search_conversation_history(args: Dict[str, Any]) -> Dict[str, Any]:
 
         # Search with generous k for grouping (we'll narrow down per-conversation)
         k = max_results * 4  # Get more hits to have good per-conversation coverage
-        hits = search(index, search_query, k=k, date_range=date_range)
+        hits = index.search_messages(search_query, k=k, date_range=date_range)
 
         if not hits:
             return {"content": [{"type": "text", "text": (
@@ -478,14 +615,16 @@ async def search_conversation_history(args: Dict[str, Any]) -> Dict[str, Any]:
 
         if extraction and extraction.results:
             # Format structured results
-            return _format_extraction_response(
-                extraction, search_query, total_time, search_time, len(index.metadata)
+            response = _format_extraction_response(
+                extraction, search_query, total_time, search_time, index_size
             )
+            _result_cache.set(cache_key, response)
+            return response
         else:
             # Fallback to raw embedding results
             logger.info("Haiku extraction returned no results, using fallback")
             fallback = format_embedding_fallback(hits, max_results)
-            fallback += f"\n\n*Search completed in {total_time:.1f}s across {len(index.metadata)} indexed messages*"
+            fallback += f"\n\n*Search completed in {total_time:.1f}s across {index_size} indexed messages*"
             return {"content": [{"type": "text", "text": fallback}]}
 
     except Exception as e:
@@ -0,0 +1,205 @@
+"""
+Memory Dedupe Engine - MinHash/LSH near-duplicate detection for unified memories.
+
+Each memory's content + triggers are reduced to a set of word shingles
+(unigrams and bigrams) and summarized by a MinHash signature. Signatures are
+split into LSH bands; memories sharing any band bucket become candidate
+pairs, which are verified by estimated Jaccard similarity and grouped into
+clusters with union-find. Work is near-linear in the number of memories
+instead of all-pairs.
+
+Signatures are cached per agent with a content hash and updated
+incrementally from the memory mutation hooks, so a dedupe run only
+signs memories that are new or changed since the last one.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("mcp_tools.memory.dedupe")
+
+NUM_PERM = 128
+BANDS = 32                   # 32 bands x 4 rows: ~50% chance to pair at Jaccard 0.42
+ROWS = NUM_PERM // BANDS
+DEFAULT_THRESHOLD = 0.5      # Estimated Jaccard needed to report a pair
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD = re.compile(r"\w+")
+
+_perms = None
+
+
+def _permutations():
+    """Fixed (a, b) coefficients for NUM_PERM universal hash functions."""
+    global _perms
+    if _perms is None:
+        import numpy as np
+        rng = np.random.RandomState(1)
+        a = rng.randint(1, _MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+        b = rng.randint(0, _MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+        _perms = (a, b)
+    return _perms
+
+
+def memory_shingles(memory: Dict[str, Any]) -> set:
+    """Word unigram + bigram shingles over content and triggers."""
+    text = " ".join([memory.get("content", "")] + [str(t) for t in memory.get("triggers", [])])
+    words = _WORD.findall(text.lower())
+    shingles = set(words)
+    shingles.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return shingles
+
+
+def minhash(shingles: Iterable[str]):
+    """MinHash signature (uint32[NUM_PERM]) of a shingle set."""
+    import numpy as np
+
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64
+    )
+    if hashes.size == 0:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint32)
+    a, b = _permutations()
+    # (a * x + b) mod p, truncated to 32 bits; min over shingles per permutation
+    values = (hashes[:, None] * a[None, :] + b[None, :]) % _MERSENNE & _MAX_HASH
+    return values.min(axis=0).astype(np.uint32)
+
+
+def _content_hash(memory: Dict[str, Any]) -> str:
+    text = memory.get("content", "") + "\x00" + "\x00".join(str(t) for t in memory.get("triggers", []))
+    return hashlib.sha1(text.encode("utf-8", "replace")).hexdigest()
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+
+    def find(self, x: int) -> int:
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+
+class DedupeEngine:
+    """Per-agent cached MinHash signatures with LSH clustering."""
+
+    def __init__(self):
+        # agent -> memory_id -> (content_hash, signature)
+        self._signatures: Dict[str, Dict[int, Tuple[str, Any]]] = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def apply(self, agent: str, upserted: Iterable[Dict[str, Any]] = (), deleted: Iterable[int] = ()):
+        """Incrementally update an agent's signatures after a mutation."""
+        with self._lock:
+            sigs = self._signatures.get(agent)
+            if sigs is None:
+                # Never synced: the next sync() signs everything anyway
+                return
+            for mem_id in deleted:
+                sigs.pop(mem_id, None)
+            self._update_locked(sigs, upserted)
+
+    def sync(self, agent: str, memories: List[Dict[str, Any]]) -> int:
+        """Reconcile with an agent's full memory list. Returns how many memories were (re)signed."""
+        with self._lock:
+            sigs = self._signatures[agent]
+            present = {m["id"] for m in memories if "id" in m}
+            for mem_id in list(sigs):
+                if mem_id not in present:
+                    del sigs[mem_id]
+            return self._update_locked(sigs, memories)
+
+    @staticmethod
+    def _update_locked(sigs: Dict[int, Tuple[str, Any]], memories: Iterable[Dict[str, Any]]) -> int:
+        signed = 0
+        for memory in memories:
+            mem_id = memory.get("id")
+            if mem_id is None:
+                continue
+            content_hash = _content_hash(memory)
+            cached = sigs.get(mem_id)
+            if cached is not None and cached[0] == content_hash:
+                continue
+            sigs[mem_id] = (content_hash, minhash(memory_shingles(memory)))
+            signed += 1
+        return signed
+
+    def clusters(self, agent: str, threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+        """
+        Candidate duplicate clusters for an agent, most similar first.
+
+        Returns:
+            [{"ids": [...], "pairs": [(id_a, id_b, similarity), ...], "max_similarity": float}]
+        """
+        import numpy as np
+
+        with self._lock:
+            items = list(self._signatures.get(agent, {}).items())
+        if len(items) < 2:
+            return []
+
+        ids = [mem_id for mem_id, _ in items]
+        matrix = np.stack([sig for _, (_, sig) in items])
+
+        # LSH: memories sharing a band bucket become candidate pairs
+        candidates = set()
+        for band in range(BANDS):
+            buckets: Dict[bytes, List[int]] = defaultdict(list)
+            block = matrix[:, band * ROWS:(band + 1) * ROWS]
+            for row, key in enumerate(block):
+                buckets[key.tobytes()].append(row)
+            for rows in buckets.values():
+                if len(rows) > 1:
+                    for i, x in enumerate(rows):
+                        for y in rows[i + 1:]:
+                            candidates.add((x, y))
+
+        # Verify by estimated Jaccard (fraction of equal signature slots)
+        uf = _UnionFind()
+        pairs: List[Tuple[int, int, float]] = []
+        for x, y in candidates:
+            similarity = float(np.mean(matrix[x] == matrix[y]))
+            if similarity >= threshold:
+                pairs.append((ids[x], ids[y], similarity))
+                uf.union(ids[x], ids[y])
+
+        groups: Dict[int, Dict[str, Any]] = {}
+        for a, b, similarity in pairs:
+            group = groups.setdefault(uf.find(a), {"ids": set(), "pairs": [], "max_similarity": 0.0})
+            group["ids"].update((a, b))
+            group["pairs"].append((a, b, round(similarity, 3)))
+            group["max_similarity"] = max(group["max_similarity"], similarity)
+
+        result = []
+        for group in groups.values():
+            group["ids"] = sorted(group["ids"])
+            group["pairs"].sort(key=lambda p: p[2], reverse=True)
+            result.append(group)
+        result.sort(key=lambda g: (g["max_similarity"], len(g["ids"])), reverse=True)
+        return result
+
+
+_engine: Optional[DedupeEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_dedupe_engine() -> DedupeEngine:
+    """Get or create the process-wide dedupe engine."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = DedupeEngine()
+    return _engine
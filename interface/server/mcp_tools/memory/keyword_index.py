@@ -0,0 +1,156 @@
+"""
+Keyword Index - Prebuilt inverted index for the memory search keyword fallback.
+
+Scores exactly like the original per-memory scan (best over triggers):
+- 1.0  query is a substring of a trigger
+- 0.9  a trigger is a substring of the query
+- |query words ∩ trigger words| / max(|query words|, |trigger words|)
+- 0.5  query is a substring of the content
+
+but only touches candidate triggers/memories found through:
+- token → trigger postings (precomputed trigger token sets) for word overlap
+- an exact trigger-text map probed with every substring of a short query
+  (trigger inside query)
+- NUL-separated lowercased trigger and content blobs scanned with str.find
+  at C speed (query inside trigger/content), mapped back by offset
+
+Indexes are cached per (memory store, committed-write version), so they
+are rebuilt only after a write, and never serve a stale index in the
+window before the memories.json mirror is exported.
+"""
+
+import bisect
+from collections import Counter, defaultdict
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from cache_utils import LRUCache
+
+CACHE_ENTRIES = 64
+MAX_SUBSTRING_QUERY = 64  # Longer queries check triggers directly instead of enumerating substrings
+
+
+class KeywordIndex:
+    """Inverted trigger/content index over one agent's memories."""
+
+    def __init__(self, memories: List[Dict[str, Any]]):
+        self.memories: Dict[Any, Dict[str, Any]] = {}
+        self._trigger_mem: List[Any] = []            # trigger entry -> memory id
+        self._trigger_text: List[str] = []           # lowercased trigger
+        self._trigger_tokens: List[Set[str]] = []    # precomputed token set
+        self._by_trigger: Dict[str, List[int]] = defaultdict(list)  # exact trigger text -> entries
+        self._token_postings: Dict[str, List[int]] = defaultdict(list)
+        self._content_ids: List[Any] = []
+        self._content_starts: List[int] = []
+        contents: List[str] = []
+        offset = 0
+
+        for memory in memories:
+            mem_id = memory.get("id")
+            self.memories[mem_id] = memory
+            for trigger in memory.get("triggers", []):
+                tl = str(trigger).lower()
+                entry = len(self._trigger_mem)
+                self._trigger_mem.append(mem_id)
+                self._trigger_text.append(tl)
+                self._by_trigger[tl].append(entry)
+                tokens = set(tl.split())
+                self._trigger_tokens.append(tokens)
+                for token in tokens:
+                    self._token_postings[token].append(entry)
+            content = str(memory.get("content", "")).lower()
+            self._content_ids.append(mem_id)
+            self._content_starts.append(offset)
+            contents.append(content)
+            offset += len(content) + 1
+        # NUL-separated so a match can never span two items
+        self._content_blob = "\0".join(contents)
+        self._trigger_blob = "\0".join(self._trigger_text)
+        self._trigger_starts: List[int] = []
+        offset = 0
+        for tl in self._trigger_text:
+            self._trigger_starts.append(offset)
+            offset += len(tl) + 1
+
+    @staticmethod
+    def _find_all(blob: str, starts: List[int], needle: str):
+        """Yield the index of each item (by start offset) whose text contains needle."""
+        if "\0" in needle:
+            return
+        pos = blob.find(needle)
+        while pos != -1:
+            i = bisect.bisect_right(starts, pos) - 1
+            yield i
+            # Skip to the next item
+            if i + 1 >= len(starts):
+                return
+            pos = blob.find(needle, starts[i + 1])
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """(memory, score) pairs with score > 0, best first."""
+        query_lower = query.lower()
+        query_words = set(query_lower.split())
+        best: Dict[Any, float] = {}
+
+        def bump(mem_id, score: float):
+            if score > best.get(mem_id, 0.0):
+                best[mem_id] = score
+
+        # Substring scores take precedence over word overlap for the same trigger
+        substring_hit: Set[int] = set()
+
+        # Query inside trigger (1.0)
+        for entry in self._find_all(self._trigger_blob, self._trigger_starts, query_lower):
+            substring_hit.add(entry)
+            bump(self._trigger_mem[entry], 1.0)
+
+        # Trigger inside query (0.9)
+        if len(query_lower) <= MAX_SUBSTRING_QUERY:
+            # Look up every substring of the (short) query as an exact trigger
+            n = len(query_lower)
+            for i in range(n + 1):
+                for j in range(i, n + 1):
+                    for entry in self._by_trigger.get(query_lower[i:j], ()):
+                        substring_hit.add(entry)
+                        bump(self._trigger_mem[entry], 0.9)
+        else:
+            for entry, tl in enumerate(self._trigger_text):
+                if tl in query_lower:
+                    substring_hit.add(entry)
+                    bump(self._trigger_mem[entry], 0.9)
+
+        # Word overlap
+        overlaps = Counter(chain.from_iterable(self._token_postings.get(w, ()) for w in query_words))
+        for entry, overlap in overlaps.items():
+            if entry in substring_hit:
+                continue
+            bump(
+                self._trigger_mem[entry],
+                overlap / max(len(query_words), len(self._trigger_tokens[entry])),
+            )
+
+        # Query inside content (0.5)
+        for i in self._find_all(self._content_blob, self._content_starts, query_lower):
+            bump(self._content_ids[i], 0.5)
+
+        ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [(self.memories[mem_id], score) for mem_id, score in ranked]
+
+
+_cache = LRUCache(max_entries=CACHE_ENTRIES)
+
+
+def get_keyword_index(path: Path, version: Optional[int], memories: List[Dict[str, Any]]) -> KeywordIndex:
+    """
+    Cached index for an agent's memories, keyed on the store's version.
+
+    version must be read before memories were loaded (MemoryStore.version()),
+    so a concurrent write can only make the cached index newer than its key.
+    None skips the cache.
+    """
+    if version is None:
+        return KeywordIndex(memories)
+    return _cache.get_or_load((str(path), version), lambda: KeywordIndex(memories))
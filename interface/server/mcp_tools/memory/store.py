@@ -0,0 +1,424 @@
+"""
+Unified Memory Storage Engine
+
+Transactional SQLite backend (WAL mode) for each agent's memory store,
+replacing whole-file load → mutate → rewrite of memories.json.
+
+- AUTOINCREMENT IDs (no max() scan, never reused after delete)
+- Indexed always_load / private / type columns
+- FTS5 table over content + triggers, kept in sync by SQL triggers
+- BEGIN IMMEDIATE transactions, so concurrent agents serialize on the
+  database instead of racing on load → save
+
+memories.json stays the portable format: it is migrated into the database
+once, when the database is first created (import_json() re-imports
+deliberately). After that the database is the source of truth, and
+memories.json is a mirror for external readers (retrieval engine, system
+prompt builder, scripts): it is re-exported after commit, debounced by
+EXPORT_DEBOUNCE_SECONDS so a burst of writes costs one export, under the
+same atomic_file_ops lock those readers use. flush_mirror() exports now.
+
+Data: .claude/agents/{name}/memories.db (+ memories.json mirror)
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("mcp_tools.memory.store")
+
+try:
+    from atomic_file_ops import AtomicFileOperations as _atomic_ops
+except ImportError:  # .claude/scripts not on the path: plain temp file + rename
+    _atomic_ops = None
+
+EXPORT_DEBOUNCE_SECONDS = 2.0
+
+# Columns stored natively; any other keys round-trip through the `extra` JSON column
+_COLUMNS = ("id", "triggers", "content", "always_load", "private", "created", "updated", "confidence", "type")
+_UPDATABLE = ("content", "triggers", "always_load", "private", "confidence", "type")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    content     TEXT NOT NULL,
+    triggers    TEXT NOT NULL DEFAULT '[]',
+    always_load INTEGER NOT NULL DEFAULT 0,
+    private     INTEGER NOT NULL DEFAULT 0,
+    confidence  REAL,
+    type        TEXT,
+    created     TEXT,
+    updated     TEXT,
+    extra       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_memories_always_load ON memories(always_load);
+CREATE INDEX IF NOT EXISTS idx_memories_private ON memories(private);
+CREATE INDEX IF NOT EXISTS idx_memories_type ON memories(type);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+    content, triggers, content='memories', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS memories_ai AFTER INSERT ON memories BEGIN
+    INSERT INTO memories_fts(rowid, content, triggers) VALUES (new.id, new.content, new.triggers);
+END;
+CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
+    INSERT INTO memories_fts(memories_fts, rowid, content, triggers)
+    VALUES ('delete', old.id, old.content, old.triggers);
+END;
+CREATE TRIGGER IF NOT EXISTS memories_au AFTER UPDATE ON memories BEGIN
+    INSERT INTO memories_fts(memories_fts, rowid, content, triggers)
+    VALUES ('delete', old.id, old.content, old.triggers);
+    INSERT INTO memories_fts(rowid, content, triggers) VALUES (new.id, new.content, new.triggers);
+END;
+
+CREATE TABLE IF NOT EXISTS store_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _row_to_memory(row: sqlite3.Row) -> Dict[str, Any]:
+    """Convert a DB row into the memories.json dict shape."""
+    memory: Dict[str, Any] = {
+        "id": row["id"],
+        "triggers": json.loads(row["triggers"] or "[]"),
+        "content": row["content"],
+        "always_load": bool(row["always_load"]),
+        "private": bool(row["private"]),
+        "created": row["created"],
+        "updated": row["updated"],
+    }
+    if row["confidence"] is not None:
+        memory["confidence"] = row["confidence"]
+    if row["type"]:
+        memory["type"] = row["type"]
+    if row["extra"]:
+        memory.update(json.loads(row["extra"]))
+    return memory
+
+
+def _memory_to_params(memory: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a memory dict into named SQL parameters."""
+    extra = {k: v for k, v in memory.items() if k not in _COLUMNS}
+    return {
+        "id": memory.get("id"),
+        "content": memory.get("content", ""),
+        "triggers": json.dumps(memory.get("triggers", []), ensure_ascii=False),
+        "always_load": int(bool(memory.get("always_load", False))),
+        "private": int(bool(memory.get("private", False))),
+        "confidence": memory.get("confidence"),
+        "type": memory.get("type"),
+        "created": memory.get("created"),
+        "updated": memory.get("updated"),
+        "extra": json.dumps(extra, ensure_ascii=False) if extra else None,
+    }
+
+
+class MemoryStore:
+    """SQLite-backed memory store for one agent."""
+
+    def __init__(self, json_path: Path):
+        self.json_path = Path(json_path)
+        self.db_path = self.json_path.with_suffix(".db")
+        self.json_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, isolation_level=None, timeout=10
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.executescript(_SCHEMA)
+        self._in_txn = False
+
+        self._export_lock = threading.Lock()    # Guards the timer and dirty flag
+        self._write_lock = threading.Lock()     # Serializes mirror writes
+        self._export_timer: Optional[threading.Timer] = None
+        self._mirror_dirty = False
+
+        self._migrate_from_json()
+
+    # ── Transactions ──────────────────────────────────────────────────────────
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run a block of writes atomically (BEGIN IMMEDIATE … COMMIT).
+
+        Nested calls join the outer transaction. Each transaction bumps the
+        store version; the memories.json mirror is scheduled for export only
+        once the COMMIT has succeeded.
+        """
+        with self._lock:
+            if self._in_txn:
+                yield self._conn
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._in_txn = True
+            try:
+                yield self._conn
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._in_txn = False
+        self._schedule_export()
+
+    # ── JSON import / export ──────────────────────────────────────────────────
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._conn.execute(
+            "INSERT INTO store_meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def _bump_version(self):
+        self._conn.execute(
+            "INSERT INTO store_meta (key, value) VALUES ('version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def version(self) -> int:
+        """Committed-write counter (shared across processes; changes on every write)."""
+        with self._lock:
+            return int(self._get_meta("version") or 0)
+
+    def _migrate_from_json(self):
+        """One-time import of an existing memories.json into a new database."""
+        with self._lock:
+            # json_mtime: databases from before the one-time migration
+            if self._get_meta("json_migrated") or self._get_meta("json_mtime"):
+                return
+            data: List[Dict[str, Any]] = []
+            if self.json_path.exists():
+                try:
+                    data = json.loads(self.json_path.read_text(encoding="utf-8"))
+                except (OSError, json.JSONDecodeError) as e:
+                    # Leave the migration pending so a fixed file is picked up next start
+                    logger.error(f"Cannot import {self.json_path}: {e}")
+                    return
+                if not isinstance(data, list):
+                    data = []
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._replace_all_locked(data)
+                self._set_meta("json_migrated", "1")
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            if data:
+                logger.info(f"Migrated {len(data)} memories from {self.json_path}")
+
+    def import_json(self, path: Optional[Path] = None) -> int:
+        """Replace the store's contents with a memories.json file. Returns count imported."""
+        data = json.loads(Path(path or self.json_path).read_text(encoding="utf-8"))
+        if not isinstance(data, list):
+            raise ValueError("memories file must contain a JSON list")
+        with self.transaction():
+            self._replace_all_locked(data)
+        return len(data)
+
+    def export_json(self, path: Optional[Path] = None) -> Path:
+        """Write all committed memories to JSON atomically. Defaults to the mirror file."""
+        target = Path(path or self.json_path)
+        with self._write_lock:
+            if target == self.json_path:
+                with self._export_lock:
+                    self._mirror_dirty = False
+            memories = self.list()
+            if _atomic_ops is not None and _atomic_ops.save_json_safe(target, memories):
+                return target
+            tmp = target.with_name(f".{target.name}.tmp")
+            tmp.write_text(json.dumps(memories, indent=2, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, target)
+        return target
+
+    def _schedule_export(self):
+        """Export the mirror EXPORT_DEBOUNCE_SECONDS after the last commit."""
+        with self._export_lock:
+            self._mirror_dirty = True
+            if self._export_timer is not None:
+                self._export_timer.cancel()
+            self._export_timer = threading.Timer(EXPORT_DEBOUNCE_SECONDS, self.flush_mirror)
+            self._export_timer.daemon = True
+            self._export_timer.start()
+
+    def flush_mirror(self):
+        """Export memories.json now if commits are pending in the mirror."""
+        with self._export_lock:
+            if self._export_timer is not None:
+                self._export_timer.cancel()
+                self._export_timer = None
+            if not self._mirror_dirty:
+                return
+        try:
+            self.export_json()
+        except Exception as e:
+            logger.error(f"Failed to export {self.json_path}: {e}")
+
+    # ── Reads ─────────────────────────────────────────────────────────────────
+
+    def list(
+        self,
+        always_load: Optional[bool] = None,
+        private: Optional[bool] = None,
+        mem_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """All memories (ordered by ID), optionally filtered on indexed columns."""
+        clauses, params = [], []
+        if always_load is not None:
+            clauses.append("always_load = ?")
+            params.append(int(always_load))
+        if private is not None:
+            clauses.append("private = ?")
+            params.append(int(private))
+        if mem_type is not None:
+            clauses.append("type = ?")
+            params.append(mem_type)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM memories{where} ORDER BY id", params).fetchall()
+        return [_row_to_memory(r) for r in rows]
+
+    def get(self, mem_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM memories WHERE id = ?", (mem_id,)).fetchone()
+        return _row_to_memory(row) if row else None
+
+    def search_fts(self, query: str, limit: int = 20, include_private: bool = True) -> List[Dict[str, Any]]:
+        """BM25-ranked full-text search over content and triggers."""
+        tokens = re.findall(r"\w+", query.lower())
+        if not tokens:
+            return []
+        match = " OR ".join(f'"{t}"' for t in dict.fromkeys(tokens))
+        private_clause = "" if include_private else " AND m.private = 0"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT m.* FROM memories_fts f JOIN memories m ON m.id = f.rowid "
+                f"WHERE memories_fts MATCH ?{private_clause} ORDER BY bm25(memories_fts) LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [_row_to_memory(r) for r in rows]
+
+    # ── Writes ────────────────────────────────────────────────────────────────
+
+    def create(self, memory: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a memory; the ID is assigned by AUTOINCREMENT. Returns the stored memory."""
+        params = _memory_to_params({k: v for k, v in memory.items() if k != "id"})
+        with self.transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO memories (content, triggers, always_load, private, confidence, type, "
+                "created, updated, extra) VALUES (:content, :triggers, :always_load, :private, "
+                ":confidence, :type, :created, :updated, :extra)",
+                params,
+            )
+            return self.get(cur.lastrowid)
+
+    def update(self, mem_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply field changes to a memory. Returns the updated memory, or None if missing."""
+        with self.transaction():
+            current = self.get(mem_id)
+            if current is None:
+                return None
+            current.update(changes)
+            params = _memory_to_params(current)
+            self._conn.execute(
+                "UPDATE memories SET content = :content, triggers = :triggers, "
+                "always_load = :always_load, private = :private, confidence = :confidence, "
+                "type = :type, created = :created, updated = :updated, extra = :extra "
+                "WHERE id = :id",
+                params,
+            )
+            return self.get(mem_id)
+
+    def delete(self, mem_id: int) -> Optional[Dict[str, Any]]:
+        """Delete a memory. Returns the deleted memory, or None if missing."""
+        with self.transaction():
+            current = self.get(mem_id)
+            if current is None:
+                return None
+            self._conn.execute("DELETE FROM memories WHERE id = ?", (mem_id,))
+            return current
+
+    def replace_all(self, memories: List[Dict[str, Any]]):
+        """Make the store match a full memory list (compat path for list-based callers)."""
+        with self.transaction():
+            self._replace_all_locked(memories)
+
+    def _replace_all_locked(self, memories: List[Dict[str, Any]]):
+        """Diff-apply a full list inside an open transaction. IDs are preserved."""
+        existing = {r["id"]: r for r in self._conn.execute("SELECT * FROM memories")}
+        keep = set()
+        for memory in memories:
+            params = _memory_to_params(memory)
+            mem_id = params["id"]
+            if mem_id is None:
+                self._conn.execute(
+                    "INSERT INTO memories (content, triggers, always_load, private, confidence, "
+                    "type, created, updated, extra) VALUES (:content, :triggers, :always_load, "
+                    ":private, :confidence, :type, :created, :updated, :extra)",
+                    params,
+                )
+                continue
+            keep.add(mem_id)
+            row = existing.get(mem_id)
+            if row is not None and _memory_to_params(_row_to_memory(row)) == params:
+                continue
+            self._conn.execute(
+                "INSERT INTO memories (id, content, triggers, always_load, private, confidence, "
+                "type, created, updated, extra) VALUES (:id, :content, :triggers, :always_load, "
+                ":private, :confidence, :type, :created, :updated, :extra) "
+                "ON CONFLICT(id) DO UPDATE SET content = excluded.content, "
+                "triggers = excluded.triggers, always_load = excluded.always_load, "
+                "private = excluded.private, confidence = excluded.confidence, "
+                "type = excluded.type, created = excluded.created, updated = excluded.updated, "
+                "extra = excluded.extra",
+                params,
+            )
+        for mem_id in set(existing) - keep:
+            self._conn.execute("DELETE FROM memories WHERE id = ?", (mem_id,))
+
+
+# ── Store registry ────────────────────────────────────────────────────────────
+
+_stores: Dict[str, MemoryStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_memory_store(json_path: Path) -> MemoryStore:
+    """Get the (cached) store for a memories.json path."""
+    key = str(Path(json_path).resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = MemoryStore(Path(json_path))
+            _stores[key] = store
+        return store
+
+
+@atexit.register
+def _flush_mirrors():
+    """Write out any debounced memories.json exports before the process exits."""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush_mirror()
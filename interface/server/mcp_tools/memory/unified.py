@@ -1,23 +1,28 @@
 """
 Unified Memory MCP Tools
 
-Single JSON-backed store per agent with five tools:
+Single SQLite-backed store per agent (see store.py) with seven tools:
 - memory_create:       Create a new memory
 - memory_search:       Search your own memories
 - memory_update:       Update an existing memory by ID
 - memory_delete:       Delete a memory by ID
+- memory_batch:        Apply many create/update/delete operations atomically
+- memory_find_duplicates: Candidate near-duplicate clusters (MinHash/LSH)
 - memory_search_agent: Search another agent's non-private memories
 
-Data file: .claude/agents/{name}/memories.json
+Data file: .claude/agents/{name}/memories.db (memories.json kept as an exported mirror)
 """
 
+import asyncio
 import datetime
 import json
 import logging
 import os
 import sys
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 from claude_agent_sdk import tool
 
@@ -35,57 +40,57 @@ if SCRIPTS_DIR not in sys.path:
 
 CLAUDE_DIR = os.path.dirname(SCRIPTS_DIR)  # .claude/
 
-# Atomic file ops for crash-safe memory persistence
-from atomic_file_ops import AtomicFileOperations as _atomic_ops
+from .dedupe import DEFAULT_THRESHOLD as DEDUPE_THRESHOLD, get_dedupe_engine
+from .keyword_index import get_keyword_index
+from .store import MemoryStore, get_memory_store
+
+SEMANTIC_MIN_SCORE = 0.3  # Cosine floor for memory index search
+# Engines without per-memory upsert are re-indexed at most this often per agent.
+# The search tools read the memory index, so only auto-retrieval sees the lag.
+RETRIEVER_REINDEX_SECONDS = 60.0
+MAX_BATCH_OPERATIONS = 100
+UPDATABLE_FIELDS = ("content", "triggers", "always_load", "private", "confidence", "type")
 
 
 # ── Helpers ────────────────────────────────────────────────────────────────────
 
+def _agent_memories_path(agent_name: str) -> Path:
+    """Return the memories.json path for a named agent."""
+    return Path(CLAUDE_DIR) / "agents" / agent_name / "memories.json"
+
+
 def _resolve_memories_path(args: Dict[str, Any]) -> Path:
     """Return the memories.json path for the calling agent."""
-    agent_name = args.get("_agent_name") or "character"
-    return Path(CLAUDE_DIR) / "agents" / agent_name / "memories.json"
+    return _agent_memories_path(args.get("_agent_name") or "character")
 
 
 def _agent_label(args: Dict[str, Any]) -> str:
     return args.get("_agent_name") or "character"
 
 
+def _get_store(path: Path) -> MemoryStore:
+    """Return the transactional store backing a memories.json path."""
+    return get_memory_store(path)
+
+
+def _store_version(path: Path) -> Optional[int]:
+    """The store's committed-write version, or None if unavailable."""
+    try:
+        return _get_store(path).version()
+    except Exception as e:
+        logger.debug(f"Could not read store version for {path}: {e}")
+        return None
+
+
 def _load_memories(path: Path) -> List[Dict[str, Any]]:
-    """Load memories from JSON file with locking. Returns empty list if missing/invalid."""
-    if not path.exists():
-        return []
+    """Load all memories from the agent's store. Returns empty list on failure."""
     try:
-        data = _atomic_ops.load_json_safe(path, default=[])
-        return data if isinstance(data, list) else []
+        return _get_store(path).list()
     except Exception as e:
         logger.error(f"Failed to load {path}: {e}")
         return []
 
 
-def _save_memories(path: Path, memories: List[Dict[str, Any]]):
-    """Save memories atomically (temp file + rename + locking).
-
-    Uses atomic_file_ops to prevent data loss on crash/restart:
-    writes to a temp file first, then atomically renames into place.
-    """
-    if not _atomic_ops.save_json_safe(path, memories):
-        logger.error(f"Atomic save failed for {path}, falling back to direct write")
-        # Last-resort fallback — better than losing the data entirely
-        path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(
-            json.dumps(memories, indent=2, ensure_ascii=False),
-            encoding="utf-8",
-        )
-
-
-def _next_id(memories: List[Dict[str, Any]]) -> int:
-    """Get the next available ID."""
-    if not memories:
-        return 1
-    return max(m.get("id", 0) for m in memories) + 1
-
-
 def _now_iso() -> str:
     return datetime.datetime.now(datetime.timezone.utc).isoformat()
 
@@ -96,42 +101,95 @@ def _get_retriever():
     return get_retriever()
 
 
-def _reindex_agent(agent_name: Optional[str]):
-    """Re-index agent memories after a change."""
-    try:
-        retriever = _get_retriever()
-        retriever.index_agent_memory(agent_name)
-    except Exception as e:
-        logger.warning(f"Re-indexing failed for agent '{agent_name}': {e}")
+def _get_memory_index():
+    """Process-wide incremental memory index, with the retrieval engine hooked to its commits."""
+    from memory_index import get_memory_index
+    index = get_memory_index()
+    index.add_commit_listener(_sync_retriever)
+    return index
 
 
-def _error(msg: str) -> Dict[str, Any]:
-    return {"content": [{"type": "text", "text": msg}], "is_error": True}
-
+_reindex_lock = threading.Lock()
+_last_reindex: Dict[str, float] = {}
+_reindex_timers: Dict[str, threading.Timer] = {}
 
-def _simple_score(query: str, memory: Dict[str, Any]) -> float:
-    """Simple keyword-based scoring for fallback search."""
-    query_lower = query.lower()
-    query_words = set(query_lower.split())
-    best = 0.0
 
-    for trigger in memory.get("triggers", []):
-        tl = trigger.lower()
-        if query_lower in tl:
-            best = max(best, 1.0)
-        elif tl in query_lower:
-            best = max(best, 0.9)
-        else:
-            tw = set(tl.split())
-            overlap = len(query_words & tw)
-            if overlap:
-                best = max(best, overlap / max(len(query_words), len(tw)))
+def _reindex_retriever(agent_name: str):
+    with _reindex_lock:
+        _reindex_timers.pop(agent_name, None)
+        _last_reindex[agent_name] = time.monotonic()
+    try:
+        _get_retriever().index_agent_memory(agent_name)
+    except Exception as e:
+        logger.debug(f"Retrieval engine re-index failed for agent '{agent_name}': {e}")
+
+
+def _schedule_reindex(agent_name: str):
+    """Coalesce full re-indexes to one per RETRIEVER_REINDEX_SECONDS per agent."""
+    with _reindex_lock:
+        if agent_name in _reindex_timers:
+            return
+        wait = _last_reindex.get(agent_name, float("-inf")) + RETRIEVER_REINDEX_SECONDS - time.monotonic()
+        if wait > 0:
+            timer = threading.Timer(wait, _reindex_retriever, args=(agent_name,))
+            timer.daemon = True
+            _reindex_timers[agent_name] = timer
+            timer.start()
+            return
+    _reindex_retriever(agent_name)
+
+
+def _sync_retriever(agent_name: str, upserted: List[int], deleted: List[int]):
+    """Apply one debounced index commit to the retrieval engine.
+
+    Uses per-memory upsert/delete when the engine supports them. Otherwise
+    the agent is re-indexed in full, at most once per
+    RETRIEVER_REINDEX_SECONDS.
+    """
+    retriever = _get_retriever()
+    upsert = getattr(retriever, "upsert_memory", None)
+    remove = getattr(retriever, "delete_memory", None)
+    if upsert is None or remove is None:
+        _schedule_reindex(agent_name)
+        return
+    if upserted:
+        store = _get_store(_agent_memories_path(agent_name))
+        for mem_id in upserted:
+            memory = store.get(mem_id)
+            if memory is not None:
+                upsert(agent_name, memory)
+    for mem_id in deleted:
+        remove(agent_name, mem_id)
+
+
+def _index_changes(
+    agent_name: Optional[str],
+    upserted: Iterable[Dict[str, Any]] = (),
+    deleted: Iterable[int] = (),
+):
+    """Queue changed memories for the next debounced background index commit."""
+    agent = agent_name or "character"
+    upserted, deleted = list(upserted), list(deleted)
+    try:
+        get_dedupe_engine().apply(agent, upserted, deleted)
+    except Exception as e:
+        logger.debug(f"Dedupe signature update failed for agent '{agent}': {e}")
+    try:
+        from retrieval_cache import get_retrieval_cache
+        get_retrieval_cache().invalidate_agent(agent)
+    except Exception as e:
+        logger.debug(f"Retrieval cache invalidation failed for agent '{agent}': {e}")
+    try:
+        index = _get_memory_index()
+        index.enqueue_upsert(agent, upserted)
+        index.enqueue_delete(agent, deleted)
+        index.note_store_write(agent, _get_store(_agent_memories_path(agent)).version())
+    except Exception as e:
+        logger.warning(f"Queueing index update failed for agent '{agent}': {e}")
 
-    # Content substring match (lower weight)
-    if query_lower in memory.get("content", "").lower():
-        best = max(best, 0.5)
 
-    return best
+def _error(msg: str) -> Dict[str, Any]:
+    return {"content": [{"type": "text", "text": msg}], "is_error": True}
 
 
 def _format_brief(m: Dict[str, Any], score: float = 0.0) -> str:
@@ -263,11 +321,9 @@ async def memory_create(args: Dict[str, Any]) -> Dict[str, Any]:
             return _error("Maximum 7 trigger phrases allowed")
 
         path = _resolve_memories_path(args)
-        memories = _load_memories(path)
 
         now = _now_iso()
         memory: Dict[str, Any] = {
-            "id": _next_id(memories),
             "triggers": triggers,
             "content": content,
             "always_load": always_load,
@@ -280,9 +336,8 @@ async def memory_create(args: Dict[str, Any]) -> Dict[str, Any]:
         if mem_type:
             memory["type"] = mem_type
 
-        memories.append(memory)
-        _save_memories(path, memories)
-        _reindex_agent(agent_name)
+        memory = _get_store(path).create(memory)
+        _index_changes(agent_name, upserted=[memory])
 
         trigger_str = ", ".join(f'"{t}"' for t in triggers)
         al_str = " [always_load]" if always_load else ""
@@ -344,44 +399,52 @@ async def memory_search(args: Dict[str, Any]) -> Dict[str, Any]:
             return _error("query is required")
 
         path = _resolve_memories_path(args)
+        version = _store_version(path)
         memories = _load_memories(path)
 
         if not memories:
             return {"content": [{"type": "text", "text": "No memories yet. Use memory_create to save your first memory."}]}
 
-        # Try hybrid search via retrieval engine
+        # The incremental memory index is kept current per commit, so it goes first
         scored: List[tuple] = []  # [(memory_dict, score)]
         used_engine = False
+        mem_by_id = {m["id"]: m for m in memories}
 
         try:
-            retriever = _get_retriever()
-            response = retriever.retrieve(
-                query=query,
-                agent_name=agent_name,
-                budget_tokens=999999,
-                min_score=0.1,
-            )
-            results = response.loaded + response.overflow
-            if results:
-                used_engine = True
+            index = _get_memory_index()
+            agent = agent_name or "character"
+            await asyncio.to_thread(_ensure_index_synced, index, agent)
+            for mem_id, score in index.search(query, agent, k=max_results):
+                if score >= SEMANTIC_MIN_SCORE and mem_id in mem_by_id:
+                    scored.append((mem_by_id[mem_id], score))
+            used_engine = bool(scored)
+        except Exception as e:
+            logger.debug(f"Memory index unavailable, trying retrieval engine: {e}")
+
+        # Fallback 1: hybrid search via the retrieval engine
+        if not used_engine:
+            try:
+                retriever = _get_retriever()
+                response = retriever.retrieve(
+                    query=query,
+                    agent_name=agent_name,
+                    budget_tokens=999999,
+                    min_score=0.1,
+                )
+                results = response.loaded + response.overflow
                 results.sort(key=lambda r: r.score, reverse=True)
                 # Map results back to memory dicts by ID
-                mem_by_id = {m["id"]: m for m in memories}
                 for r in results[:max_results]:
                     mem_id = r.file.frontmatter.get("id")
                     if mem_id and mem_id in mem_by_id:
                         scored.append((mem_by_id[mem_id], r.score))
-        except Exception as e:
-            logger.debug(f"Retrieval engine unavailable, using fallback: {e}")
+                used_engine = bool(scored)
+            except Exception as e:
+                logger.debug(f"Retrieval engine unavailable, using keyword fallback: {e}")
 
-        # Fallback: simple keyword search
+        # Fallback 2: keyword search over the cached inverted index
         if not used_engine:
-            for m in memories:
-                s = _simple_score(query, m)
-                if s > 0:
-                    scored.append((m, s))
-            scored.sort(key=lambda x: x[1], reverse=True)
-            scored = scored[:max_results]
+            scored = get_keyword_index(path, version, memories).search(query, limit=max_results)
 
         if not scored:
             return {"content": [{"type": "text", "text": f'No memories matching "{query}".'}]}
@@ -462,19 +525,6 @@ async def memory_update(args: Dict[str, Any]) -> Dict[str, Any]:
             return _error("id is required")
 
         path = _resolve_memories_path(args)
-        memories = _load_memories(path)
-
-        # Find the memory
-        target_idx = None
-        for i, m in enumerate(memories):
-            if m.get("id") == mem_id:
-                target_idx = i
-                break
-
-        if target_idx is None:
-            return _error(f"Memory #{mem_id} not found")
-
-        target = memories[target_idx]
 
         # Handle triggers as JSON string (from MCP layer) or list
         if "triggers" in args and isinstance(args["triggers"], str):
@@ -484,22 +534,23 @@ async def memory_update(args: Dict[str, Any]) -> Dict[str, Any]:
                 args["triggers"] = [args["triggers"]]
 
         # Apply updates (only fields that are explicitly passed)
-        changed = []
-        updatable = ["content", "triggers", "always_load", "private", "confidence", "type"]
-        for field in updatable:
-            if field in args and args[field] is not None:
-                target[field] = args[field]
-                changed.append(field)
+        changes = {
+            field: args[field]
+            for field in UPDATABLE_FIELDS
+            if field in args and args[field] is not None
+        }
+        changed = list(changes)
 
         if not changed:
             return _error("No fields to update. Provide at least one field to change.")
 
-        target["updated"] = _now_iso()
-        memories[target_idx] = target
-        _save_memories(path, memories)
+        changes["updated"] = _now_iso()
+        target = _get_store(path).update(mem_id, changes)
+        if target is None:
+            return _error(f"Memory #{mem_id} not found")
 
-        # Re-index (triggers or content may have changed)
-        _reindex_agent(agent_name)
+        # Re-index (triggers or content may have changed; unchanged text is not re-embedded)
+        _index_changes(agent_name, upserted=[target])
 
         logger.info(f"[{author}] memory_update: #{mem_id} changed {changed}")
         return {"content": [{"type": "text", "text": f"Updated memory #{mem_id}: {', '.join(changed)}\n\n{_format_brief(target)}"}]}
@@ -538,21 +589,12 @@ async def memory_delete(args: Dict[str, Any]) -> Dict[str, Any]:
             return _error("id is required")
 
         path = _resolve_memories_path(args)
-        memories = _load_memories(path)
-
-        target = None
-        new_memories = []
-        for m in memories:
-            if m.get("id") == mem_id:
-                target = m
-            else:
-                new_memories.append(m)
+        target = _get_store(path).delete(mem_id)
 
         if target is None:
             return _error(f"Memory #{mem_id} not found")
 
-        _save_memories(path, new_memories)
-        _reindex_agent(agent_name)
+        _index_changes(agent_name, deleted=[mem_id])
 
         triggers = ", ".join(f'"{t}"' for t in target.get("triggers", []))
         snippet = target.get("content", "")[:100]
@@ -565,6 +607,358 @@ async def memory_delete(args: Dict[str, Any]) -> Dict[str, Any]:
         return _error(f"Error deleting memory: {e}")
 
 
+# ── memory_batch ───────────────────────────────────────────────────────────────
+
+class _BatchAborted(Exception):
+    """Raised inside the batch transaction to roll back every operation."""
+
+
+def _parse_triggers(value: Any) -> Any:
+    """Accept triggers as a list or a JSON string (from the MCP layer)."""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return [value]
+    return value
+
+
+def _validate_batch_op(op: Dict[str, Any]) -> Optional[str]:
+    """Return an error message for a malformed operation, or None."""
+    kind = op.get("op")
+    if kind not in ("create", "update", "delete"):
+        return f"unknown op {kind!r} (expected create, update or delete)"
+    if kind in ("update", "delete") and op.get("id") is None:
+        return "id is required"
+    if op.get("content") is not None:
+        if not isinstance(op["content"], str):
+            return "content must be a string"
+        if not op["content"].strip():
+            return "content cannot be empty"
+    if "triggers" in op:
+        triggers = op["triggers"]
+        if not isinstance(triggers, list) or not triggers:
+            return "At least 1 trigger phrase is required"
+        if len(triggers) > 7:
+            return "Maximum 7 trigger phrases allowed"
+    if kind == "create":
+        if not (op.get("content") or "").strip():
+            return "content is required"
+        if "triggers" not in op:
+            return "At least 1 trigger phrase is required"
+    if kind == "update" and not any(op.get(f) is not None for f in UPDATABLE_FIELDS):
+        return "No fields to update"
+    return None
+
+
+@register_tool("memory")
+@tool(
+    name="memory_batch",
+    description="""Apply many memory create/update/delete operations in one call.
+
+All operations run in a single transaction: either every operation is applied or none are.
+Use this for bulk maintenance (merging, re-tagging, pruning) instead of one call per memory.
+
+Each operation is an object with "op" ("create", "update" or "delete") plus the same fields
+as memory_create / memory_update / memory_delete. Returns a result line per operation.""",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "operations": {
+                "type": "array",
+                "description": f"Operations to apply, in order (max {MAX_BATCH_OPERATIONS}).",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "op": {"type": "string", "enum": ["create", "update", "delete"]},
+                        "id": {"type": "integer", "description": "Memory ID (update/delete)."},
+                        "content": {"type": "string"},
+                        "triggers": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "minItems": 1,
+                            "maxItems": 7,
+                        },
+                        "always_load": {"type": "boolean"},
+                        "private": {"type": "boolean"},
+                        "confidence": {"type": "number", "minimum": 0.0, "maximum": 1.0},
+                        "type": {"type": "string"},
+                    },
+                    "required": ["op"],
+                },
+                "minItems": 1,
+            },
+        },
+        "required": ["operations"],
+    },
+)
+async def memory_batch(args: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply a list of memory operations atomically."""
+    try:
+        operations = args.get("operations", [])
+        agent_name = args.get("_agent_name")
+        author = _agent_label(args)
+
+        if isinstance(operations, str):
+            try:
+                operations = json.loads(operations)
+            except json.JSONDecodeError:
+                return _error("operations must be a list of operation objects")
+        if not isinstance(operations, list) or not operations:
+            return _error("operations must be a non-empty list")
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return _error(f"Maximum {MAX_BATCH_OPERATIONS} operations per batch")
+
+        ops: List[Dict[str, Any]] = []
+        errors: List[str] = []
+        for i, raw in enumerate(operations, 1):
+            op = dict(raw) if isinstance(raw, dict) else {}
+            if "triggers" in op:
+                op["triggers"] = _parse_triggers(op["triggers"])
+            err = _validate_batch_op(op) if op else "operation must be an object"
+            if err:
+                errors.append(f"{i}. {op.get('op', '?')}: {err}")
+            ops.append(op)
+        if errors:
+            return _error("Batch rejected, nothing applied:\n" + "\n".join(errors))
+
+        path = _resolve_memories_path(args)
+        store = _get_store(path)
+        now = _now_iso()
+        results: List[str] = []
+        upserted: Dict[int, Dict[str, Any]] = {}
+        deleted: List[int] = []
+
+        try:
+            with store.transaction():
+                for i, op in enumerate(ops, 1):
+                    kind = op["op"]
+                    if kind == "create":
+                        memory: Dict[str, Any] = {
+                            "triggers": op["triggers"],
+                            "content": op["content"].strip(),
+                            "always_load": op.get("always_load", False),
+                            "private": op.get("private", False),
+                            "created": now,
+                            "updated": now,
+                        }
+                        if op.get("confidence") is not None:
+                            memory["confidence"] = op["confidence"]
+                        if op.get("type"):
+                            memory["type"] = op["type"]
+                        memory = store.create(memory)
+                        upserted[memory["id"]] = memory
+                        results.append(f"{i}. create → #{memory['id']}")
+                    elif kind == "update":
+                        changes = {f: op[f] for f in UPDATABLE_FIELDS if op.get(f) is not None}
+                        changes["updated"] = now
+                        target = store.update(op["id"], changes)
+                        if target is None:
+                            results.append(f"{i}. update #{op['id']}: not found")
+                            raise _BatchAborted()
+                        upserted[target["id"]] = target
+                        results.append(f"{i}. update #{op['id']}: {', '.join(c for c in changes if c != 'updated')}")
+                    else:
+                        target = store.delete(op["id"])
+                        if target is None:
+                            results.append(f"{i}. delete #{op['id']}: not found")
+                            raise _BatchAborted()
+                        upserted.pop(op["id"], None)
+                        deleted.append(op["id"])
+                        results.append(f"{i}. delete #{op['id']}")
+        except _BatchAborted:
+            return _error(
+                "Batch rolled back, nothing applied:\n"
+                + "\n".join(results)
+                + f"\n({len(ops) - len(results)} later operation(s) not attempted)"
+            )
+
+        # One debounced index commit for the whole batch
+        _index_changes(agent_name, upserted=upserted.values(), deleted=deleted)
+
+        logger.info(f"[{author}] memory_batch: {len(ops)} ops ({len(upserted)} upserted, {len(deleted)} deleted)")
+        lines = [f"Applied {len(ops)} operation{'s' if len(ops) != 1 else ''}:"] + results
+        return {"content": [{"type": "text", "text": "\n".join(lines)}]}
+
+    except Exception as e:
+        import traceback
+        logger.error(f"memory_batch error: {e}\n{traceback.format_exc()}")
+        return _error(f"Error applying memory batch: {e}")
+
+
+def _has_memory_store(agent_name: str) -> bool:
+    """Does the agent have a unified memory store (database or JSON mirror)?"""
+    path = _agent_memories_path(agent_name)
+    return path.exists() or path.with_suffix(".db").exists()
+
+
+def _ensure_index_synced(index, agent_name: str):
+    """Re-sync an agent into the memory index if its store changed since the last sync.
+
+    Keyed on the store's committed-write version, so writes that bypass the
+    mutation hooks (e.g. from other processes) are picked up too. Writes
+    already queued by the mutation hooks (_index_changes) keep the agent
+    synced; their queue is committed before the search instead.
+    """
+    store = _get_store(_agent_memories_path(agent_name))
+    version = store.version()
+    if not index.is_synced(agent_name, version):
+        index.sync_agent(agent_name, store.list(), version)
+    elif index.has_pending(agent_name):
+        index.flush()
+
+
+def _federated_search(query: str, agents: List[str], k: int) -> List[tuple]:
+    """Global top-k (agent, memory, score) over the agents' non-private memories.
+
+    Only agents with a unified memory store are indexed; callers search the
+    rest (e.g. md-only memory/ directories) per agent. Blocking: run it in a
+    worker thread.
+    """
+    agents = [a for a in agents if _has_memory_store(a)]
+    if not agents:
+        return []
+    index = _get_memory_index()
+    for agent in agents:
+        _ensure_index_synced(index, agent)
+
+    results = []
+    for agent, mem_id, score in index.search_federated(query, k=k, agents=agents):
+        if score < SEMANTIC_MIN_SCORE:
+            continue
+        # Point lookup; re-check privacy in case a flag change is still queued
+        memory = _get_store(_agent_memories_path(agent)).get(mem_id)
+        if memory is not None and not memory.get("private", False):
+            results.append((agent, memory, score))
+    return results
+
+
+def _search_agent_fallback(query: str, agent_name: str) -> List[tuple]:
+    """(agent, memory, score) for one agent via the retrieval engine, else a keyword scan."""
+    results: List[tuple] = []
+    try:
+        retriever = _get_retriever()
+        response = retriever.retrieve(
+            query=query,
+            agent_name=agent_name,
+            budget_tokens=999999,
+            min_score=0.1,
+        )
+        # Map back to memory dicts
+        json_path = _agent_memories_path(agent_name)
+        mem_by_id = {}
+        if _has_memory_store(agent_name):
+            mems = _load_memories(json_path)
+            mem_by_id = {m["id"]: m for m in mems}
+
+        for result in response.loaded + response.overflow:
+            fm = result.file.frontmatter
+            if fm.get("private", False):
+                continue
+            mem_id = fm.get("id")
+            mem_dict = mem_by_id.get(mem_id) if mem_id else None
+            if mem_dict:
+                results.append((agent_name, mem_dict, result.score))
+            else:
+                # Construct from MemoryFile (for .md file fallback during migration)
+                synthetic = {
+                    "id": mem_id or "?",
+                    "triggers": result.file.triggers,
+                    "content": result.file.content,
+                    "always_load": fm.get("always_load", False),
+                    "private": False,
+                }
+                results.append((agent_name, synthetic, result.score))
+        return results
+    except Exception as e:
+        logger.debug(f"Retrieval engine failed for {agent_name}: {e}")
+
+    # Fallback: direct JSON scan
+    json_path = _agent_memories_path(agent_name)
+    if _has_memory_store(agent_name):
+        version = _store_version(json_path)
+        mems = _load_memories(json_path)
+        for m, s in get_keyword_index(json_path, version, mems).search(query):
+            if not m.get("private", False):
+                results.append((agent_name, m, s))
+    return results
+
+
+# ── memory_find_duplicates ─────────────────────────────────────────────────────
+
+@register_tool("memory")
+@tool(
+    name="memory_find_duplicates",
+    description="""Find clusters of near-duplicate memories in your store.
+
+Uses MinHash/LSH over content and triggers, so it scales to thousands of memories.
+Returns candidate clusters with pairwise similarity; review each cluster and merge
+or delete with memory_batch. Similarity is estimated word-overlap (Jaccard), not meaning.""",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "threshold": {
+                "type": "number",
+                "description": f"Minimum estimated similarity to report (default: {DEDUPE_THRESHOLD}).",
+                "minimum": 0.1,
+                "maximum": 1.0,
+            },
+            "max_clusters": {
+                "type": "integer",
+                "description": "Maximum clusters to return (default: 20).",
+                "default": 20,
+            },
+            "detail": {
+                "type": "string",
+                "enum": ["brief", "full"],
+                "description": '"brief" (default) or "full" for complete content.',
+                "default": "brief",
+            },
+        },
+    },
+)
+async def memory_find_duplicates(args: Dict[str, Any]) -> Dict[str, Any]:
+    """List candidate duplicate clusters for the calling agent."""
+    try:
+        threshold = float(args.get("threshold") or DEDUPE_THRESHOLD)
+        max_clusters = args.get("max_clusters", 20)
+        detail = args.get("detail", "brief")
+        agent = args.get("_agent_name") or "character"
+
+        path = _resolve_memories_path(args)
+        memories = _load_memories(path)
+        if len(memories) < 2:
+            return {"content": [{"type": "text", "text": "Not enough memories to compare."}]}
+
+        engine = get_dedupe_engine()
+        signed = engine.sync(agent, memories)
+        clusters = engine.clusters(agent, threshold=threshold)
+
+        if not clusters:
+            return {"content": [{"type": "text", "text": f"No near-duplicates at similarity ≥ {threshold:.2f} across {len(memories)} memories."}]}
+
+        mem_by_id = {m["id"]: m for m in memories}
+        lines = [f"## Duplicate Candidates ({len(clusters)} cluster{'s' if len(clusters) != 1 else ''}, similarity ≥ {threshold:.2f})\n"]
+        for n, cluster in enumerate(clusters[:max_clusters], 1):
+            pair_str = ", ".join(f"#{a}~#{b} {sim:.2f}" for a, b, sim in cluster["pairs"][:5])
+            lines.append(f"### Cluster {n}: {len(cluster['ids'])} memories ({pair_str})")
+            for mem_id in cluster["ids"]:
+                m = mem_by_id.get(mem_id)
+                if m is not None:
+                    lines.append(_format_full(m) if detail == "full" else _format_brief(m))
+            lines.append("")
+
+        if len(clusters) > max_clusters:
+            lines.append(f"*{len(clusters) - max_clusters} more cluster(s) not shown*")
+        logger.info(f"[{agent}] memory_find_duplicates: {len(clusters)} clusters ({signed} re-signed)")
+        return {"content": [{"type": "text", "text": "\n".join(lines)}]}
+
+    except Exception as e:
+        import traceback
+        logger.error(f"memory_find_duplicates error: {e}\n{traceback.format_exc()}")
+        return _error(f"Error finding duplicates: {e}")
+
+
 # ── memory_search_agent ────────────────────────────────────────────────────────
 
 @register_tool("memory")
@@ -625,55 +1019,19 @@ async def memory_search_agent(args: Dict[str, Any]) -> Dict[str, Any]:
 
         all_results: List[tuple] = []  # (agent_name, memory_dict, score)
 
-        for agent_name in agents_to_search:
-            # Try retrieval engine first
-            try:
-                retriever = _get_retriever()
-                response = retriever.retrieve(
-                    query=query,
-                    agent_name=agent_name,
-                    budget_tokens=999999,
-                    min_score=0.1,
-                )
-                # Map back to memory dicts
-                json_path = Path(CLAUDE_DIR) / "agents" / agent_name / "memories.json"
-                mem_by_id = {}
-                if json_path.exists():
-                    mems = _load_memories(json_path)
-                    mem_by_id = {m["id"]: m for m in mems}
-
-                for result in response.loaded + response.overflow:
-                    fm = result.file.frontmatter
-                    if fm.get("private", False):
-                        continue
-                    mem_id = fm.get("id")
-                    mem_dict = mem_by_id.get(mem_id) if mem_id else None
-                    if mem_dict:
-                        all_results.append((agent_name, mem_dict, result.score))
-                    else:
-                        # Construct from MemoryFile (for .md file fallback during migration)
-                        synthetic = {
-                            "id": mem_id or "?",
-                            "triggers": result.file.triggers,
-                            "content": result.file.content,
-                            "always_load": fm.get("always_load", False),
-                            "private": False,
-                        }
-                        all_results.append((agent_name, synthetic, result.score))
-                continue
-            except Exception as e:
-                logger.debug(f"Retrieval engine failed for {agent_name}: {e}")
-
-            # Fallback: direct JSON scan
-            json_path = Path(CLAUDE_DIR) / "agents" / agent_name / "memories.json"
-            if json_path.exists():
-                mems = _load_memories(json_path)
-                for m in mems:
-                    if m.get("private", False):
-                        continue
-                    s = _simple_score(query, m)
-                    if s > 0:
-                        all_results.append((agent_name, m, s))
+        # Federated index: one query, one global top-k across all indexed agents
+        fallback_agents = agents_to_search
+        try:
+            all_results = await asyncio.to_thread(_federated_search, query, agents_to_search, max_results)
+        except Exception as e:
+            logger.debug(f"Federated memory index unavailable: {e}")
+        if all_results:
+            # Agents outside the index (md-only memory/ dirs) are still searched one by one
+            fallback_agents = [a for a in agents_to_search if not _has_memory_store(a)]
+
+        # Per-agent fallback: retrieval engine, then keyword scan
+        for agent_name in fallback_agents:
+            all_results.extend(_search_agent_fallback(query, agent_name))
 
         # Sort by score
         all_results.sort(key=lambda x: x[2], reverse=True)
@@ -24,11 +24,10 @@ _CLAUDE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../
 
 
 def _get_agent_store(args: Dict[str, Any]):
-    """Extract agent name from args and return the appropriate store."""
-    sys.path.insert(0, SCRIPTS_DIR)
-    from working_memory import get_store
+    """Extract agent name from args and return the shared working memory service."""
+    from working_memory_service import get_working_memory_service
     agent_name = args.pop("_agent_name", None) or "character"
-    return get_store(agent_name=agent_name), agent_name
+    return get_working_memory_service(), agent_name
 
 
 @register_tool("memory")
@@ -91,6 +90,7 @@ async def working_memory_add(args: Dict[str, Any]) -> Dict[str, Any]:
                 return {"content": [{"type": "text", "text": f"Invalid deadline format: {e}"}], "is_error": True}
 
         item = store.add_item(
+            agent_name,
             content=content,
             tag=tag,
             ttl=ttl,
@@ -153,6 +153,7 @@ async def working_memory_update(args: Dict[str, Any]) -> Dict[str, Any]:
                 return {"content": [{"type": "text", "text": f"Invalid deadline format: {e}"}], "is_error": True}
 
         item = store.update_item(
+            agent_name,
             index=index,
             new_content=args.get("content"),
             append=args.get("append"),
@@ -192,7 +193,7 @@ async def working_memory_remove(args: Dict[str, Any]) -> Dict[str, Any]:
         if not index or index < 1:
             return {"content": [{"type": "text", "text": "Valid index (1+) is required"}], "is_error": True}
 
-        removed = store.remove_item(index)
+        removed = store.remove_item(agent_name, index=index)
 
         return {"content": [{"type": "text", "text": f"Removed: {removed.content[:80]}..."}]}
 
@@ -210,7 +211,7 @@ async def working_memory_list(args: Dict[str, Any]) -> Dict[str, Any]:
     """List working memory items."""
     try:
         store, agent_name = _get_agent_store(args)
-        items = store.list_items()
+        items = store.list_items(agent_name)
 
         if not items:
             return {"content": [{"type": "text", "text": "Working memory is empty."}]}
@@ -275,7 +276,7 @@ async def working_memory_snapshot(args: Dict[str, Any]) -> Dict[str, Any]:
             return {"content": [{"type": "text", "text": "Valid index (1+) is required"}], "is_error": True}
 
         # Get the working memory item
-        items = store.list_items()
+        items = store.list_items(agent_name)
 
         if not items:
             return {"content": [{"type": "text", "text": "Working memory is empty."}], "is_error": True}
@@ -294,18 +295,14 @@ async def working_memory_snapshot(args: Dict[str, Any]) -> Dict[str, Any]:
         if item.tag:
             content = f"[{item.tag}] {content}"
 
-        # Save to memories.json using unified memory helpers (atomic writes + locking)
-        from .unified import _load_memories, _save_memories, _next_id, _now_iso, _reindex_agent
+        # Save to the unified memory store (transactional, ID assigned by the store)
+        from .unified import _get_store, _now_iso, _index_changes
 
         agent_name = agent_name or "character"
         memories_path = Path(_CLAUDE_DIR) / "agents" / agent_name / "memories.json"
 
-        memories = _load_memories(memories_path)
-
         now = _now_iso()
-        next_id = _next_id(memories)
-        new_memory = {
-            "id": next_id,
+        new_memory = _get_store(memories_path).create({
             "triggers": [section, content[:60]],
             "content": content,
             "always_load": True,
@@ -313,20 +310,15 @@ async def working_memory_snapshot(args: Dict[str, Any]) -> Dict[str, Any]:
             "created": now,
             "updated": now,
             "type": "observation",
-        }
-
-        memories.append(new_memory)
-
-        # Atomic save (temp file + rename + locking) and reindex for search
-        memories_path.parent.mkdir(parents=True, exist_ok=True)
-        _save_memories(memories_path, memories)
-        _reindex_agent(agent_name)
+        })
+        next_id = new_memory["id"]
+        _index_changes(agent_name, upserted=[new_memory])
 
         result = f"Promoted to permanent memory #{next_id} [always_load]: {content[:80]}..."
 
         # Remove from working memory unless keep=true
         if not keep:
-            store.remove_item(index)
+            store.remove_item(agent_name, index=index)
             result += "\nRemoved from working memory."
         else:
             result += "\nKept in working memory."
@@ -18,6 +18,15 @@ if SCRIPTS_DIR not in sys.path:
     sys.path.insert(0, SCRIPTS_DIR)
 
 
+def _rearm():
+    """Wake the server's task scheduler so an edit takes effect immediately."""
+    try:
+        from task_scheduler import rearm_scheduler
+        rearm_scheduler()
+    except Exception:
+        pass
+
+
 @register_tool("scheduler")
 @tool(
     name="schedule_self",
@@ -70,6 +79,7 @@ async def schedule_self(args: Dict[str, Any]) -> Dict[str, Any]:
             prompt, schedule, silent=silent, task_type="agent",
             agent=effective_agent, room_id=room_id
         )
+        _rearm()
 
         return {"content": [{"type": "text", "text": result}]}
 
@@ -135,6 +145,7 @@ async def scheduler_update(args: Dict[str, Any]) -> Dict[str, Any]:
             prompt=args.get("prompt"),
             room_id=args.get("room_id")
         )
+        _rearm()
         return {"content": [{"type": "text", "text": result}]}
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Error: {str(e)}"}], "is_error": True}
@@ -160,6 +171,7 @@ async def scheduler_remove(args: Dict[str, Any]) -> Dict[str, Any]:
         if not task_id:
             return {"content": [{"type": "text", "text": "task_id is required"}], "is_error": True}
         result = scheduler_tool.remove_task(task_id)
+        _rearm()
         return {"content": [{"type": "text", "text": result}]}
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Error: {str(e)}"}], "is_error": True}
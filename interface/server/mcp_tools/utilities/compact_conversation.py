@@ -10,6 +10,7 @@ decisions, facts, action items, tool results, and conversational flow.
 
 import os
 import sys
+import time
 import uuid
 import logging
 from datetime import datetime
@@ -102,19 +103,28 @@ def _format_messages_for_summary(messages: List[Dict]) -> str:
     return "\n\n".join(parts)
 
 
-async def _summarize_messages(messages: List[Dict]) -> str:
+async def _summarize_messages(messages: List[Dict], use_cache: bool = True) -> str:
     """
     Run the compaction subagent to summarize older messages.
 
     Uses Sonnet via the Claude Agent SDK for speed and cost efficiency.
-    Returns a text summary.
+    Summaries are cached by the formatted history, so a retried compaction
+    of the same messages reuses the earlier summary. Returns a text summary.
     """
     from claude_agent_sdk import query, ClaudeAgentOptions, ResultMessage
+    from result_cache import get_result_cache
 
     conversation_text = _format_messages_for_summary(messages)
 
     prompt = f"Summarize this conversation history:\n\n{conversation_text}"
 
+    cache = get_result_cache()
+    cache_config = {"system_prompt": COMPACTION_SYSTEM_PROMPT}
+    cached = cache.get("compact_summary", "sonnet", prompt, cache_config, bypass=not use_cache)
+    if cached is not None:
+        logger.info(f"Using cached compaction summary for {len(messages)} messages")
+        return cached
+
     logger.info(
         f"Running compaction subagent on {len(messages)} messages "
         f"({len(conversation_text)} chars)"
@@ -122,6 +132,8 @@ async def _summarize_messages(messages: List[Dict]) -> str:
 
     try:
         result_text = None
+        cost_usd = None
+        started = time.time()
 
         async for message in query(
             prompt=prompt,
@@ -136,11 +148,14 @@ async def _summarize_messages(messages: List[Dict]) -> str:
         ):
             if isinstance(message, ResultMessage) and message.result:
                 result_text = message.result
+                cost_usd = message.total_cost_usd
 
         if result_text:
             logger.info(
                 f"Compaction subagent produced {len(result_text)} char summary"
             )
+            cache.put("compact_summary", "sonnet", prompt, result_text, cache_config,
+                      duration=time.time() - started, cost_usd=cost_usd)
             return result_text
 
         logger.warning("Compaction subagent returned no result")
@@ -175,6 +190,11 @@ Call this proactively when the conversation exceeds ~15 exchanges, or when the u
                 "type": "string",
                 "description": "Why compaction is being triggered (for logging)",
             },
+            "use_cache": {
+                "type": "boolean",
+                "description": "Reuse an earlier summary of exactly the same messages (default: true). Set false to force a fresh summary.",
+                "default": True,
+            },
         },
     },
 )
@@ -182,6 +202,7 @@ async def compact_conversation(args: Dict[str, Any]) -> Dict[str, Any]:
     """Compact the current conversation's history."""
     keep_n = args.get("keep_exchanges", 5)
     reason = args.get("reason", "Conversation compaction requested")
+    use_cache = args.get("use_cache", True)
 
     # Access the current conversation (same pattern as restart_server)
     main_module = sys.modules.get("main") or sys.modules.get("__main__")
@@ -255,7 +276,7 @@ async def compact_conversation(args: Dict[str, Any]) -> Dict[str, Any]:
 
     # Run the compaction subagent
     try:
-        summary = await _summarize_messages(older)
+        summary = await _summarize_messages(older, use_cache=use_cache)
     except Exception as e:
         return {
             "content": [
@@ -16,6 +16,7 @@ import os
 import re
 import tempfile
 import shutil
+import time
 from typing import Any, Dict, Optional
 
 from claude_agent_sdk import tool
@@ -346,6 +347,11 @@ Example use cases:
                 "type": "integer",
                 "description": f"Request timeout in seconds (default: {DEFAULT_TIMEOUT}, max: {MAX_TIMEOUT})",
                 "default": DEFAULT_TIMEOUT
+            },
+            "use_cache": {
+                "type": "boolean",
+                "description": "Reuse the answer to an identical earlier consultation (same provider, model and prompt) instead of asking again. Default: false",
+                "default": False
             }
         },
         "required": ["provider", "prompt"]
@@ -358,6 +364,7 @@ async def consult_llm(args: Dict[str, Any]) -> Dict[str, Any]:
     prompt = args.get("prompt", "")
     model = args.get("model")
     timeout = min(args.get("timeout_seconds", DEFAULT_TIMEOUT), MAX_TIMEOUT)
+    use_cache = args.get("use_cache", False)
 
     # Validate inputs
     if not prompt.strip():
@@ -373,15 +380,27 @@ async def consult_llm(args: Dict[str, Any]) -> Dict[str, Any]:
         }
 
     # Set default models
+    model = model or (DEFAULT_GEMINI_MODEL if provider == "gemini" else DEFAULT_OPENAI_MODEL)
+
+    if use_cache:
+        from result_cache import get_result_cache
+        cached = get_result_cache().get("consult_llm", model, prompt, {"provider": provider})
+        if cached is not None:
+            return {
+                "content": [{"type": "text", "text": f"[{provider.upper()} - {model}] (cached)\n\n{cached}"}]
+            }
+
+    started = time.time()
     if provider == "gemini":
-        model = model or DEFAULT_GEMINI_MODEL
         result = await _consult_gemini(prompt, model, timeout)
     else:  # openai
-        model = model or DEFAULT_OPENAI_MODEL
         result = await _consult_openai(prompt, model, timeout)
 
     # Format response
     if result["success"]:
+        if use_cache:
+            get_result_cache().put("consult_llm", model, prompt, result["response"], {"provider": provider},
+                                   duration=time.time() - started)
         response_text = (
             f"[{result['provider'].upper()} - {result['model']}]\n\n"
             f"{result['response']}"
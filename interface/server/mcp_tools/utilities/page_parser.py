@@ -8,6 +8,7 @@ Supports full content mode and summary mode (AI-condensed via Haiku).
 import logging
 import os
 import sys
+import time
 from typing import Any, Dict
 
 from claude_agent_sdk import tool
@@ -43,13 +44,17 @@ Guidelines:
 - Flag anything that seems contradictory or notably surprising"""
 
 
-async def _summarize_content(title: str, url: str, content: str, truncated: bool) -> str:
+async def _summarize_content(title: str, url: str, content: str, truncated: bool,
+                             use_cache: bool = True) -> str:
     """
     Summarize page content using Haiku via Claude Agent SDK.
 
-    Returns the summary text, or falls back to truncated content on error.
+    Summaries are cached by the exact prompt (page content included), so an
+    unchanged page is only summarized once; use_cache=False forces a fresh
+    summary. Returns the summary text, or falls back to truncated content on error.
     """
     from claude_agent_sdk import query, ClaudeAgentOptions, ResultMessage
+    from result_cache import get_result_cache
 
     trunc_note = ""
     if truncated:
@@ -67,10 +72,19 @@ URL: {url}
 
 Produce a structured summary following your guidelines."""
 
+    cache = get_result_cache()
+    cache_config = {"system_prompt": SUMMARY_SYSTEM_PROMPT}
+    cached = cache.get("page_summary", "haiku", prompt, cache_config, bypass=not use_cache)
+    if cached is not None:
+        logger.info(f"Using cached summary for {url}")
+        return cached
+
     logger.info(f"Running summary subagent on {len(content)} chars from {url}")
 
     try:
         result_text = None
+        cost_usd = None
+        started = time.time()
 
         async for message in query(
             prompt=prompt,
@@ -85,9 +99,12 @@ Produce a structured summary following your guidelines."""
         ):
             if isinstance(message, ResultMessage) and message.result:
                 result_text = message.result
+                cost_usd = message.total_cost_usd
 
         if result_text:
             logger.info(f"Summary subagent produced {len(result_text)} char summary")
+            cache.put("page_summary", "haiku", prompt, result_text, cache_config,
+                      duration=time.time() - started, cost_usd=cost_usd)
             return result_text
 
         logger.warning("Summary subagent returned no result, falling back to full content")
@@ -140,6 +157,11 @@ Content is truncated at ~50k chars by default. Truncated/saved pages are stored
                 "type": "integer",
                 "description": "Maximum characters per page (default: 50000)",
                 "default": 50000
+            },
+            "use_cache": {
+                "type": "boolean",
+                "description": "Summary mode: reuse the summary of an unchanged page from an earlier call (default: true). Set false to force a fresh summary.",
+                "default": True
             }
         },
         "required": ["urls"]
@@ -154,6 +176,7 @@ async def page_parser(args: Dict[str, Any]) -> Dict[str, Any]:
         mode = args.get("mode", "full")
         save = args.get("save", False)
         max_chars = args.get("max_chars", 50000)
+        use_cache = args.get("use_cache", True)
 
         if not urls:
             return {"content": [{"type": "text", "text": "No URLs provided"}], "is_error": True}
@@ -177,6 +200,7 @@ async def page_parser(args: Dict[str, Any]) -> Dict[str, Any]:
                     url=result.get("url", url),
                     content=result["content"],
                     truncated=result.get("truncated", False),
+                    use_cache=use_cache,
                 )
 
                 if summary:
@@ -10,14 +10,18 @@ from claude_agent_sdk import tool
 
 from ..registry import register_tool
 
+# CPU sample state for this tool's calls (kept apart from the usage sampler's)
+_cpu_samples: Dict[int, Any] = {}
+
 
 @register_tool("utilities")
 @tool(
     name="process_list",
     description="""List all currently running Claude processes (agents and primary).
 
-Shows each process's name, PID, task description, and start time.
-Dead processes are automatically pruned. Use this to see what agents are active.""",
+Shows each process's name, PID, task description, start time, and current CPU and memory use.
+Dead processes are automatically pruned. Use this to see what agents are active.
+Also shows agent scheduler capacity and any agent runs queued for a slot.""",
     input_schema={
         "type": "object",
         "properties": {},
@@ -33,11 +37,14 @@ async def process_list(args: Dict[str, Any]) -> Dict[str, Any]:
     if server_dir not in sys.path:
         sys.path.insert(0, server_dir)
 
-    from process_registry import get_process_list
+    from process_registry import get_process_list, sample_process
+
+    from agent_scheduler import get_agent_scheduler
 
     entries = get_process_list()
+    sched = get_agent_scheduler().snapshot()
 
-    if not entries:
+    if not entries and not sched["queued"]:
         return {
             "content": [{"type": "text", "text": "No running processes found."}]
         }
@@ -46,13 +53,31 @@ async def process_list(args: Dict[str, Any]) -> Dict[str, Any]:
     for entry in entries:
         pid = entry.get('pid')
         pid_display = f"PID {pid}" if pid is not None else "managed"
+        usage = sample_process(pid, _cpu_samples)
+        if usage:
+            pid_display += f", {usage['cpu_percent']:.0f}% CPU, {usage['rss_mb']:.0f} MB"
         lines.append(
             f"- **{entry['agent']}** ({pid_display}) — {entry['task']}  "
             f"[started {entry['started']}]"
         )
+    live_pids = {entry.get('pid') for entry in entries}
+    for pid in [p for p in _cpu_samples if p not in live_pids]:
+        del _cpu_samples[pid]
 
     text = f"**Running processes ({len(entries)}):**\n" + "\n".join(lines)
 
+    slots, memory = sched["slots"], sched["memory_mb"]
+    text += (
+        f"\n\n**Agent capacity:** {slots['used']}/{slots['max']} slots, "
+        f"~{memory['used']}/{memory['budget']} MB"
+    )
+    if sched["queued"]:
+        queue_lines = [
+            f"{q['position']}. **{q['agent']}** ({q['mode']}) — waiting {q['waiting_for']:.0f}s"
+            for q in sched["queued"]
+        ]
+        text += f"\n\n**Queued agent runs ({len(queue_lines)}):**\n" + "\n".join(queue_lines)
+
     return {
         "content": [{"type": "text", "text": text}]
     }
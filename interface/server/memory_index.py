@@ -0,0 +1,451 @@
+"""
+Memory Index - Incremental semantic index over agents' unified memories.
+
+Replaces "re-index the whole agent after every change" with per-memory
+upsert/delete operations:
+
+- Each indexed memory stores a content hash of its embedding text
+  (triggers + content), so unchanged memories are never re-embedded;
+  flag-only edits (always_load, private, type) just update metadata
+- Mutations are queued and coalesced by a background worker: rapid
+  successive changes from one turn collapse into a single debounced
+  commit with one batched embedding call
+- Commit listeners are notified once per commit with the IDs per agent
+  whose embedding text or flags actually changed (or were deleted), so
+  external engines can be kept in step without full re-indexes
+- note_store_write() advances an agent's sync point when a store write
+  that directly follows it has been queued, so searches after in-process
+  writes don't fall back to a full per-agent reconciliation
+- All agents share one index with agent and private as columns, so
+  cross-agent search is a single federated top-k over non-private
+  memories with agent as a filter facet
+
+Vectors live in a memory-mapped VectorStore keyed by an entry row ID.
+
+Data: .claude/memory_index/index.db (entries), .claude/memory_index/vectors/
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from vector_store import VectorStore
+
+logger = logging.getLogger("memory_index")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+DEFAULT_INDEX_DIR = os.path.join(ROOT_DIR, ".claude", "memory_index")
+
+COMMIT_DEBOUNCE_SECONDS = 2.0   # Quiet period before a queued batch is committed
+COMMIT_MAX_DELAY_SECONDS = 10.0  # Upper bound on how long a mutation can wait
+SELECT_CHUNK = 500               # memory_ids per batched entry lookup (SQLite variable limit)
+VECTOR_DTYPE = os.environ.get("MEMORY_INDEX_VECTOR_DTYPE", "float16")  # int8 or float16
+
+# listener(agent, upserted_ids, deleted_ids)
+CommitListener = Callable[[str, List[int], List[int]], None]
+
+
+def memory_text(memory: Dict[str, Any]) -> str:
+    """Text that is embedded for a memory: trigger phrases, then content."""
+    triggers = "; ".join(str(t) for t in memory.get("triggers", []))
+    content = memory.get("content", "")
+    return f"{triggers}\n{content}" if triggers else content
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", "replace")).hexdigest()
+
+
+class MemoryIndex:
+    """
+    Embedding index over every agent's memories, updated per memory.
+
+    Thread-safe: a single SQLite connection is guarded by a lock, and queued
+    mutations are committed by one background worker thread.
+    """
+
+    def __init__(self, index_dir: Optional[str] = None):
+        self.index_dir = index_dir or DEFAULT_INDEX_DIR
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.db_path = os.path.join(self.index_dir, "index.db")
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+        self._store = VectorStore(os.path.join(self.index_dir, "vectors"), dtype=VECTOR_DTYPE)
+
+        # Bumped on every committed change; lets callers key result caches on it
+        self.version = 0
+
+        # Pending mutations: (agent, memory_id) -> memory dict (or None for delete)
+        self._pending: Dict[Tuple[str, int], Optional[Dict[str, Any]]] = {}
+        self._pending_lock = threading.Lock()
+        self._first_pending_at: Optional[float] = None
+        self._last_pending_at = 0.0
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._listeners: List[CommitListener] = []
+        self._commit_lock = threading.Lock()
+        # agent -> store version whose changes are all committed or queued here
+        self._sync_points: Dict[str, int] = {}
+
+    def _init_schema(self):
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                    agent        TEXT NOT NULL,
+                    memory_id    INTEGER NOT NULL,
+                    content_hash TEXT,
+                    private      INTEGER DEFAULT 0,
+                    always_load  INTEGER DEFAULT 0,
+                    type         TEXT,
+                    UNIQUE(agent, memory_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_entries_private ON entries(private);
+                CREATE TABLE IF NOT EXISTS synced_agents (
+                    agent     TEXT PRIMARY KEY,
+                    synced_at REAL
+                );
+            """)
+            columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(synced_agents)")}
+            if "store_version" not in columns:
+                self._conn.execute("ALTER TABLE synced_agents ADD COLUMN store_version INTEGER")
+            self._conn.commit()
+
+    # ── Listeners ─────────────────────────────────────────────────────────────
+
+    def add_commit_listener(self, listener: CommitListener):
+        """Call listener(agent, upserted_ids, deleted_ids) after each commit."""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    # ── Write path (queued) ───────────────────────────────────────────────────
+
+    def enqueue_upsert(self, agent: str, memories: Iterable[Dict[str, Any]]):
+        """Queue memories for (re)indexing (non-blocking)."""
+        self._enqueue({(agent, int(m["id"])): dict(m) for m in memories})
+
+    def enqueue_delete(self, agent: str, memory_ids: Iterable[int]):
+        """Queue memories for removal from the index (non-blocking)."""
+        self._enqueue({(agent, int(i)): None for i in memory_ids})
+
+    def _enqueue(self, items: Dict[Tuple[str, int], Optional[Dict[str, Any]]]):
+        if not items:
+            return
+        now = time.monotonic()
+        with self._pending_lock:
+            self._pending.update(items)
+            self._last_pending_at = now
+            if self._first_pending_at is None:
+                self._first_pending_at = now
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._worker_loop, name="memory-index-writer", daemon=True
+            )
+            self._worker.start()
+
+    def _worker_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Debounce: wait for a quiet period, bounded by the max delay
+            while True:
+                with self._pending_lock:
+                    if not self._pending:
+                        break
+                    now = time.monotonic()
+                    quiet_until = self._last_pending_at + COMMIT_DEBOUNCE_SECONDS
+                    deadline = (self._first_pending_at or now) + COMMIT_MAX_DELAY_SECONDS
+                    wait = min(quiet_until, deadline) - now
+                if wait > 0:
+                    time.sleep(wait)
+                    continue
+                self.flush()
+                break
+
+    def has_pending(self, agent: str) -> bool:
+        """Are changes for this agent queued but not yet committed?"""
+        with self._pending_lock:
+            return any(key[0] == agent for key in self._pending)
+
+    def flush(self) -> Dict[str, int]:
+        """Commit all queued mutations now. Returns {"embedded", "updated", "deleted"}."""
+        with self._pending_lock:
+            batch, self._pending = self._pending, {}
+            self._first_pending_at = None
+        if not batch:
+            return {"embedded": 0, "updated": 0, "deleted": 0}
+        try:
+            return self._commit(batch)
+        except Exception as e:
+            logger.warning(f"Memory index commit failed ({len(batch)} changes): {e}")
+            return {"embedded": 0, "updated": 0, "deleted": 0}
+
+    # ── Commit ────────────────────────────────────────────────────────────────
+
+    def _commit(self, batch: Dict[Tuple[str, int], Optional[Dict[str, Any]]]) -> Dict[str, int]:
+        with self._commit_lock:
+            return self._commit_locked(batch)
+
+    def _commit_locked(self, batch: Dict[Tuple[str, int], Optional[Dict[str, Any]]]) -> Dict[str, int]:
+        by_agent: Dict[str, List[int]] = {}
+        for agent, mem_id in batch:
+            by_agent.setdefault(agent, []).append(mem_id)
+        existing: Dict[Tuple[str, int], sqlite3.Row] = {}
+        with self._lock:
+            for agent, mem_ids in by_agent.items():
+                for start in range(0, len(mem_ids), SELECT_CHUNK):
+                    chunk = mem_ids[start:start + SELECT_CHUNK]
+                    for row in self._conn.execute(
+                        "SELECT id, memory_id, content_hash, private, always_load, type FROM entries "
+                        f"WHERE agent = ? AND memory_id IN ({', '.join('?' * len(chunk))})",
+                        (agent, *chunk),
+                    ):
+                        existing[(agent, row["memory_id"])] = row
+
+        to_embed: List[Tuple[Tuple[str, int], str, str]] = []  # (key, text, hash)
+        changed: Dict[Tuple[str, int], Tuple[Any, ...]] = {}    # key -> (hash, private, always_load, type)
+        for key, memory in batch.items():
+            if memory is None:
+                continue
+            text = memory_text(memory)
+            content_hash = _hash_text(text)
+            flags = (int(bool(memory.get("private"))), int(bool(memory.get("always_load"))), memory.get("type"))
+            old = existing.get(key)
+            if old is None or old["content_hash"] != content_hash:
+                to_embed.append((key, text, content_hash))
+            elif (old["private"], old["always_load"], old["type"]) == flags:
+                continue  # Nothing to write or report
+            changed[key] = flags
+
+        vectors = self._embed([t for _, t, _ in to_embed]) if to_embed else None
+        embedded_hashes = {key: h for key, _, h in to_embed} if vectors is not None else {}
+
+        deleted_rows: List[int] = []
+        vector_rows: List[int] = []
+        touched: Dict[str, Tuple[List[int], List[int]]] = {}
+        updated = 0
+        with self._lock:
+            conn = self._conn
+            for key, memory in batch.items():
+                agent, mem_id = key
+                old = existing.get(key)
+                if memory is None:
+                    if old is not None:
+                        conn.execute("DELETE FROM entries WHERE id = ?", (old["id"],))
+                        deleted_rows.append(old["id"])
+                        touched.setdefault(agent, ([], []))[1].append(mem_id)
+                    continue
+                if key not in changed:
+                    continue
+                # Keep the previous hash when embedding is unavailable, so the
+                # memory is retried on the next sync
+                content_hash = embedded_hashes.get(key, old["content_hash"] if old else None)
+                cur = conn.execute(
+                    "INSERT INTO entries (agent, memory_id, content_hash, private, always_load, type) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(agent, memory_id) DO UPDATE SET "
+                    "content_hash = excluded.content_hash, private = excluded.private, "
+                    "always_load = excluded.always_load, type = excluded.type",
+                    (agent, mem_id, content_hash, *changed[key]),
+                )
+                row_id = old["id"] if old else cur.lastrowid
+                if key in embedded_hashes:
+                    vector_rows.append(row_id)
+                touched.setdefault(agent, ([], []))[0].append(mem_id)
+                updated += 1
+            conn.commit()
+
+        if deleted_rows:
+            self._store.delete(deleted_rows)
+        if vector_rows:
+            self._store.add(vector_rows, vectors)
+        if not touched:
+            return {"embedded": 0, "updated": 0, "deleted": 0}
+
+        self.version += 1
+        for agent, (upserted, deleted) in touched.items():
+            for listener in list(self._listeners):
+                try:
+                    listener(agent, upserted, deleted)
+                except Exception as e:
+                    logger.warning(f"Memory index listener failed for {agent}: {e}")
+
+        stats = {"embedded": len(vector_rows), "updated": updated, "deleted": len(deleted_rows)}
+        logger.debug(f"Memory index commit: {stats}")
+        return stats
+
+    # ── Reconciliation ────────────────────────────────────────────────────────
+
+    def _sync_point(self, agent: str) -> Optional[int]:
+        point = self._sync_points.get(agent)
+        if point is not None:
+            return point
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT store_version FROM synced_agents WHERE agent = ?", (agent,)
+            ).fetchone()
+        return row["store_version"] if row is not None else None
+
+    def is_synced(self, agent: str, store_version: Optional[int] = None) -> bool:
+        """Has the agent been synced (at this memory store version, if given)?
+
+        Versions reached through note_store_write() count as synced: their
+        changes are committed or queued (see has_pending()).
+        """
+        if store_version is None:
+            with self._lock:
+                return self._conn.execute(
+                    "SELECT 1 FROM synced_agents WHERE agent = ?", (agent,)
+                ).fetchone() is not None
+        return self._sync_point(agent) == store_version
+
+    def note_store_write(self, agent: str, store_version: int):
+        """
+        A store write that produced store_version has been queued here.
+
+        Store versions go up by one per committed write, so when the agent
+        was synced at the version just before, the index is complete again
+        once the queue commits. Any gap (a write from another process) leaves
+        the sync point alone, and the next search reconciles in full.
+        """
+        point = self._sync_point(agent)
+        if point is not None and point == store_version - 1:
+            self._sync_points[agent] = store_version
+
+    def sync_agent(
+        self,
+        agent: str,
+        memories: List[Dict[str, Any]],
+        store_version: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """
+        Reconcile one agent's entries with its full memory list, synchronously.
+
+        Unchanged memories are skipped by hash; memories no longer present are
+        removed. store_version is the version the list was read at (see is_synced).
+        """
+        with self._lock:
+            indexed = {r["memory_id"] for r in self._conn.execute(
+                "SELECT memory_id FROM entries WHERE agent = ?", (agent,)
+            )}
+        batch: Dict[Tuple[str, int], Optional[Dict[str, Any]]] = {
+            (agent, int(m["id"])): m for m in memories if "id" in m
+        }
+        for mem_id in indexed - {mem_id for _, mem_id in batch}:
+            batch[(agent, mem_id)] = None
+        stats = self._commit(batch) if batch else {"embedded": 0, "updated": 0, "deleted": 0}
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO synced_agents (agent, synced_at, store_version) VALUES (?, ?, ?) "
+                "ON CONFLICT(agent) DO UPDATE SET synced_at = excluded.synced_at, "
+                "store_version = excluded.store_version",
+                (agent, time.time(), store_version),
+            )
+            self._conn.commit()
+        if store_version is not None:
+            self._sync_points[agent] = store_version
+        else:
+            self._sync_points.pop(agent, None)
+        return stats
+
+    # ── Read path ─────────────────────────────────────────────────────────────
+
+    def _embed(self, texts: List[str], is_query: bool = False):
+        try:
+            from embedding_queue import get_embedding_queue
+            # Queries are interactive and jump ahead of background indexing
+            return get_embedding_queue().encode(texts, is_query=is_query, background=not is_query)
+        except Exception as e:
+            logger.debug(f"Embedding unavailable: {e}")
+            return None
+
+    def embedded_count(self) -> int:
+        return len(self._store)
+
+    def _search_rows(self, query: str, rows: Dict[int, Any], k: int) -> List[Tuple[Any, float]]:
+        """Top-k (rows[row_id], score) among the given entry rows."""
+        if k <= 0 or not rows or len(self._store) == 0:
+            return []
+        query_vec = self._embed([query], is_query=True)
+        if query_vec is None:
+            return []
+
+        # Over-fetch, then widen to a full scan if the wanted rows were crowded out
+        hits = self._store.search(query_vec[0], k=k * 10)
+        matched = [(rows[row_id], score) for row_id, score in hits if row_id in rows]
+        if len(matched) < min(k, len(rows)) and len(hits) < len(self._store):
+            hits = self._store.search(query_vec[0], k=len(self._store))
+            matched = [(rows[row_id], score) for row_id, score in hits if row_id in rows]
+        return matched[:k]
+
+    def search(self, query: str, agent: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k (memory_id, score) for one agent by embedding similarity."""
+        with self._lock:
+            rows = {r["id"]: r["memory_id"] for r in self._conn.execute(
+                "SELECT id, memory_id FROM entries WHERE agent = ? AND content_hash IS NOT NULL",
+                (agent,),
+            )}
+        return self._search_rows(query, rows, k)
+
+    def search_federated(
+        self,
+        query: str,
+        k: int = 10,
+        agents: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[str, int, float]]:
+        """
+        One global top-k (agent, memory_id, score) over all agents' non-private memories.
+
+        Args:
+            query: Search text
+            k: Number of results across all agents
+            agents: Optional agent facet; only these agents' memories are ranked
+        """
+        sql = "SELECT id, agent, memory_id FROM entries WHERE private = 0 AND content_hash IS NOT NULL"
+        params: list = []
+        if agents is not None:
+            agents = list(agents)
+            if not agents:
+                return []
+            sql += f" AND agent IN ({','.join('?' * len(agents))})"
+            params.extend(agents)
+        with self._lock:
+            rows = {r["id"]: (r["agent"], r["memory_id"]) for r in self._conn.execute(sql, params)}
+        return [(agent, mem_id, score) for (agent, mem_id), score in self._search_rows(query, rows, k)]
+
+    def agent_counts(self, include_private: bool = False) -> Dict[str, int]:
+        """Indexed memories per agent (facet counts)."""
+        sql = "SELECT agent, COUNT(*) AS n FROM entries"
+        if not include_private:
+            sql += " WHERE private = 0"
+        with self._lock:
+            return {r["agent"]: r["n"] for r in self._conn.execute(sql + " GROUP BY agent")}
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_index: Optional[MemoryIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_memory_index() -> MemoryIndex:
+    """Get or create the process-wide memory index."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = MemoryIndex()
+    return _index
@@ -0,0 +1,172 @@
+"""
+Memory Packer - Token-budgeted always_load memory block for system prompts.
+
+Instead of concatenating every always_load memory (and relying on the blind
+byte truncation of the whole system prompt), memories are:
+
+- Prioritized by confidence, type and recency
+- Costed individually with the token estimator
+- Greedily packed into a configurable token budget, highest priority first
+- Emitted in stable ID order, so the block stays identical between turns
+  and prompt caching keeps working
+
+The compiled block is cached per memories-file version (mtime + size), and
+every pack reports which memories were dropped for space.
+
+Budget: ALWAYS_LOAD_TOKEN_BUDGET env (default 12000 tokens); callers may
+pass a different budget to get_packed_memories().
+"""
+
+import datetime
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from cache_utils import LRUCache
+from token_estimator import estimate_tokens
+
+logger = logging.getLogger("memory_packer")
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("ALWAYS_LOAD_TOKEN_BUDGET", "12000"))
+RECENCY_HALF_LIFE_DAYS = 90.0
+DEFAULT_CONFIDENCE = 0.8
+
+# Relative importance of memory types for prompt inclusion
+TYPE_WEIGHTS = {
+    "preference": 1.0,
+    "procedure": 0.95,
+    "fact": 0.9,
+    "decision": 0.85,
+    "project": 0.8,
+    "pattern": 0.75,
+    "observation": 0.7,
+    "reflection": 0.6,
+}
+DEFAULT_TYPE_WEIGHT = 0.8
+
+BLOCK_HEADER = (
+    "\n---\n\n"
+    "Your persistent memory (notes you've saved across conversations):\n\n"
+)
+
+
+@dataclass
+class PackedMemories:
+    """Result of packing always_load memories into a token budget."""
+    text: str                      # Full prompt block ("" if nothing to load)
+    tokens: int                    # Estimated tokens of the block
+    budget: int
+    included: List[int] = field(default_factory=list)
+    dropped: List[int] = field(default_factory=list)
+
+
+def _parse_time(value: Any) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+
+def memory_priority(memory: Dict[str, Any], now: Optional[datetime.datetime] = None) -> float:
+    """Priority in [0, 1]: 50% confidence, 30% type, 20% recency (half-life decay)."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    confidence = memory.get("confidence")
+    confidence = DEFAULT_CONFIDENCE if confidence is None else float(confidence)
+    type_weight = TYPE_WEIGHTS.get(memory.get("type") or "", DEFAULT_TYPE_WEIGHT)
+    updated = _parse_time(memory.get("updated") or memory.get("created"))
+    if updated is None:
+        recency = 0.5
+    else:
+        age_days = max(0.0, (now - updated).total_seconds() / 86400)
+        recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    return 0.5 * confidence + 0.3 * type_weight + 0.2 * recency
+
+
+def _dropped_note(count: int) -> str:
+    return (
+        f"\n({count} lower-priority always_load memories omitted for space — "
+        "use memory_search to recall them.)"
+    )
+
+
+def pack_memories(memories: List[Dict[str, Any]], budget: int = DEFAULT_TOKEN_BUDGET) -> PackedMemories:
+    """Pack always_load memories into a prompt block within a token budget."""
+    always_load = [m for m in memories if m.get("always_load") and m.get("content")]
+    if not always_load:
+        return PackedMemories(text="", tokens=0, budget=budget)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    header_tokens = estimate_tokens(BLOCK_HEADER)
+    candidates = []
+    for position, m in enumerate(always_load):
+        line = f"- {m['content']}"
+        candidates.append((memory_priority(m, now), position, m, line, estimate_tokens(line) + 1))
+
+    # Reserve room for the "omitted" note when not everything fits
+    limit = budget
+    if header_tokens + sum(c[4] for c in candidates) > budget:
+        limit -= estimate_tokens(_dropped_note(len(candidates)))
+
+    # Greedy by priority; smaller lower-priority memories can still fill leftover space
+    used = header_tokens
+    chosen = set()
+    for _, position, _, _, cost in sorted(candidates, key=lambda c: (-c[0], c[1])):
+        if used + cost <= limit:
+            chosen.add(position)
+            used += cost
+
+    lines, included, dropped = [], [], []
+    for _, position, m, line, _ in candidates:
+        if position in chosen:
+            lines.append(line)
+            included.append(m.get("id"))
+        else:
+            dropped.append(m.get("id"))
+
+    if not lines:
+        return PackedMemories(text="", tokens=0, budget=budget, dropped=dropped)
+
+    if dropped:
+        lines.append(_dropped_note(len(dropped)))
+    text = BLOCK_HEADER + "\n".join(lines)
+    return PackedMemories(
+        text=text, tokens=estimate_tokens(text), budget=budget,
+        included=included, dropped=dropped,
+    )
+
+
+_cache = LRUCache(max_entries=64)
+
+
+def get_packed_memories(memories_path: Path, budget: Optional[int] = None) -> PackedMemories:
+    """
+    Packed always_load block for a memories.json file, cached per file version.
+
+    Raises OSError / ValueError if the file cannot be read or parsed.
+    """
+    budget = budget or DEFAULT_TOKEN_BUDGET
+    stat = memories_path.stat()
+    key = (str(memories_path), stat.st_mtime_ns, stat.st_size, budget)
+    packed = _cache.get(key)
+    if packed is not None:
+        return packed
+
+    memories = json.loads(memories_path.read_text(encoding="utf-8"))
+    if not isinstance(memories, list):
+        raise ValueError("memories file must contain a JSON list")
+    packed = pack_memories(memories, budget)
+    _cache.set(key, packed)
+    if packed.dropped:
+        logger.warning(
+            f"{memories_path.parent.name}: always_load memories over budget "
+            f"({packed.tokens}/{budget} tokens), dropped {len(packed.dropped)}: {packed.dropped}"
+        )
+    return packed
@@ -0,0 +1,178 @@
+"""
+Notification Bus - Event-driven wake-ups for agent completion notifications.
+
+Ping-mode agents write their completion to the file-backed notification
+queue (.claude/agents/agent_notifications). The server used to poll that
+queue every 15 seconds and only claimed notifications older than 30
+seconds, so Claude woke up 30-45 seconds after an agent finished. Instead:
+
+- Completions are published to this in-process bus (publish(chat_id)):
+  the agent scheduler publishes when a ping run's process deregisters
+- Each chat has a debounce window (DEBOUNCE_SECONDS quiet, at most
+  MAX_WAIT_SECONDS after the first event), so several agents finishing
+  together still produce one batch / one wake-up
+- On flush the chat's pending notifications are claimed from the file
+  queue (the claim stays the single source of truth, so the inline
+  injection path can't double-deliver) and handed to the batch handler
+- The file queue is also swept for stale notifications at startup and
+  every SWEEP_INTERVAL_SECONDS, to recover anything written by another
+  process or published before a crash
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("notification_bus")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+AGENTS_DIR = os.path.join(ROOT_DIR, ".claude", "agents")
+
+DEBOUNCE_SECONDS = 2.0
+MAX_WAIT_SECONDS = 10.0
+SWEEP_INTERVAL_SECONDS = 15.0
+STALE_THRESHOLD_SECONDS = 30
+
+BatchHandler = Callable[[str, list, Any], Awaitable[None]]
+
+
+def _get_queue():
+    if AGENTS_DIR not in sys.path:
+        sys.path.insert(0, AGENTS_DIR)
+    from agent_notifications import get_notification_queue
+    return get_notification_queue()
+
+
+class NotificationBus:
+    """Per-chat debounced delivery of agent completion notifications."""
+
+    def __init__(self, debounce: float = DEBOUNCE_SECONDS, max_wait: float = MAX_WAIT_SECONDS):
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handler: Optional[BatchHandler] = None
+        self._first_seen: Dict[str, float] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._stats = {"published": 0, "flushes": 0, "delivered": 0, "sweeps": 0, "recovered": 0}
+
+    # ── Publishing ────────────────────────────────────────────────────────────
+
+    def publish(self, chat_id: Optional[str]):
+        """Signal that a notification for chat_id was queued (safe from any thread)."""
+        if not chat_id:
+            return
+        self._stats["published"] += 1
+        loop = self._loop
+        if loop is None:
+            return  # Not running yet: the startup sweep picks it up
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._arm(chat_id)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._arm, chat_id)
+            except RuntimeError:
+                pass  # Loop closed
+
+    def _arm(self, chat_id: str):
+        now = time.monotonic()
+        first = self._first_seen.setdefault(chat_id, now)
+        delay = max(0.0, min(self.debounce, first + self.max_wait - now))
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[chat_id] = self._loop.call_later(
+            delay, lambda: asyncio.ensure_future(self._flush(chat_id))
+        )
+
+    # ── Delivery ──────────────────────────────────────────────────────────────
+
+    async def _flush(self, chat_id: str):
+        self._timers.pop(chat_id, None)
+        self._first_seen.pop(chat_id, None)
+        try:
+            queue = _get_queue()
+            claimed = await asyncio.to_thread(queue.claim_pending, chat_id=chat_id)
+        except Exception as e:
+            logger.error(f"Notification claim failed for chat {chat_id}: {e}")
+            return
+        self._stats["flushes"] += 1
+        if not claimed:
+            return  # Already delivered inline with a user message
+        self._stats["delivered"] += len(claimed)
+        logger.info(f"Delivering {len(claimed)} agent notification(s) to chat {chat_id}")
+        try:
+            await self._handler(chat_id, list(claimed), queue)
+        except Exception as e:
+            logger.error(f"Error processing notification batch for chat {chat_id}: {e}", exc_info=True)
+
+    async def sweep(self, threshold_seconds: int = STALE_THRESHOLD_SECONDS) -> int:
+        """Claim and deliver stale notifications from the file queue (crash recovery)."""
+        try:
+            queue = _get_queue()
+        except ImportError:
+            return 0
+        claimed = await asyncio.to_thread(queue.claim_pending, threshold_seconds=threshold_seconds)
+        self._stats["sweeps"] += 1
+        if not claimed:
+            return 0
+        logger.info(f"Recovered {len(claimed)} stale agent notifications from the queue")
+        self._stats["recovered"] += len(claimed)
+
+        by_chat: Dict[str, list] = defaultdict(list)
+        for notification in claimed:
+            chat_id = notification.source_chat_id
+            if not chat_id:
+                # No chat to wake up — already marked injected, just skip
+                logger.warning(f"Notification {notification.id} has no source_chat_id, skipping")
+                continue
+            by_chat[chat_id].append(notification)
+        for chat_id, notifications in by_chat.items():
+            try:
+                await self._handler(chat_id, notifications, queue)
+            except Exception as e:
+                logger.error(f"Error processing notification batch for chat {chat_id}: {e}", exc_info=True)
+        return len(claimed)
+
+    async def run(self, handler: BatchHandler, sweep_interval: float = SWEEP_INTERVAL_SECONDS):
+        """Recover stale notifications, then keep sweeping the queue."""
+        self._loop = asyncio.get_running_loop()
+        self._handler = handler
+        try:
+            _get_queue()
+        except ImportError:
+            logger.warning("agent_notifications not available; notification bus idle")
+            return
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Agent notification sweep error: {e}", exc_info=True)
+            await asyncio.sleep(sweep_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "pending_chats": len(self._timers)}
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_bus: Optional[NotificationBus] = None
+_bus_lock = threading.Lock()
+
+
+def get_notification_bus() -> NotificationBus:
+    """Get or create the process-wide notification bus."""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = NotificationBus()
+    return _bus
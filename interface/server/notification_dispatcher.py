@@ -0,0 +1,210 @@
+"""
+Notification Dispatcher - Queued, batched email notification delivery.
+
+send_push_notification used to authenticate and call Gmail's blocking
+send().execute() inline, on the event loop, once per notification; a burst
+of scheduled task completions stalled the loop and sent one email each.
+Now:
+
+- Notifications go onto an outbound queue drained by one worker task;
+  the Gmail call runs on a single sender thread, which reuses the
+  authenticated service (push_service.deliver_email)
+- Critical notifications are sent immediately, and submit() waits for
+  the first attempt only; if it fails, retries continue in the background
+- Non-critical ones are held for DIGEST_WINDOW_SECONDS after the first
+  one; if more arrive, they go out as a single digest email
+- At flush, should_notify is evaluated once per chat for the whole batch
+  (set_push_check), so chats the user has since opened are dropped
+- Failed sends are retried with exponential backoff (MAX_ATTEMPTS)
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("notification_dispatcher")
+
+DIGEST_WINDOW_SECONDS = float(os.environ.get("NOTIFY_DIGEST_SECONDS", "60"))
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 5.0
+BACKOFF_FACTOR = 4.0
+
+# push_check(chat_id) -> whether the chat still warrants an email
+PushCheck = Callable[[str], bool]
+
+
+@dataclass
+class _Job:
+    """One outbound email (a single notification or a digest)."""
+    items: List[Dict[str, str]]
+    critical: bool = False
+    attempts: int = 0
+    result: Optional[asyncio.Future] = field(default=None, repr=False)
+
+
+class NotificationDispatcher:
+    """Outbound email queue with digesting and retry."""
+
+    def __init__(self, digest_window: float = DIGEST_WINDOW_SECONDS):
+        self.digest_window = digest_window
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._sender = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notify-sender")
+        self._pending: List[Dict[str, str]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._push_check: Optional[PushCheck] = None
+        self._stats = {"submitted": 0, "sent": 0, "digests": 0, "coalesced": 0,
+                       "retries": 0, "failed": 0, "dropped_viewing": 0}
+
+    def set_push_check(self, check: PushCheck):
+        """Re-check at flush time whether each chat still needs an email."""
+        self._push_check = check
+
+    # ── Submit ────────────────────────────────────────────────────────────────
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker = loop.create_task(self._run())
+
+    async def submit(self, title: str, body: str, chat_id: str, critical: bool = False) -> int:
+        """
+        Queue a notification email. Critical ones are sent now and this
+        returns 1/0 for the outcome of the first attempt (a failed one keeps
+        retrying in the background); others return 1 once queued.
+        """
+        self._stats["submitted"] += 1
+        loop = asyncio.get_running_loop()
+        if self._loop is not None and self._loop is not loop and self._loop.is_running():
+            # Another event loop (e.g. a standalone script): send directly
+            return await self._send_now(title, body, chat_id, critical)
+        self._ensure_worker()
+        item = {"title": title, "body": body or "", "chat_id": chat_id or ""}
+        if critical:
+            job = _Job(items=[item], critical=True, result=self._loop.create_future())
+            self._queue.put_nowait(job)
+            return await job.result
+
+        self._pending.append(item)
+        if self._flush_timer is None:
+            self._flush_timer = self._loop.call_later(self.digest_window, self._flush)
+        return 1
+
+    def _flush(self):
+        """Move the held non-critical notifications onto the queue as one job."""
+        self._flush_timer = None
+        items, self._pending = self._pending, []
+        if not items:
+            return
+
+        # One should_notify decision per chat for the whole batch
+        if self._push_check is not None:
+            verdicts: Dict[str, bool] = {}
+            kept = []
+            for item in items:
+                chat_id = item["chat_id"]
+                if chat_id not in verdicts:
+                    try:
+                        verdicts[chat_id] = not chat_id or self._push_check(chat_id)
+                    except Exception as e:
+                        logger.debug(f"Push check failed for {chat_id}: {e}")
+                        verdicts[chat_id] = True
+                if verdicts[chat_id]:
+                    kept.append(item)
+            self._stats["dropped_viewing"] += len(items) - len(kept)
+            items = kept
+            if not items:
+                return
+
+        if len(items) > 1:
+            self._stats["coalesced"] += len(items)
+        self._queue.put_nowait(_Job(items=items))
+
+    # ── Delivery ──────────────────────────────────────────────────────────────
+
+    async def _send_now(self, title: str, body: str, chat_id: str, critical: bool) -> int:
+        from push_service import build_notification_email, deliver_email
+        email = build_notification_email(title, body or "", chat_id or "", critical)
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._sender, deliver_email, email)
+        except Exception as e:
+            self._stats["failed"] += 1
+            logger.error(f"Email notification failed: {e}")
+            return 0
+        self._stats["sent"] += 1
+        return 1
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._deliver(job)
+            except Exception as e:
+                logger.error(f"Notification dispatch error: {e}", exc_info=True)
+
+    async def _deliver(self, job: _Job):
+        from push_service import build_digest_email, build_notification_email, deliver_email
+
+        if len(job.items) == 1:
+            item = job.items[0]
+            email = build_notification_email(item["title"], item["body"], item["chat_id"], job.critical)
+        else:
+            email = build_digest_email(job.items)
+
+        job.attempts += 1
+        try:
+            await self._loop.run_in_executor(self._sender, deliver_email, email)
+        except Exception as e:
+            # The submitter only waits for the first attempt
+            if job.result is not None and not job.result.done():
+                job.result.set_result(0)
+            if job.attempts < MAX_ATTEMPTS:
+                delay = BACKOFF_BASE_SECONDS * BACKOFF_FACTOR ** (job.attempts - 1)
+                self._stats["retries"] += 1
+                logger.warning(f"Email notification failed (attempt {job.attempts}/{MAX_ATTEMPTS}), "
+                               f"retrying in {delay:.0f}s: {e}")
+                self._loop.call_later(delay, self._queue.put_nowait, job)
+                return
+            self._stats["failed"] += 1
+            logger.error(f"Email notification failed after {job.attempts} attempts: {e}")
+            return
+
+        self._stats["sent"] += 1
+        if len(job.items) > 1:
+            self._stats["digests"] += 1
+        if job.result is not None and not job.result.done():
+            job.result.set_result(1)
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "held_for_digest": len(self._pending),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "digest_window_seconds": self.digest_window,
+        }
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_dispatcher: Optional[NotificationDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    """Get or create the process-wide notification dispatcher."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher()
+    return _dispatcher
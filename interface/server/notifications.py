@@ -26,9 +26,10 @@ class NotificationDecision:
 def should_notify(
     chat_id: str,
     is_silent: bool,
-    client_sessions: Dict[Any, Any],
+    client_sessions: Optional[Dict[Any, Any]] = None,
     critical: bool = False,
-    stale_timeout: float = 90
+    stale_timeout: float = 90,
+    presence: Optional[Any] = None
 ) -> NotificationDecision:
     """
     Determine whether to send a notification for a message.
@@ -36,9 +37,12 @@ def should_notify(
     Args:
         chat_id: The chat session ID
         is_silent: Whether this is a silent/background task
-        client_sessions: Dict of WebSocket -> ClientSession
+        client_sessions: Dict of WebSocket -> ClientSession (scanned when no
+            presence index is given)
         critical: Whether this message is marked critical
         stale_timeout: Seconds before a connection is considered stale
+            (the presence index applies its own timeout)
+        presence: PresenceIndex answering viewer/connection checks in O(1)
 
     Returns:
         NotificationDecision with channels to use
@@ -48,21 +52,25 @@ def should_notify(
         return NotificationDecision(notify=False, reason="silent_chat")
 
     # Check if any connected client is actively viewing this chat
-    current_time = time.time()
-    user_is_viewing = False
-    has_active_connection = False
-
-    for ws, session in client_sessions.items():
-        # Skip stale connections
-        if current_time - session.last_heartbeat > stale_timeout:
-            continue
-
-        has_active_connection = True
-
-        # Check if this client is actively viewing the specific chat
-        if session.is_active and session.current_chat_id == chat_id:
-            user_is_viewing = True
-            break
+    if presence is not None:
+        user_is_viewing = presence.is_user_viewing(chat_id)
+        has_active_connection = user_is_viewing or presence.has_active_connection()
+    else:
+        current_time = time.time()
+        user_is_viewing = False
+        has_active_connection = False
+
+        for ws, session in (client_sessions or {}).items():
+            # Skip stale connections
+            if current_time - session.last_heartbeat > stale_timeout:
+                continue
+
+            has_active_connection = True
+
+            # Check if this client is actively viewing the specific chat
+            if session.is_active and session.current_chat_id == chat_id:
+                user_is_viewing = True
+                break
 
     # If user is actively viewing this chat, no notification needed
     # (unless critical - critical always notifies via email)
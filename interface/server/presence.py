@@ -0,0 +1,185 @@
+"""
+Presence Index - Who is connected, subscribed to, and viewing which chat.
+
+should_notify used to scan every ClientSession on every completion to find
+an active, non-stale viewer, and register_client walked every
+session_clients entry to drop a WebSocket from its old session. This
+index keeps the reverse mappings instead, so each of those is O(1):
+
+- clients: WebSocket -> ClientSession (the dict main.py exposes as
+  client_sessions)
+- websocket -> subscribed session and session -> subscribers (broadcast
+  targeting for broadcast_to_session / register_client)
+- chat -> active viewers: connections that are visible+focused on the
+  chat with a fresh heartbeat (is_user_viewing)
+- Heartbeat expiry is a min-heap of deadlines with lazy deletion, drained
+  by a loop timer set for the earliest deadline (and on every query), so
+  a connection that goes quiet stops counting as a viewer on time
+
+Runs on the event loop; not thread-safe.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("presence")
+
+STALE_TIMEOUT = 90.0   # Seconds without a visibility update before a connection is stale
+
+
+class PresenceIndex:
+    """Reverse indexes over connected WebSocket clients."""
+
+    def __init__(self, stale_timeout: float = STALE_TIMEOUT):
+        self.stale_timeout = stale_timeout
+        self.clients: Dict[Any, Any] = {}             # ws -> ClientSession
+        self._subscribed: Dict[Any, str] = {}         # ws -> session it receives broadcasts for
+        self._subscribers: Dict[str, Set[Any]] = {}   # session -> ws set
+        self._viewing: Dict[Any, str] = {}            # ws -> chat it is actively viewing (fresh only)
+        self._viewers: Dict[str, Set[Any]] = {}       # chat -> ws set (fresh, active)
+        self._fresh: Set[Any] = set()                 # connections with a live heartbeat
+        self._deadlines: Dict[Any, float] = {}        # ws -> current heartbeat deadline
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at: Optional[float] = None
+
+    # ── Connections ───────────────────────────────────────────────────────────
+
+    def connect(self, ws: Any, session: Any):
+        """Track a newly accepted WebSocket and its ClientSession."""
+        self.clients[ws] = session
+        self._refresh(ws)
+
+    def disconnect(self, ws: Any):
+        """Forget a WebSocket everywhere (idempotent)."""
+        self.clients.pop(ws, None)
+        self.unsubscribe(ws)
+        self._set_viewing(ws, None)
+        self._fresh.discard(ws)
+        self._deadlines.pop(ws, None)
+
+    # ── Broadcast subscriptions ───────────────────────────────────────────────
+
+    def subscribe(self, ws: Any, session_id: str):
+        """Route session_id broadcasts to ws (a client follows one chat at a time)."""
+        self.unsubscribe(ws)
+        self._subscribed[ws] = session_id
+        self._subscribers.setdefault(session_id, set()).add(ws)
+
+    def unsubscribe(self, ws: Any):
+        session_id = self._subscribed.pop(ws, None)
+        if session_id is not None:
+            subscribers = self._subscribers.get(session_id)
+            if subscribers is not None:
+                subscribers.discard(ws)
+                if not subscribers:
+                    del self._subscribers[session_id]
+
+    def subscribers(self, session_id: str) -> List[Any]:
+        """Snapshot of the WebSockets subscribed to a session."""
+        return list(self._subscribers.get(session_id, ()))
+
+    # ── Visibility / heartbeats ───────────────────────────────────────────────
+
+    def heartbeat(self, ws: Any, is_active: bool, chat_id: Optional[str] = None):
+        """Apply a client's visibility update (also refreshes its heartbeat)."""
+        session = self.clients.get(ws)
+        if session is None:
+            return
+        session.update_visibility(is_active=is_active, chat_id=chat_id)
+        self._refresh(ws)
+
+    def _refresh(self, ws: Any):
+        session = self.clients[ws]
+        deadline = session.last_heartbeat + self.stale_timeout
+        self._deadlines[ws] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), ws))
+        self._fresh.add(ws)
+        self._set_viewing(ws, session.current_chat_id if session.is_active else None)
+        self._arm_timer()
+
+    def _set_viewing(self, ws: Any, chat_id: Optional[str]):
+        previous = self._viewing.get(ws)
+        if previous == chat_id:
+            return
+        if previous is not None:
+            viewers = self._viewers.get(previous)
+            if viewers is not None:
+                viewers.discard(ws)
+                if not viewers:
+                    del self._viewers[previous]
+            del self._viewing[ws]
+        if chat_id is not None:
+            self._viewing[ws] = chat_id
+            self._viewers.setdefault(chat_id, set()).add(ws)
+
+    def _expire(self, now: Optional[float] = None):
+        """Drop connections whose heartbeat deadline has passed."""
+        now = time.time() if now is None else now
+        while self._heap and self._heap[0][0] < now:
+            deadline, _, ws = heapq.heappop(self._heap)
+            if self._deadlines.get(ws) != deadline:
+                continue  # Superseded by a later heartbeat, or disconnected
+            del self._deadlines[ws]
+            self._fresh.discard(ws)
+            self._set_viewing(ws, None)
+
+    def _arm_timer(self):
+        if not self._heap:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # No loop: expiry still happens lazily on queries
+        earliest = self._heap[0][0]
+        if self._timer is not None and self._timer_at is not None and self._timer_at <= earliest:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = earliest
+        self._timer = loop.call_later(max(0.0, earliest - time.time()) + 0.01, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = self._timer_at = None
+        self._expire()
+        self._arm_timer()
+
+    # ── Queries ───────────────────────────────────────────────────────────────
+
+    def is_user_viewing(self, chat_id: str) -> bool:
+        """Is any fresh connection visible and focused on chat_id?"""
+        self._expire()
+        return bool(self._viewers.get(chat_id))
+
+    def has_active_connection(self) -> bool:
+        """Is any connection's heartbeat still fresh?"""
+        self._expire()
+        return bool(self._fresh)
+
+    def stats(self) -> Dict[str, Any]:
+        self._expire()
+        return {
+            "connections": len(self.clients),
+            "fresh": len(self._fresh),
+            "subscribed_sessions": len(self._subscribers),
+            "viewed_chats": len(self._viewers),
+            "heap_entries": len(self._heap),
+        }
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_presence: Optional[PresenceIndex] = None
+
+
+def get_presence() -> PresenceIndex:
+    """Get or create the process-wide presence index (event-loop only)."""
+    global _presence
+    if _presence is None:
+        _presence = PresenceIndex()
+    return _presence
@@ -1,26 +1,82 @@
 """
 Process Registry - Tracks running Claude processes (agents + primary).
 
-Simple JSON file at .claude/process_registry.json.
-Provides register/deregister/read with file locking for concurrent safety.
+The server process owns the registry in memory (serve()):
+- Writers take a short in-process lock and swap in a new entries dict
+  (copy-on-write), so reads never lock and never touch the disk
+- Other processes (out-of-process agents, scripts) reach it over a Unix
+  socket RPC at .claude/process_registry.sock (newline-delimited JSON)
+- .claude/process_registry.json is only a snapshot, written every
+  SNAPSHOT_INTERVAL seconds when something changed (and at shutdown)
+- Registered PIDs are watched with pidfds on the event loop, so entries
+  for exited processes are dropped the moment the process dies (with a
+  kill(pid, 0) check on read where pidfds aren't available)
+
+When no server is listening, callers fall back to the old behaviour: the
+JSON file, updated under an exclusive fcntl lock.
 
 Each entry has a unique `id` for deregistration. The `pid` field is used
-for dead-process pruning (if the OS PID is gone, the entry is stale).
+for liveness tracking and CPU/RSS sampling (sample_process()).
+
+In-process listeners (add_listener) are told about every register and
+deregister, e.g. so the agent scheduler can release capacity when a
+background agent finishes. Entries carry the agent scheduler lease token
+of the run that registered them (lease_token, a context variable the
+scheduler sets around runner calls and that tasks started by the runner
+inherit), so the scheduler binds entries to leases by token, not by name.
+The runner reports a finished run's tokens/cost with its deregistration
+(deregister_process(reg_id, usage=...)), which the scheduler meters on
+the bound lease.
 """
 
+import asyncio
 import json
 import fcntl
 import logging
 import os
+import socket
+import threading
+import time
 import uuid
+from contextvars import ContextVar
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 logger = logging.getLogger("process_registry")
 
 REGISTRY_FILE = Path("/home/debian/second_brain/.claude/process_registry.json")
+SOCKET_PATH = REGISTRY_FILE.with_suffix(".sock")
 
+SNAPSHOT_INTERVAL = 5.0
+RPC_TIMEOUT = 2.0
+
+
+# Agent scheduler lease of the run being registered (see agent_scheduler.bound_to)
+lease_token: ContextVar[Optional[str]] = ContextVar("agent_lease_token", default=None)
+
+# listener(event, reg_id, agent_name, lease_token, usage); event is "registered" or
+# "deregistered", usage is the run's tokens/cost when the runner reported them
+Listener = Callable[[str, str, Optional[str], Optional[str], Optional[Dict[str, Any]]], None]
+_listeners: List[Listener] = []
+
+
+def add_listener(listener: Listener) -> None:
+    """Call listener(event, reg_id, agent_name, lease_token, usage) after every register/deregister."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def _notify(event: str, reg_id: str, agent_name: Optional[str] = None, lease: Optional[str] = None,
+            usage: Optional[Dict[str, Any]] = None) -> None:
+    for listener in list(_listeners):
+        try:
+            listener(event, reg_id, agent_name, lease, usage)
+        except Exception as e:
+            logger.debug(f"Process registry listener failed: {e}")
+
+
+# ── File fallback (no server listening) ──────────────────────────────────────
 
 def _read_registry() -> list:
     """Read the registry file. Returns empty list if missing/corrupt."""
@@ -62,12 +118,11 @@ def _locked_update(fn):
             fcntl.flock(lock_fd, fcntl.LOCK_UN)
 
 
-def _unique_agent_name(entries: list, base_name: str) -> str:
+def _unique_agent_name(existing, base_name: str) -> str:
     """
-    Return a unique agent name. If base_name already exists in entries,
-    suffix with _1, _2, etc.
+    Return a unique agent name. If base_name is already in existing (a set
+    of names, or a name -> count index), suffix with _1, _2, etc.
     """
-    existing = {e["agent"] for e in entries}
     if base_name not in existing:
         return base_name
     i = 1
@@ -76,13 +131,255 @@ def _unique_agent_name(entries: list, base_name: str) -> str:
     return f"{base_name}_{i}"
 
 
+def _new_entry(reg_id: str, pid: Optional[int], agent: str, task: str, lease: Optional[str] = None) -> dict:
+    entry = {
+        "id": reg_id,
+        "pid": pid,
+        "agent": agent,
+        "task": task,
+        "started": datetime.utcnow().isoformat(),
+    }
+    if lease:
+        entry["lease"] = lease
+    return entry
+
+
+def _file_register(agent_name: str, task: str, pid: Optional[int], lease: Optional[str] = None) -> Tuple[str, str]:
+    reg_id = str(uuid.uuid4())[:8]
+    registered_name = None
+
+    def _do_register(entries):
+        nonlocal registered_name
+        registered_name = _unique_agent_name({e["agent"] for e in entries}, agent_name)
+        entries.append(_new_entry(reg_id, pid, registered_name, task, lease))
+        return entries
+
+    _locked_update(_do_register)
+    return reg_id, registered_name
+
+
+# ── In-memory registry (server process) ──────────────────────────────────────
+
+class _Registry:
+    """Copy-on-write entry table with pidfd liveness tracking."""
+
+    def __init__(self):
+        self._entries: Dict[str, dict] = {}   # Replaced, never mutated: safe to read without the lock
+        self._names: Dict[str, int] = {}      # Registered agent name -> entry count (under _write_lock)
+        self._write_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pidfds: Dict[int, int] = {}
+        self._dirty = True
+        self.stats = {"registered": 0, "deregistered": 0, "exited": 0, "rpc_calls": 0, "snapshots": 0}
+
+    def entries(self) -> List[dict]:
+        return list(self._entries.values())
+
+    def load(self, entries: List[dict]):
+        """Adopt entries (e.g. the last snapshot) and rebuild the name index."""
+        with self._write_lock:
+            self._entries = {e["id"]: e for e in entries if e.get("id")}
+            self._names = {}
+            for e in self._entries.values():
+                self._names[e.get("agent")] = self._names.get(e.get("agent"), 0) + 1
+
+    def register(self, agent_name: str, task: str, pid: Optional[int],
+                 lease: Optional[str] = None) -> Tuple[str, str]:
+        reg_id = str(uuid.uuid4())[:8]
+        with self._write_lock:
+            entries = dict(self._entries)
+            name = _unique_agent_name(self._names, agent_name)
+            entries[reg_id] = _new_entry(reg_id, pid, name, task, lease)
+            self._names[name] = self._names.get(name, 0) + 1
+            self._entries = entries
+            self._dirty = True
+            self.stats["registered"] += 1
+        if pid is not None and pid != os.getpid():
+            self._watch(pid)
+        _notify("registered", reg_id, agent_name, lease)
+        return reg_id, name
+
+    def remove(self, match: Callable[[dict], bool], usage: Optional[Dict[str, Any]] = None) -> List[str]:
+        with self._write_lock:
+            removed = [reg_id for reg_id, e in self._entries.items() if match(e)]
+            if removed:
+                for reg_id in removed:
+                    name = self._entries[reg_id]["agent"]
+                    if self._names.get(name, 0) > 1:
+                        self._names[name] -= 1
+                    else:
+                        self._names.pop(name, None)
+                self._entries = {k: e for k, e in self._entries.items() if k not in removed}
+                self._dirty = True
+                self.stats["deregistered"] += len(removed)
+        for reg_id in removed:
+            _notify("deregistered", reg_id, usage=usage)
+        return removed
+
+    def clear(self):
+        self.remove(lambda e: True)
+
+    # ── PID liveness ──────────────────────────────────────────────────────────
+
+    def _watch(self, pid: int):
+        loop = self._loop
+        if loop is None or not hasattr(os, "pidfd_open"):
+            return  # kill(pid, 0) on read instead
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._add_pidfd(pid)
+        else:
+            loop.call_soon_threadsafe(self._add_pidfd, pid)
+
+    def _add_pidfd(self, pid: int):
+        if pid in self._pidfds:
+            return
+        try:
+            fd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            self._on_exit(pid)
+            return
+        except OSError as e:
+            logger.debug(f"pidfd_open({pid}) failed: {e}")
+            return
+        self._pidfds[pid] = fd
+        self._loop.add_reader(fd, self._on_exit, pid)
+
+    def _on_exit(self, pid: int):
+        fd = self._pidfds.pop(pid, None)
+        if fd is not None:
+            self._loop.remove_reader(fd)
+            os.close(fd)
+        removed = self.remove(lambda e: e.get("pid") == pid)
+        if removed:
+            self.stats["exited"] += len(removed)
+            logger.info(f"Process {pid} exited; removed {len(removed)} registry entr{'y' if len(removed) == 1 else 'ies'}")
+
+    def prune_dead(self):
+        """Drop entries for dead PIDs that have no pidfd watcher."""
+        dead = {
+            e["pid"] for e in self._entries.values()
+            if e.get("pid") is not None and e["pid"] not in self._pidfds and not _pid_alive(e["pid"])
+        }
+        if dead:
+            self.remove(lambda e: e.get("pid") in dead)
+
+    # ── Snapshots ─────────────────────────────────────────────────────────────
+
+    def snapshot(self):
+        """Write the current entries to REGISTRY_FILE."""
+        with self._write_lock:
+            entries = self.entries()
+            self._dirty = False
+        _write_registry(entries)
+        self.stats["snapshots"] += 1
+
+    async def snapshot_loop(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            if self._dirty:
+                try:
+                    await asyncio.to_thread(self.snapshot)
+                except OSError as e:
+                    logger.warning(f"Process registry snapshot failed: {e}")
+
+    # ── RPC ───────────────────────────────────────────────────────────────────
+
+    def dispatch(self, op: str, args: Dict[str, Any]) -> Any:
+        self.stats["rpc_calls"] += 1
+        if op == "register":
+            return list(self.register(args["agent_name"], args.get("task") or "active", args.get("pid"),
+                                      args.get("lease")))
+        if op == "deregister":
+            return self.remove(lambda e: e.get("id") == args["reg_id"], args.get("usage"))
+        if op == "deregister_pid":
+            return self.remove(lambda e: e.get("pid") == args["pid"])
+        if op == "list":
+            self.prune_dead()
+            return self.entries()
+        raise ValueError(f"Unknown op: {op}")
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    response = {"ok": True, "result": self.dispatch(request["op"], request.get("args") or {})}
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+_local: Optional[_Registry] = None
+
+
+async def serve() -> None:
+    """
+    Host the registry in this (server) process: hold entries in memory,
+    accept RPC on SOCKET_PATH and snapshot to REGISTRY_FILE periodically.
+    """
+    global _local
+    registry = _Registry()
+    registry._loop = asyncio.get_running_loop()
+    registry.load(_read_registry())
+    _local = registry
+    try:
+        SOCKET_PATH.unlink(missing_ok=True)
+        await asyncio.start_unix_server(registry.handle_client, path=str(SOCKET_PATH))
+        os.chmod(SOCKET_PATH, 0o600)
+    except OSError as e:
+        logger.warning(f"Process registry RPC unavailable ({e}); other processes will use the file")
+    asyncio.create_task(registry.snapshot_loop())
+    logger.info(f"Process registry serving in-process (RPC at {SOCKET_PATH})")
+
+
+def _rpc(op: str, **args) -> Any:
+    """Call the server's registry. Raises OSError/RuntimeError if unreachable."""
+    if not SOCKET_PATH.exists():
+        raise FileNotFoundError(SOCKET_PATH)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(RPC_TIMEOUT)
+        sock.connect(str(SOCKET_PATH))
+        sock.sendall(json.dumps({"op": op, "args": args}).encode("utf-8") + b"\n")
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    try:
+        response = json.loads(buf)
+    except ValueError:
+        raise RuntimeError(f"Bad registry RPC response for {op}")
+    if not response.get("ok"):
+        raise RuntimeError(response.get("error") or "registry RPC failed")
+    return response.get("result")
+
+
+# ── Public API ───────────────────────────────────────────────────────────────
+
 def clear_registry() -> None:
     """
     Clear all entries from the registry.
 
     Called at server startup to remove stale entries from previous runs.
     """
-    _write_registry([])
+    if _local is not None:
+        _local.clear()
+        _local.snapshot()
+    else:
+        _write_registry([])
     logger.info("Cleared process registry")
 
 
@@ -92,6 +389,7 @@ def register_process(
     agent_name: str,
     task: str = "active",
     pid: Optional[int] = _SENTINEL,
+    lease: Optional[str] = None,
 ) -> str:
     """
     Register a running process.
@@ -100,9 +398,11 @@ def register_process(
         agent_name: Base name (e.g. "librarian", "primary_claude").
                     Will be suffixed if duplicates exist.
         task: Description of what the process is doing (truncated to 80 chars).
-        pid: OS process ID for dead-process pruning. Defaults to os.getpid().
+        pid: OS process ID for liveness tracking. Defaults to os.getpid().
              Pass None explicitly for managed processes (e.g. SDK agents)
              where the real subprocess PID is not accessible.
+        lease: Agent scheduler lease token. Defaults to the caller's
+               lease_token context (set around scheduled runner calls).
 
     Returns:
         A unique registration ID (use this with deregister_process).
@@ -110,38 +410,40 @@ def register_process(
     if pid is _SENTINEL:
         pid = os.getpid()
     task_truncated = task[:80] if task else "active"
-    reg_id = str(uuid.uuid4())[:8]
-    registered_name = None
+    lease = lease or lease_token.get()
 
-    def _do_register(entries):
-        nonlocal registered_name
-        registered_name = _unique_agent_name(entries, agent_name)
-        entries.append({
-            "id": reg_id,
-            "pid": pid,
-            "agent": registered_name,
-            "task": task_truncated,
-            "started": datetime.utcnow().isoformat(),
-        })
-        return entries
+    if _local is not None:
+        reg_id, registered_name = _local.register(agent_name, task_truncated, pid, lease)
+    else:
+        try:
+            reg_id, registered_name = _rpc("register", agent_name=agent_name, task=task_truncated,
+                                           pid=pid, lease=lease)
+        except (OSError, RuntimeError):
+            reg_id, registered_name = _file_register(agent_name, task_truncated, pid, lease)
+        _notify("registered", reg_id, agent_name, lease)
 
-    _locked_update(_do_register)
     pid_label = f"PID {pid}" if pid is not None else "managed"
     logger.info(f"Registered process: {registered_name} ({pid_label}, id={reg_id})")
     return reg_id
 
 
-def deregister_process(reg_id: str) -> None:
+def deregister_process(reg_id: str, usage: Optional[Dict[str, Any]] = None) -> None:
     """
     Remove a process from the registry by its registration ID.
 
     Args:
         reg_id: The registration ID returned by register_process().
+        usage: The finished run's tokens/cost (usage_store.usage_from_result),
+            metered on the run's agent scheduler lease.
     """
-    def _do_deregister(entries):
-        return [e for e in entries if e.get("id") != reg_id]
-
-    _locked_update(_do_deregister)
+    if _local is not None:
+        _local.remove(lambda e: e.get("id") == reg_id, usage)
+    else:
+        try:
+            _rpc("deregister", reg_id=reg_id, usage=usage)
+        except (OSError, RuntimeError):
+            _locked_update(lambda entries: [e for e in entries if e.get("id") != reg_id])
+        _notify("deregistered", reg_id, usage=usage)
     logger.info(f"Deregistered process id={reg_id}")
 
 
@@ -155,19 +457,31 @@ def deregister_by_pid(pid: Optional[int] = None) -> None:
     if pid is None:
         pid = os.getpid()
 
-    def _do_deregister(entries):
-        return [e for e in entries if e.get("pid") != pid]
-
-    _locked_update(_do_deregister)
+    if _local is not None:
+        _local.remove(lambda e: e.get("pid") == pid)
+        _local.snapshot()  # Shutdown path: don't wait for the next interval
+    else:
+        try:
+            _rpc("deregister_pid", pid=pid)
+        except (OSError, RuntimeError):
+            _locked_update(lambda entries: [e for e in entries if e.get("pid") != pid])
     logger.info(f"Deregistered all processes with PID {pid}")
 
 
 def get_process_list() -> list:
     """
-    Read the current registry and prune dead PIDs.
+    Return the registered processes whose OS PID is still alive.
 
-    Returns entries for processes whose OS PID is still alive.
+    Entries with pid=None are managed processes and are always kept.
     """
+    if _local is not None:
+        _local.prune_dead()
+        return _local.entries()
+    try:
+        return _rpc("list")
+    except (OSError, RuntimeError):
+        pass
+
     entries = _read_registry()
 
     # Prune dead PIDs (entries with pid=None are managed and always kept)
@@ -194,6 +508,13 @@ def get_process_list() -> list:
     return alive
 
 
+def registry_stats() -> Dict[str, Any]:
+    """Counters for the in-memory registry (empty when not serving)."""
+    if _local is None:
+        return {}
+    return {**_local.stats, "entries": len(_local.entries()), "watched_pids": len(_local._pidfds)}
+
+
 def _pid_alive(pid: int) -> bool:
     """Check if a PID is still running."""
     try:
@@ -201,3 +522,51 @@ def _pid_alive(pid: int) -> bool:
         return True
     except OSError:
         return False
+
+
+# ── CPU / RSS sampling ───────────────────────────────────────────────────────
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Per-caller sample state: pid -> (monotonic time, cpu seconds)
+CpuSamples = Dict[int, Tuple[float, float]]
+
+
+def sample_process(pid: Optional[int], samples: Optional[CpuSamples] = None) -> Optional[Dict[str, float]]:
+    """
+    CPU percent and RSS for a PID, from /proc (None if unavailable).
+
+    CPU is measured since the previous sample of the same PID in samples,
+    or over the process lifetime on the first sample (or without samples).
+    Each caller passes its own samples dict, so callers sampling at
+    different rates (or from different threads) don't shorten each
+    other's intervals.
+    """
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        if samples is not None:
+            samples.pop(pid, None)
+        return None
+
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / _CLK_TCK
+    now = time.monotonic()
+    previous = samples.get(pid) if samples is not None else None
+    if previous and now > previous[0]:
+        elapsed, used = now - previous[0], cpu_seconds - previous[1]
+    else:
+        elapsed, used = uptime - int(fields[19]) / _CLK_TCK, cpu_seconds
+    if samples is not None:
+        samples[pid] = (now, cpu_seconds)
+    return {
+        "cpu_percent": round(100.0 * used / elapsed, 1) if elapsed > 0 else 0.0,
+        "rss_mb": round(resident_pages * _PAGE_SIZE / (1024 * 1024), 1),
+    }
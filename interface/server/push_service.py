@@ -158,64 +158,120 @@ def _build_email_html(title: str, body: str, chat_id: str, critical: bool = Fals
 </html>'''
 
 
-async def send_push_notification(
-    title: str,
-    body: str,
-    chat_id: str,
-    critical: bool = False
-) -> int:
+def _subject_for(title: str, critical: bool) -> str:
+    """Email subject with a context emoji."""
+    if critical:
+        return f"🚨 URGENT: {title}"
+    elif "completed" in title.lower() or "finished" in title.lower():
+        return f"✅ {title}"
+    elif "response" in title.lower() or "message" in title.lower():
+        return f"💬 {title}"
+    return f"🧠 {title}"
+
+
+def _chat_link(chat_id: str) -> str:
+    return f"{BASE_URL}/?chat={chat_id}" if chat_id else BASE_URL
+
+
+def build_notification_email(title: str, body: str, chat_id: str, critical: bool = False) -> Dict[str, str]:
+    """Subject, plain text and HTML for a single notification."""
+    return {
+        "subject": _subject_for(title, critical),
+        "plain": f"{title}\n\n{body}\n\nOpen chat: {_chat_link(chat_id)}",
+        "html": _build_email_html(title, body, chat_id, critical),
+    }
+
+
+def build_digest_email(items: List[Dict[str, str]]) -> Dict[str, str]:
     """
-    Send notification via email (replaces web push).
+    One email summarizing several non-critical notifications.
 
-    Same signature as the original push notification function for compatibility.
-    Returns 1 on success, 0 on failure.
+    items: dicts with title, body and chat_id, oldest first.
     """
-    try:
+    import html
+
+    title = f"{len(items)} new messages from Claude"
+    chats = {item["chat_id"] for item in items}
+    chat_id = next(iter(chats)) if len(chats) == 1 else ""
+
+    plain_parts = []
+    html_parts = []
+    for item in items:
+        link = _chat_link(item["chat_id"])
+        plain_parts.append(f"- {item['title']}: {item['body']}\n  {link}")
+        html_parts.append(
+            f'<strong>{html.escape(item["title"])}</strong><br>{html.escape(item["body"])}<br>'
+            f'<a href="{link}" style="color: #6366f1; font-size: 13px;">Open chat</a>'
+        )
+    return {
+        "subject": _subject_for(title, False),
+        "plain": f"{title}\n\n" + "\n\n".join(plain_parts),
+        "html": _build_email_html(title, "<br><br>".join(html_parts), chat_id),
+    }
+
+
+# The authenticated Gmail service is built once and reused; it is only
+# touched from the dispatcher's single sender thread.
+_gmail_service = None
+
+
+def _get_service():
+    global _gmail_service
+    if _gmail_service is None:
         import google_tools
-        import base64
-        from email.mime.text import MIMEText
-        from email.mime.multipart import MIMEMultipart
-
-        # Build email subject with context emoji
-        if critical:
-            subject = f"🚨 URGENT: {title}"
-        elif "completed" in title.lower() or "finished" in title.lower():
-            subject = f"✅ {title}"
-        elif "response" in title.lower() or "message" in title.lower():
-            subject = f"💬 {title}"
-        else:
-            subject = f"🧠 {title}"
-
-        # Build HTML body
-        html_body = _build_email_html(title, body, chat_id, critical)
-
-        # Authenticate and get Gmail service
         creds = google_tools.authenticate()
-        service = google_tools._get_gmail_service(creds)
+        _gmail_service = google_tools._get_gmail_service(creds)
+    return _gmail_service
+
 
-        # Build the email
-        message = MIMEMultipart('alternative')
-        message['To'] = NOTIFICATION_EMAIL
-        message['Subject'] = subject
+def deliver_email(email: Dict[str, str]) -> str:
+    """
+    Send a built email through Gmail (blocking). Returns the message ID.
+
+    Raises on failure; the cached service is dropped so the next attempt
+    re-authenticates.
+    """
+    global _gmail_service
+    import base64
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
 
-        # Plain text fallback
-        chat_link = f"{BASE_URL}/?chat={chat_id}" if chat_id else BASE_URL
-        plain_text = f"{title}\n\n{body}\n\nOpen chat: {chat_link}"
+    message = MIMEMultipart('alternative')
+    message['To'] = NOTIFICATION_EMAIL
+    message['Subject'] = email["subject"]
 
-        # Attach both plain text and HTML versions
-        message.attach(MIMEText(plain_text, 'plain'))
-        message.attach(MIMEText(html_body, 'html'))
+    # Attach both plain text and HTML versions
+    message.attach(MIMEText(email["plain"], 'plain'))
+    message.attach(MIMEText(email["html"], 'html'))
 
-        # Encode and send
-        raw = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-        result = service.users().messages().send(
+    raw = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+    try:
+        result = _get_service().users().messages().send(
             userId='me',
             body={'raw': raw}
         ).execute()
+    except Exception:
+        _gmail_service = None
+        raise
+
+    logger.info(f"Email notification sent: {email['subject']} (message_id: {result.get('id')})")
+    return result.get('id')
 
-        logger.info(f"Email notification sent: {subject} (message_id: {result.get('id')})")
-        return 1
 
-    except Exception as e:
-        logger.error(f"Email notification failed: {e}")
-        return 0
+async def send_push_notification(
+    title: str,
+    body: str,
+    chat_id: str,
+    critical: bool = False
+) -> int:
+    """
+    Send notification via email (replaces web push).
+
+    Same signature as the original push notification function for compatibility.
+    Delivery goes through the notification dispatcher: critical notifications
+    are sent right away and this waits for the first attempt (failures keep
+    retrying in the background); others are queued and may be coalesced into
+    a digest. Returns 1 on success (or once queued), 0 on failure.
+    """
+    from notification_dispatcher import get_notification_dispatcher
+    return await get_notification_dispatcher().submit(title, body, chat_id, critical)
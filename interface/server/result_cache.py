@@ -0,0 +1,256 @@
+"""
+Result Cache - Content-addressed cache for repeatable agent and LLM calls.
+
+Retried turns, regenerates and scheduled research re-issue the same
+invoke_agent / consult_llm / summarization calls with identical inputs,
+and every repeat paid for a full model run. Results are now cached by
+content:
+
+- Key: sha256 of (tool, agent/model, normalized prompt, config hash), so
+  only inputs that affect the output participate. Normalization only folds
+  line endings and trailing whitespace: indentation is meaningful (code)
+- Per-tool TTLs (TOOL_TTLS); expired entries are dropped on read and by a
+  periodic prune
+- Persisted as one JSON file per entry under .claude/result_cache/<tool>/,
+  with a small in-memory LRU in front of the disk
+- Callers opt in per call; bypass=True skips the lookup but still stores
+  the fresh result. RESULT_CACHE_DISABLED=1 turns the cache off entirely
+- Hit/miss/bypass counts per tool, plus the run time and cost (USD where
+  the SDK reports it, otherwise estimated tokens) saved by hits
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("result_cache")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+CACHE_DIR = Path(ROOT_DIR) / ".claude" / "result_cache"
+
+HOUR = 3600
+TOOL_TTLS = {
+    "invoke_agent": 6 * HOUR,
+    "invoke_agent_graph": 24 * HOUR,
+    "consult_llm": 24 * HOUR,
+    "page_summary": 7 * 24 * HOUR,      # page_parser mode=summary, keyed on page content
+    "compact_summary": 7 * 24 * HOUR,   # compact_conversation, keyed on the compacted messages
+}
+DEFAULT_TTL = HOUR
+
+MEMORY_ENTRIES = 128
+PRUNE_EVERY_PUTS = 100
+CHARS_PER_TOKEN = 4
+
+DISABLED = os.environ.get("RESULT_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Fold line-ending and trailing-whitespace differences; indentation is kept."""
+    text = prompt.replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip("\n")
+
+
+def config_hash(config: Optional[Dict[str, Any]]) -> str:
+    """Stable hash of the call options that affect the result."""
+    raw = json.dumps(config or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(tool: str, target: str, prompt: str, config: Optional[Dict[str, Any]] = None) -> str:
+    raw = json.dumps([tool, target or "", normalize_prompt(prompt), config_hash(config)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _new_tool_stats() -> Dict[str, Any]:
+    return {"hits": 0, "misses": 0, "bypasses": 0, "stores": 0,
+            "saved_seconds": 0.0, "saved_cost_usd": 0.0, "saved_tokens_est": 0}
+
+
+class ResultCache:
+    """Disk-backed, TTL-bounded result cache with an in-memory LRU."""
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, ttls: Optional[Dict[str, float]] = None):
+        self.cache_dir = Path(cache_dir)
+        self.ttls = dict(TOOL_TTLS if ttls is None else ttls)
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._puts = 0
+
+    def ttl(self, tool: str) -> float:
+        return self.ttls.get(tool, DEFAULT_TTL)
+
+    def _path(self, tool: str, key: str) -> Path:
+        return self.cache_dir / tool / f"{key}.json"
+
+    def _tool_stats(self, tool: str) -> Dict[str, Any]:
+        return self._stats.setdefault(tool, _new_tool_stats())
+
+    # ── Lookup / store ────────────────────────────────────────────────────────
+
+    def get(self, tool: str, target: str, prompt: str, config: Optional[Dict[str, Any]] = None,
+            bypass: bool = False) -> Optional[str]:
+        """Cached result for this call, or None (miss, expired, bypassed or disabled)."""
+        if DISABLED:
+            return None
+        if bypass:
+            with self._lock:
+                self._tool_stats(tool)["bypasses"] += 1
+            return None
+
+        key = cache_key(tool, target, prompt, config)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is None:
+            try:
+                entry = json.loads(self._path(tool, key).read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                entry = None
+
+        now = time.time()
+        if entry is not None and now - entry.get("created", 0) > self.ttl(tool):
+            self._path(tool, key).unlink(missing_ok=True)
+            entry = None
+
+        with self._lock:
+            stats = self._tool_stats(tool)
+            if entry is None:
+                self._memory.pop(key, None)
+                stats["misses"] += 1
+                return None
+            self._remember(key, entry)
+            stats["hits"] += 1
+            stats["saved_seconds"] += entry.get("duration", 0.0)
+            stats["saved_cost_usd"] += entry.get("cost_usd") or 0.0
+            stats["saved_tokens_est"] += entry.get("tokens_est", 0)
+        logger.debug(f"Result cache hit for {tool} ({target}), age {now - entry['created']:.0f}s")
+        return entry.get("result")
+
+    def put(self, tool: str, target: str, prompt: str, result: str,
+            config: Optional[Dict[str, Any]] = None, duration: float = 0.0,
+            cost_usd: Optional[float] = None):
+        """Store a successful result (only call this for results worth replaying)."""
+        if DISABLED or not result:
+            return
+        key = cache_key(tool, target, prompt, config)
+        entry = {
+            "tool": tool,
+            "target": target,
+            "result": result,
+            "created": time.time(),
+            "duration": round(duration, 2),
+            "cost_usd": cost_usd,
+            "tokens_est": (len(prompt) + len(result)) // CHARS_PER_TOKEN,
+        }
+        path = self._path(tool, key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(path)
+        except OSError as e:
+            logger.warning(f"Could not persist {tool} result to cache: {e}")
+        with self._lock:
+            self._remember(key, entry)
+            self._tool_stats(tool)["stores"] += 1
+            self._puts += 1
+            prune = self._puts % PRUNE_EVERY_PUTS == 0
+        if prune:
+            self.prune()
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    # ── Maintenance ───────────────────────────────────────────────────────────
+
+    def prune(self) -> int:
+        """Delete expired entries from disk. Returns the number removed."""
+        removed = 0
+        now = time.time()
+        if not self.cache_dir.is_dir():
+            return 0
+        for tool_dir in self.cache_dir.iterdir():
+            if not tool_dir.is_dir():
+                continue
+            ttl = self.ttl(tool_dir.name)
+            for path in tool_dir.glob("*.json"):
+                try:
+                    if now - path.stat().st_mtime > ttl:
+                        path.unlink()
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            logger.info(f"Pruned {removed} expired result cache entries")
+        return removed
+
+    def clear(self, tool: Optional[str] = None):
+        """Drop cached results (all tools, or one)."""
+        with self._lock:
+            self._memory = OrderedDict(
+                (k, e) for k, e in self._memory.items() if tool is not None and e.get("tool") != tool
+            )
+        dirs = [self.cache_dir / tool] if tool else [d for d in self.cache_dir.glob("*") if d.is_dir()]
+        for tool_dir in dirs:
+            for path in tool_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tools = {tool: dict(s) for tool, s in self._stats.items()}
+            memory_entries = len(self._memory)
+        totals = _new_tool_stats()
+        for s in tools.values():
+            lookups = s["hits"] + s["misses"]
+            s["hit_rate"] = round(s["hits"] / lookups, 3) if lookups else 0.0
+            s["saved_seconds"] = round(s["saved_seconds"], 1)
+            s["saved_cost_usd"] = round(s["saved_cost_usd"], 4)
+            for name in totals:
+                totals[name] += s[name]
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = round(totals["hits"] / lookups, 3) if lookups else 0.0
+        totals["saved_seconds"] = round(totals["saved_seconds"], 1)
+        totals["saved_cost_usd"] = round(totals["saved_cost_usd"], 4)
+        disk_entries = {}
+        if self.cache_dir.is_dir():
+            for tool_dir in self.cache_dir.iterdir():
+                if tool_dir.is_dir():
+                    disk_entries[tool_dir.name] = sum(1 for _ in tool_dir.glob("*.json"))
+        return {
+            "enabled": not DISABLED,
+            "ttls": self.ttls,
+            "memory_entries": memory_entries,
+            "disk_entries": disk_entries,
+            "totals": totals,
+            "tools": tools,
+        }
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Get or create the process-wide result cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
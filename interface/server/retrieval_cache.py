@@ -0,0 +1,256 @@
+"""
+Retrieval Cache - Per-chat reuse of auto_retrieve_context results across turns.
+
+Every user message used to pay for an LLM query rewrite plus a vector search,
+even though consecutive turns in a chat usually retrieve the same memories.
+This cache sits in front of both:
+
+- Results are cached per (chat, agent), keyed by the embedding of the
+  rewritten query; a new query whose embedding is within
+  SIMILARITY_THRESHOLD (cosine) of a cached one reuses that block
+- Entries are tagged with the agent's memory version (a counter bumped by
+  the memory mutation hooks, plus the memories.json mtime for edits made
+  outside this process); any mutation invalidates them
+- Short continuations ("ok do it", "yes please") skip the rewrite LLM call
+  and reuse the chat's previous rewritten query, which then hits the cache
+- stats() reports hits, misses, rewrite skips and the hit rate
+
+If the embedding model is unavailable, queries fall back to exact-text
+matching.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("retrieval_cache")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+AGENTS_DIR = os.path.join(ROOT_DIR, ".claude", "agents")
+
+SIMILARITY_THRESHOLD = float(os.environ.get("RETRIEVAL_CACHE_SIMILARITY", "0.92"))
+ENTRY_TTL_SECONDS = 15 * 60    # Cached blocks also age out (other sources change too)
+MAX_ENTRIES_PER_CHAT = 8
+MAX_CHATS = 256
+EMBED_TIMEOUT = 5.0
+CONTINUATION_MAX_WORDS = 6
+
+_WORD = re.compile(r"[\w']+")
+
+# Words that carry no retrieval signal on their own. A short message made up
+# only of these continues the previous topic.
+CONTINUATION_WORDS = frozenset("""
+    ok okay k kk yes yeah yep yup ya sure no nope nah please pls thanks thank thx ty
+    you go ahead do it that this those them sounds looks good great perfect cool nice
+    awesome alright right fine agreed exactly correct lgtm continue proceed keep going
+    carry on and then next same again more let's lets let us so a the that's thats
+    makes sense got gotcha i see sgtm done works hmm of course absolutely
+""".split())
+
+
+def is_continuation(text: str) -> bool:
+    """True for short follow-ups that add nothing to search for ("ok do it", "yes please")."""
+    text = (text or "").strip()
+    if not text:
+        return False
+    words = _WORD.findall(text.lower())
+    if not words:
+        # Punctuation / emoji only ("👍", "?")
+        return len(text) <= 8
+    return len(words) <= CONTINUATION_MAX_WORDS and all(w in CONTINUATION_WORDS for w in words)
+
+
+def _query_text(queries: Any) -> str:
+    """rewrite_query_for_retrieval returns a string or a list of strings."""
+    if isinstance(queries, (list, tuple)):
+        return "\n".join(str(q) for q in queries)
+    return str(queries or "")
+
+
+@dataclass
+class _Entry:
+    agent: str
+    query: str
+    vector: Any                    # Normalized float32 vector, or None (exact match only)
+    version: Tuple[int, int]
+    block: str
+    created: float
+    hits: int = 0
+
+
+@dataclass
+class Lookup:
+    """Result of a cache lookup; pass it back to store() on a miss."""
+    hit: bool
+    block: str = ""
+    similarity: float = 0.0
+    query: str = ""
+    vector: Any = None
+
+
+class RetrievalCache:
+    """Per-chat cache of retrieved context blocks with similarity reuse."""
+
+    def __init__(self, similarity_threshold: float = SIMILARITY_THRESHOLD,
+                 ttl_seconds: float = ENTRY_TTL_SECONDS):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self._chats: "OrderedDict[str, List[_Entry]]" = OrderedDict()
+        # (chat_id, agent) -> last rewritten queries (as returned by the rewriter)
+        self._last_queries: Dict[Tuple[str, str], Any] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "rewrite_skips": 0, "invalidations": 0, "expired": 0}
+
+    # ── Memory versions ───────────────────────────────────────────────────────
+
+    def _memory_version(self, agent: str) -> Tuple[int, int]:
+        try:
+            mtime = os.stat(os.path.join(AGENTS_DIR, agent, "memories.json")).st_mtime_ns
+        except OSError:
+            mtime = 0
+        return self._versions.get(agent, 0), mtime
+
+    def invalidate_agent(self, agent: str):
+        """Drop every cached block for an agent (called on memory mutation)."""
+        with self._lock:
+            self._versions[agent] = self._versions.get(agent, 0) + 1
+            dropped = 0
+            for entries in self._chats.values():
+                before = len(entries)
+                entries[:] = [e for e in entries if e.agent != agent]
+                dropped += before - len(entries)
+            self._stats["invalidations"] += dropped
+
+    def forget_chat(self, chat_id: str):
+        with self._lock:
+            self._chats.pop(chat_id, None)
+            for key in [k for k in self._last_queries if k[0] == chat_id]:
+                del self._last_queries[key]
+
+    # ── Rewrite skipping ──────────────────────────────────────────────────────
+
+    def previous_queries(self, chat_id: str, agent: str, raw_query: str) -> Optional[Any]:
+        """
+        The chat's previous rewritten queries if raw_query is a short
+        continuation, else None (the caller should run the rewrite).
+        """
+        if not chat_id or not is_continuation(raw_query):
+            return None
+        with self._lock:
+            previous = self._last_queries.get((chat_id, agent))
+            if previous is not None:
+                self._stats["rewrite_skips"] += 1
+            return previous
+
+    # ── Lookup / store ────────────────────────────────────────────────────────
+
+    def _embed(self, text: str):
+        import numpy as np
+        from embedding_queue import get_embedding_queue
+
+        try:
+            matrix = get_embedding_queue().encode([text], is_query=True, background=False,
+                                                  timeout=EMBED_TIMEOUT)
+        except Exception as e:
+            logger.debug(f"Query embedding failed, using exact match: {e}")
+            return None
+        if matrix is None:
+            return None
+        vector = np.asarray(matrix[0], dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def lookup(self, chat_id: str, agent: str, queries: Any) -> Lookup:
+        """Find a cached block for these rewritten queries. Blocking (embeds the query)."""
+        import numpy as np
+
+        query = _query_text(queries)
+        with self._lock:
+            self._last_queries[(chat_id, agent)] = queries
+        vector = self._embed(query)
+        version = self._memory_version(agent)
+        now = time.time()
+
+        best: Optional[_Entry] = None
+        best_similarity = 0.0
+        with self._lock:
+            entries = self._chats.get(chat_id, [])
+            live = []
+            for entry in entries:
+                if now - entry.created > self.ttl_seconds or (
+                    entry.agent == agent and entry.version != version
+                ):
+                    self._stats["expired"] += 1
+                    continue
+                live.append(entry)
+                if entry.agent != agent:
+                    continue
+                if entry.query == query:
+                    similarity = 1.0
+                elif vector is not None and entry.vector is not None:
+                    similarity = float(np.dot(vector, entry.vector))
+                else:
+                    continue
+                if similarity > best_similarity:
+                    best, best_similarity = entry, similarity
+            entries[:] = live
+
+            if best is not None and best_similarity >= self.similarity_threshold:
+                best.hits += 1
+                self._stats["hits"] += 1
+                self._chats.move_to_end(chat_id)
+                return Lookup(hit=True, block=best.block, similarity=best_similarity,
+                              query=query, vector=vector)
+            self._stats["misses"] += 1
+        return Lookup(hit=False, query=query, vector=vector)
+
+    def store(self, chat_id: str, agent: str, lookup: Lookup, block: str):
+        """Cache the block retrieved after a miss."""
+        entry = _Entry(
+            agent=agent, query=lookup.query, vector=lookup.vector,
+            version=self._memory_version(agent), block=block or "", created=time.time(),
+        )
+        with self._lock:
+            entries = self._chats.setdefault(chat_id, [])
+            entries.append(entry)
+            if len(entries) > MAX_ENTRIES_PER_CHAT:
+                del entries[:-MAX_ENTRIES_PER_CHAT]
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > MAX_CHATS:
+                old_chat, _ = self._chats.popitem(last=False)
+                for key in [k for k in self._last_queries if k[0] == old_chat]:
+                    del self._last_queries[key]
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["chats"] = len(self._chats)
+            stats["entries"] = sum(len(e) for e in self._chats.values())
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["similarity_threshold"] = self.similarity_threshold
+        return stats
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_cache: Optional[RetrievalCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """Get or create the process-wide retrieval cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RetrievalCache()
+    return _cache
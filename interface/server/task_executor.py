@@ -0,0 +1,267 @@
+"""
+Task Executor - Concurrency-limited execution pool for scheduled work.
+
+Replaces the single lock that serialized every prompt-type scheduled task
+and the unbounded create_task() used for agent-type tasks:
+
+- A global concurrency limit, plus per-key limits (one key per agent, and
+  a "prompt" key for tasks that share the primary SDK session). Jobs whose
+  capacity is governed elsewhere (agent tasks: the agent scheduler) are
+  submitted with global_slot=False and only take their key's slot, so
+  waiting for that other admission never holds a global slot
+- Priority classes: scheduled > maintenance. A free slot goes to the
+  highest-priority job whose key has capacity, FIFO within a class
+- Queue deadlines: a job that can't start before its deadline is dropped
+  instead of running late behind a backlog
+- Per-task run history (runs, failures, expiries, wait and run durations)
+
+Runs on the event loop; submit() must be called from the loop thread.
+
+Limits: SCHEDULED_MAX_CONCURRENT (default 4) and SCHEDULED_AGENT_CONCURRENCY
+(default 1 run per agent at a time).
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger("task_executor")
+
+PRIORITY_SCHEDULED = 1
+PRIORITY_MAINTENANCE = 2
+PRIORITY_NAMES = {
+    PRIORITY_SCHEDULED: "scheduled",
+    PRIORITY_MAINTENANCE: "maintenance",
+}
+
+DEFAULT_MAX_CONCURRENT = int(os.environ.get("SCHEDULED_MAX_CONCURRENT", "4"))
+DEFAULT_PER_KEY = int(os.environ.get("SCHEDULED_AGENT_CONCURRENCY", "1"))
+HISTORY_PER_TASK = 20
+
+
+class DeadlineExpired(Exception):
+    """
+    Raised into a job's future when it could not start before its deadline.
+    Jobs may raise it themselves (e.g. still waiting for another admission
+    at the deadline); it is then recorded as expired, not failed.
+    """
+
+
+@dataclass
+class _Job:
+    name: str
+    key: str
+    priority: int
+    factory: Callable[[], Awaitable[Any]]
+    deadline: Optional[float]
+    submitted: float
+    future: asyncio.Future
+    global_slot: bool = True
+
+
+@dataclass
+class TaskHistory:
+    """Run history for one task name."""
+    runs: int = 0
+    failures: int = 0
+    expired: int = 0
+    total_run_seconds: float = 0.0
+    total_wait_seconds: float = 0.0
+    last_status: str = ""
+    last_finished: Optional[float] = None
+    recent: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=HISTORY_PER_TASK))
+
+    def to_dict(self) -> Dict[str, Any]:
+        started = self.runs + self.failures
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "expired": self.expired,
+            "avg_run_seconds": round(self.total_run_seconds / started, 2) if started else None,
+            "avg_wait_seconds": round(self.total_wait_seconds / started, 2) if started else None,
+            "last_status": self.last_status,
+            "last_finished": self.last_finished,
+            "recent": list(self.recent),
+        }
+
+
+class TaskExecutor:
+    """Priority queue of coroutine jobs with global and per-key concurrency limits."""
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+                 per_key_default: int = DEFAULT_PER_KEY,
+                 key_limits: Optional[Dict[str, int]] = None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_key_default = max(1, per_key_default)
+        self.key_limits: Dict[str, int] = dict(key_limits or {})
+        self._queue: List[tuple] = []  # (priority, seq, job)
+        self._seq = itertools.count()
+        self._running: Dict[str, int] = {}
+        self._active = 0           # Running jobs holding a global slot
+        self._history: Dict[str, TaskHistory] = {}
+
+    def _key_limit(self, key: str) -> int:
+        return self.key_limits.get(key, self.per_key_default)
+
+    # ── Submit ────────────────────────────────────────────────────────────────
+
+    def submit(
+        self,
+        factory: Callable[[], Awaitable[Any]],
+        *,
+        name: str,
+        key: str,
+        priority: int = PRIORITY_SCHEDULED,
+        deadline: Optional[float] = None,
+        global_slot: bool = True,
+    ) -> asyncio.Future:
+        """
+        Queue factory() to run when a slot is free.
+
+        Args:
+            factory: Zero-arg callable returning the coroutine to run
+            name: Task name for run history (e.g. the scheduled task id)
+            key: Concurrency key (e.g. "agent:librarian"); limited per key
+            priority: PRIORITY_SCHEDULED / PRIORITY_MAINTENANCE
+            deadline: Absolute time.time() by which the job must have started
+            global_slot: False to skip the global limit (only the key limit applies)
+
+        Returns a future with the coroutine's result (DeadlineExpired if dropped).
+        """
+        job = _Job(
+            name=name, key=key, priority=priority, factory=factory, deadline=deadline,
+            submitted=time.time(), future=asyncio.get_running_loop().create_future(),
+            global_slot=global_slot,
+        )
+        heapq.heappush(self._queue, (priority, next(self._seq), job))
+        self._pump()
+        return job.future
+
+    # ── Scheduling ────────────────────────────────────────────────────────────
+
+    def _pump(self):
+        """Start queued jobs while there is capacity."""
+        now = time.time()
+        skipped = []
+        while self._queue:
+            priority, seq, job = heapq.heappop(self._queue)
+            if job.deadline is not None and now > job.deadline:
+                self._expire(job, now)
+                continue
+            if (
+                (job.global_slot and self._active >= self.max_concurrent)
+                or self._running.get(job.key, 0) >= self._key_limit(job.key)
+            ):
+                skipped.append((priority, seq, job))
+                continue
+            self._start(job, now)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    def _expire(self, job: _Job, now: float):
+        history = self._history.setdefault(job.name, TaskHistory())
+        history.expired += 1
+        history.last_status = "expired"
+        history.recent.append({"status": "expired", "waited": round(now - job.submitted, 2), "at": now})
+        logger.warning(f"Task '{job.name}' dropped: not started before its deadline "
+                       f"(waited {now - job.submitted:.0f}s)")
+        if not job.future.done():
+            job.future.set_exception(DeadlineExpired(job.name))
+            job.future.exception()  # Mark retrieved; callers may not await
+
+    def _start(self, job: _Job, now: float):
+        if job.global_slot:
+            self._active += 1
+        self._running[job.key] = self._running.get(job.key, 0) + 1
+        asyncio.create_task(self._run(job, now))
+
+    async def _run(self, job: _Job, started: float):
+        status, error = "ok", None
+        try:
+            result = await job.factory()
+            if not job.future.done():
+                job.future.set_result(result)
+        except DeadlineExpired as e:
+            status = "expired"
+            if not job.future.done():
+                job.future.set_exception(e)
+                job.future.exception()
+        except asyncio.CancelledError:
+            status = "cancelled"
+            if not job.future.done():
+                job.future.cancel()
+            raise
+        except Exception as e:
+            status, error = "failed", e
+            logger.error(f"Task '{job.name}' failed: {e}")
+            if not job.future.done():
+                job.future.set_exception(e)
+                job.future.exception()
+        finally:
+            finished = time.time()
+            if job.global_slot:
+                self._active -= 1
+            self._running[job.key] -= 1
+            if not self._running[job.key]:
+                del self._running[job.key]
+            self._record(job, started, finished, status, error)
+            self._pump()
+
+    def _record(self, job: _Job, started: float, finished: float, status: str, error: Optional[Exception]):
+        history = self._history.setdefault(job.name, TaskHistory())
+        if status == "ok":
+            history.runs += 1
+        elif status == "expired":
+            history.expired += 1
+        else:
+            history.failures += 1
+        history.total_run_seconds += finished - started
+        history.total_wait_seconds += started - job.submitted
+        history.last_status = status
+        history.last_finished = finished
+        entry = {
+            "status": status,
+            "priority": PRIORITY_NAMES.get(job.priority, str(job.priority)),
+            "waited": round(started - job.submitted, 2),
+            "duration": round(finished - started, 2),
+            "at": finished,
+        }
+        if error is not None:
+            entry["error"] = str(error)[:200]
+        history.recent.append(entry)
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        queued: Dict[str, int] = {}
+        for priority, _, job in self._queue:
+            name = PRIORITY_NAMES.get(priority, str(priority))
+            queued[name] = queued.get(name, 0) + 1
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self._active,
+            "running_by_key": dict(self._running),
+            "queued": queued,
+            "tasks": {name: h.to_dict() for name, h in self._history.items()},
+        }
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_executor: Optional[TaskExecutor] = None
+
+
+def get_task_executor() -> TaskExecutor:
+    """Get or create the process-wide task executor (event-loop only)."""
+    global _executor
+    if _executor is None:
+        # Prompt tasks share the primary SDK session: concurrent runs race
+        # to create sessions ("conversation not found"), so keep them serial.
+        _executor = TaskExecutor(key_limits={"prompt": 1})
+    return _executor
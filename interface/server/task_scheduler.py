@@ -0,0 +1,398 @@
+"""
+Task Scheduler - Precise timer-heap dispatch for scheduled tasks.
+
+The old scheduler loop slept 60 seconds and then had scheduler_tool
+re-evaluate the whole task file, so tasks fired up to a minute late and
+new schedules waited for the next poll. Instead:
+
+- Each task's next fire time is computed once (and recomputed only when its
+  schedule, state or last_run changes) and kept in a min-heap
+- The loop sleeps exactly until the earliest due task; the scheduler MCP
+  tools call rearm() after every edit, and the task file's mtime is
+  checked every FILE_CHECK_SECONDS, so tasks added outside this process
+  (scripts, out-of-process agents) are armed within seconds
+- scheduler_tool.check_due_tasks() stays the authority on what is due (and
+  on last_run bookkeeping); the heap only decides when to ask. Schedules
+  this module can't parse fall back to a 60s poll
+- Tasks that come due in the same wakeup are spread over a short window
+  instead of all starting in the same second
+- stats() reports lateness (how long after its due time each task was
+  picked up), wakeups and spurious wakes
+
+Schedule formats: "every N minutes/hours/days", "daily at HH:MM[am/pm]",
+"once at <ISO datetime>" and 5-field cron.
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("task_scheduler")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+DEFAULT_TASKS_PATH = os.path.join(ROOT_DIR, ".claude", "scripts", "scheduled_tasks.json")
+
+FALLBACK_POLL_SECONDS = 60.0   # Used while any active schedule can't be parsed
+IDLE_POLL_SECONDS = 300.0      # Safety re-check when everything is parsed
+FILE_CHECK_SECONDS = 5.0       # Task file mtime check (a stat, not a check_due_tasks call)
+SPREAD_STEP_SECONDS = 5.0      # Gap between tasks that come due together
+MAX_SPREAD_SECONDS = 30.0
+RETRY_DELAYS = (5.0, 15.0, 30.0, 60.0)  # Task computed due but not returned by check_due_tasks
+LATENESS_SAMPLES = 500
+
+_INTERVAL = re.compile(r"^every\s+(\d+)?\s*(second|sec|minute|min|hour|hr|day)s?$")
+_DAILY = re.compile(r"^daily\s+at\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?$")
+_ONCE = re.compile(r"^once\s+at\s+(.+)$")
+_UNIT_SECONDS = {"second": 1, "sec": 1, "minute": 60, "min": 60, "hour": 3600, "hr": 3600, "day": 86400}
+
+
+# ── Schedule parsing ──────────────────────────────────────────────────────────
+
+def _parse_dt(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def _cron_field(field: str, low: int, high: int) -> set:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part in ("*", ""):
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-", 1))
+        else:
+            start = end = int(part)
+        values.update(range(start, end + 1, step))
+    return {v for v in values if low <= v <= high}
+
+
+def _next_cron(expr: str, after: datetime) -> Optional[datetime]:
+    fields = expr.split()
+    minutes = sorted(_cron_field(fields[0], 0, 59))
+    hours = sorted(_cron_field(fields[1], 0, 23))
+    days = _cron_field(fields[2], 1, 31)
+    months = _cron_field(fields[3], 1, 12)
+    weekdays = {d % 7 for d in _cron_field(fields[4], 0, 7)}  # cron: 0/7 = Sunday
+    dom_any, dow_any = fields[2] == "*", fields[4] == "*"
+
+    start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    day = start.replace(hour=0, minute=0)
+    for _ in range(366 * 4):
+        if day.month in months:
+            dom_ok = day.day in days
+            dow_ok = (day.weekday() + 1) % 7 in weekdays
+            # Standard cron: when both are restricted, either may match
+            matches = dom_ok and dow_ok if dom_any or dow_any else dom_ok or dow_ok
+            if matches:
+                for hour in hours:
+                    for minute in minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+        day += timedelta(days=1)
+    return None
+
+
+def next_fire_time(task: Dict[str, Any], now: datetime) -> Tuple[bool, Optional[datetime]]:
+    """
+    Next time a task is due.
+
+    Returns (parsed, when). parsed=False means the schedule format is not
+    understood here; when=None with parsed=True means the task never fires
+    again (e.g. a one-shot that already ran).
+    """
+    schedule = str(task.get("schedule", "")).strip().lower()
+    last_run = _parse_dt(task.get("last_run"))
+    anchor = last_run or _parse_dt(task.get("created_at")) or now
+
+    match = _INTERVAL.match(schedule)
+    if match:
+        every = int(match.group(1) or 1) * _UNIT_SECONDS[match.group(2)]
+        return True, anchor + timedelta(seconds=every) if last_run or task.get("created_at") else now
+
+    match = _DAILY.match(schedule)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+        if match.group(3) == "pm" and hour < 12:
+            hour += 12
+        elif match.group(3) == "am" and hour == 12:
+            hour = 0
+        if hour > 23 or minute > 59:
+            return False, None
+        candidate = anchor.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= anchor:
+            candidate += timedelta(days=1)
+        return True, candidate
+
+    match = _ONCE.match(schedule)
+    if match:
+        when = _parse_dt(match.group(1).strip().upper())
+        if when is None:
+            return False, None
+        return True, None if last_run else when
+
+    if len(schedule.split()) == 5:
+        try:
+            return True, _next_cron(schedule, anchor)
+        except ValueError:
+            return False, None
+
+    return False, None
+
+
+# ── Scheduler ─────────────────────────────────────────────────────────────────
+
+class TaskScheduler:
+    """Timer heap over the task file, feeding due tasks to a dispatch callback."""
+
+    def __init__(self, tasks_path: str = DEFAULT_TASKS_PATH):
+        self.tasks_path = tasks_path
+        self._heap: List[Tuple[float, str]] = []
+        # task_id -> (state key, due timestamp or None)
+        self._computed: Dict[str, Tuple[tuple, Optional[float]]] = {}
+        self._retries: Dict[str, Tuple[tuple, int]] = {}  # task_id -> (state key, attempts)
+        self._unparsed = 0
+        self._file_mtime: Optional[int] = None
+        self._last_poll = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._lock = threading.Lock()
+        self._lateness: deque = deque(maxlen=LATENESS_SAMPLES)
+        self._last_lateness: Dict[str, float] = {}
+        self._stats = {"wakeups": 0, "dispatched": 0, "spurious_wakeups": 0, "polls": 0, "rebuilds": 0}
+
+    # ── Heap maintenance ──────────────────────────────────────────────────────
+
+    def _load_tasks(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.tasks_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read scheduled tasks: {e}")
+            return []
+        if isinstance(data, dict):
+            data = data.get("tasks", [])
+        return [t for t in data if isinstance(t, dict)]
+
+    def _task_file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.tasks_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _rebuild(self):
+        """Recompute fire times for new/changed tasks and rebuild the heap."""
+        self._file_mtime = self._task_file_mtime()
+        now = datetime.now()
+        heap: List[Tuple[float, str]] = []
+        computed: Dict[str, Tuple[tuple, Optional[float]]] = {}
+        unparsed = 0
+        for task in self._load_tasks():
+            task_id = str(task.get("id", ""))
+            if not task_id or not task.get("active", True):
+                continue
+            key = (task.get("schedule"), task.get("last_run"), task.get("created_at"))
+            cached = self._computed.get(task_id)
+            if cached is not None and cached[0] == key:
+                due = cached[1]
+            else:
+                parsed, when = next_fire_time(task, now)
+                if not parsed:
+                    unparsed += 1
+                    continue
+                due = when.timestamp() if when else None
+            computed[task_id] = (key, due)
+            if due is None:
+                continue
+            retry = self._retries.get(task_id)
+            if retry is not None and retry[0] == key:
+                due = max(due, time.time() + RETRY_DELAYS[min(retry[1], len(RETRY_DELAYS)) - 1])
+            else:
+                self._retries.pop(task_id, None)
+            heap.append((due, task_id))
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+            self._computed = computed
+            self._unparsed = unparsed
+            self._stats["rebuilds"] += 1
+
+    def rearm(self):
+        """Re-read the task file and re-arm the timer (safe from any thread)."""
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # Loop closed
+
+    def _next_poll(self) -> float:
+        with self._lock:
+            poll = FALLBACK_POLL_SECONDS if self._unparsed else IDLE_POLL_SECONDS
+        return self._last_poll + poll
+
+    def _timeout(self) -> float:
+        now = time.time()
+        until = self._next_poll() - now
+        with self._lock:
+            if self._heap:
+                until = min(until, self._heap[0][0] - now)
+        return max(0.0, min(FILE_CHECK_SECONDS, until))
+
+    # ── Loop ──────────────────────────────────────────────────────────────────
+
+    async def run(
+        self,
+        check_due: Callable[[], List[Any]],
+        dispatch: Callable[[Any], Awaitable[Any]],
+        maintenance: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Run forever: sleep until the next due task, ask check_due() what is
+        due, and start dispatch(task_info) for each returned task.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._rebuild()
+        self._last_poll = time.time()
+        logger.info(f"Task scheduler started ({len(self._heap)} timed tasks)")
+
+        while True:
+            try:
+                timeout = self._timeout()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+                    self._wake.clear()
+                    self._rebuild()
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+
+                if self._task_file_mtime() != self._file_mtime:
+                    self._rebuild()
+
+                now = time.time()
+                with self._lock:
+                    heap_due = bool(self._heap) and self._heap[0][0] <= now + 0.5
+                if not heap_due and now < self._next_poll():
+                    continue  # Only a task file check
+                self._last_poll = now
+
+                expected: Dict[str, float] = {}
+                with self._lock:
+                    while self._heap and self._heap[0][0] <= now + 0.5:
+                        due, task_id = heapq.heappop(self._heap)
+                        expected[task_id] = due
+                    self._stats["wakeups" if expected else "polls"] += 1
+
+                due_tasks = await asyncio.to_thread(check_due) or []
+                self._dispatch_batch(due_tasks, expected, now, dispatch)
+
+                # Computed due but not reported due: back off instead of spinning
+                returned = {str(t.get("id")) for t in due_tasks if isinstance(t, dict)}
+                for task_id in expected:
+                    if task_id not in returned:
+                        self._stats["spurious_wakeups"] += 1
+                        key = self._computed.get(task_id, ((), None))[0]
+                        attempts = self._retries.get(task_id, (key, 0))[1] + 1
+                        self._retries[task_id] = (key, attempts)
+
+                self._rebuild()
+                if maintenance:
+                    maintenance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduler Error: {e}")
+                await asyncio.sleep(1)
+
+    def _dispatch_batch(self, due_tasks: List[Any], expected: Dict[str, float], now: float,
+                        dispatch: Callable[[Any], Awaitable[Any]]):
+        """Start due tasks, spreading a batch over a short window in a stable order."""
+        def order(task_info):
+            task_id = str(task_info.get("id", "")) if isinstance(task_info, dict) else str(task_info)
+            return zlib.crc32(task_id.encode("utf-8"))
+
+        for position, task_info in enumerate(sorted(due_tasks, key=order)):
+            task_id = str(task_info.get("id", "")) if isinstance(task_info, dict) else ""
+            if task_id in expected:
+                lateness = max(0.0, now - expected[task_id])
+                self._lateness.append(lateness)
+                self._last_lateness[task_id] = round(lateness, 3)
+                self._retries.pop(task_id, None)
+            delay = min(position * SPREAD_STEP_SECONDS, MAX_SPREAD_SECONDS)
+            self._stats["dispatched"] += 1
+            asyncio.create_task(self._start_after(delay, task_info, dispatch))
+
+    @staticmethod
+    async def _start_after(delay: float, task_info: Any, dispatch: Callable[[Any], Awaitable[Any]]):
+        if delay:
+            await asyncio.sleep(delay)
+        await dispatch(task_info)
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["timed_tasks"] = len(self._heap)
+            stats["unparsed_tasks"] = self._unparsed
+            stats["next_due_in"] = round(self._heap[0][0] - time.time(), 1) if self._heap else None
+        samples = sorted(self._lateness)
+        if samples:
+            stats["lateness"] = {
+                "count": len(samples),
+                "mean": round(sum(samples) / len(samples), 3),
+                "p50": round(samples[len(samples) // 2], 3),
+                "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+                "max": round(samples[-1], 3),
+            }
+        else:
+            stats["lateness"] = {"count": 0}
+        stats["last_lateness"] = dict(self._last_lateness)
+        return stats
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_scheduler: Optional[TaskScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_task_scheduler() -> TaskScheduler:
+    """Get or create the process-wide task scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = TaskScheduler()
+    return _scheduler
+
+
+def rearm_scheduler():
+    """Wake the scheduler after a task edit. No-op if it isn't running."""
+    if _scheduler is not None:
+        _scheduler.rearm()
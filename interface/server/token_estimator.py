@@ -0,0 +1,82 @@
+"""
+Token Estimator - Fast, tokenizer-compatible token counts.
+
+Uses tiktoken's cl100k_base encoding when installed (a close proxy for
+Claude's BPE on English and code). Otherwise falls back to a regex
+pre-tokenizer that mirrors how BPE splits text:
+
+- Latin words cost 1 token, plus 1 per further 6 letters
+- Digit runs cost 1 token per 3 digits
+- Each punctuation / symbol character costs 1 token
+- CJK and other non-Latin letters cost ~1 token per character
+- Runs of whitespace are folded into the following token
+
+This tracks real token counts far better than a flat chars * 0.25,
+which badly undercounts code, JSON, numbers and non-English text.
+"""
+
+import logging
+import re
+from typing import Optional
+
+logger = logging.getLogger("token_estimator")
+
+# Latin word runs, digit runs, single other characters (punctuation, CJK, ...), whitespace
+_WORD = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]|\s+")
+
+_encoding = None
+_encoding_checked = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_checked
+    if not _encoding_checked:
+        _encoding_checked = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            logger.debug("tiktoken unavailable, using regex token estimator")
+    return _encoding
+
+
+def _regex_estimate(text: str) -> int:
+    tokens = 0
+    for piece in _WORD.findall(text):
+        first = piece[0]
+        if first.isspace():
+            # Single spaces merge into the next word; newlines/indent runs cost ~1
+            if "\n" in piece or len(piece) > 1:
+                tokens += 1
+        elif first.isalpha() and first.isascii():
+            tokens += 1 + (len(piece) - 1) // 6
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimated token count for text (0 for empty/None)."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        try:
+            return len(encoding.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    return _regex_estimate(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """Cut text so that it fits within max_tokens (approximately), appending suffix."""
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    # Proportional first cut, then shrink until it fits
+    cut = max(0, int(len(text) * max_tokens / total))
+    while cut > 0 and estimate_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    return text[:cut] + suffix
@@ -55,7 +55,7 @@ def serialize_bash(args: dict, output: str, is_error: bool) -> dict:
 
 
 def serialize_invoke_agent(args: dict, output: str, is_error: bool) -> dict:
-    kept = _pick(args, ["agent", "mode", "model_override"])
+    kept = _pick(args, ["agent", "mode", "model_override", "use_cache"])
     if "prompt" in args:
         kept["prompt"] = str(args["prompt"])  # Prompts are already compressed; store verbatim
     return {
@@ -88,8 +88,22 @@ def serialize_invoke_agent_parallel(args: dict, output: str, is_error: bool) ->
     }
 
 
+def serialize_invoke_agent_graph(args: dict, output: str, is_error: bool) -> dict:
+    kept = _pick(args, ["use_cache", "return_all"])
+    if "nodes" in args and isinstance(args["nodes"], list):
+        # Preserve node definitions verbatim — prompts are already compressed
+        kept["nodes"] = [
+            {k: v for k, v in node.items() if k in ("id", "agent", "prompt", "depends_on", "model_override")}
+            for node in args["nodes"]
+        ]
+    return {
+        "args": kept,
+        "output_summary": _truncate(output, 500),
+    }
+
+
 def serialize_consult_llm(args: dict, output: str, is_error: bool) -> dict:
-    kept = _pick(args, ["provider", "model", "temperature"])
+    kept = _pick(args, ["provider", "model", "temperature", "use_cache"])
     if "prompt" in args:
         kept["prompt"] = _truncate(str(args["prompt"]), 300)
     return {
@@ -357,6 +371,7 @@ TOOL_SERIALIZERS: Dict[str, Callable[[dict, str, bool], dict]] = {
     "invoke_agent": serialize_invoke_agent,
     "invoke_agent_chain": serialize_invoke_agent_chain,
     "invoke_agent_parallel": serialize_invoke_agent_parallel,
+    "invoke_agent_graph": serialize_invoke_agent_graph,
     "consult_llm": serialize_consult_llm,
     "generate_image": serialize_generate_image,
     "edit_image": serialize_edit_image,
@@ -422,6 +437,8 @@ TOOL_SERIALIZERS: Dict[str, Callable[[dict, str, bool], dict]] = {
     "memory_create": serialize_compact(["triggers"]),
     "memory_update": serialize_compact(["id"]),
     "memory_delete": serialize_compact(["id"]),
+    "memory_batch": serialize_compact([]),
+    "memory_find_duplicates": serialize_compact(["threshold"]),
     "forms_define": serialize_compact(["form_id", "title"]),
     "forms_show": serialize_compact(["form_id"]),
     "forms_list": serialize_compact(["form_id"]),
@@ -499,7 +516,7 @@ def format_tool_for_history(tool_msg: dict) -> str:
     is_error = tool_msg.get("is_error", False)
 
     # Agent invocation tools — preserve prompts verbatim in history
-    agent_tools = {"invoke_agent", "invoke_agent_chain", "invoke_agent_parallel"}
+    agent_tools = {"invoke_agent", "invoke_agent_chain", "invoke_agent_parallel", "invoke_agent_graph"}
     is_agent_tool = display_name in agent_tools
 
     # Build param string from args
@@ -507,7 +524,7 @@ def format_tool_for_history(tool_msg: dict) -> str:
     for k, v in args.items():
         val = str(v)
         # Don't truncate prompt fields for agent invocations
-        if not (is_agent_tool and k in ("prompt", "initial_prompt", "agents")):
+        if not (is_agent_tool and k in ("prompt", "initial_prompt", "agents", "nodes")):
             if len(val) > 120:
                 val = val[:117] + "..."
         param_parts.append(f"{k}: {val}")
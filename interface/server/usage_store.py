@@ -0,0 +1,419 @@
+"""
+Usage Store - Time series of tokens, cost, latency, CPU and RSS.
+
+result_meta's cost/usage/duration used to be folded only into a chat's
+cumulative_usage, and agent runs (invoke_agent, scheduled tasks) were not
+aggregated anywhere. This records both:
+
+- runs: one row per chat turn (ClaudeWrapper result_meta) and per agent
+  run (agent scheduler lease release, with the tokens/cost the runner
+  reports when the run deregisters, background runs included) — agent,
+  model, chat, tokens, cost, latency
+- samples: CPU percent and RSS per registered process, plus the server's
+  CLI subprocesses in aggregate, every SAMPLE_INTERVAL seconds
+- SQLite ring buffer (.claude/usage/usage.db): each table is capped at
+  MAX_ROWS and RETENTION_DAYS; writes are buffered and flushed by one
+  background thread, so recording never blocks the event loop
+- query() rolls rows up by hour or day, grouped by agent/model/chat/kind
+  (served at /api/usage)
+- BudgetGuard: when hourly/daily spend or CPU load per core passes its
+  limit, the agent scheduler stops admitting background agents until it
+  drops again
+
+Limits (0 = off): USAGE_HOURLY_BUDGET_USD, USAGE_DAILY_BUDGET_USD,
+USAGE_MAX_LOAD_PER_CPU.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("usage_store")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+DEFAULT_DB_PATH = os.path.join(ROOT_DIR, ".claude", "usage", "usage.db")
+
+SAMPLE_INTERVAL = 60.0
+FLUSH_INTERVAL = 10.0
+MAX_ROWS = 200_000          # Per table; oldest rows are dropped first
+RETENTION_DAYS = 90
+
+HOURLY_BUDGET_USD = float(os.environ.get("USAGE_HOURLY_BUDGET_USD", "0") or 0)
+DAILY_BUDGET_USD = float(os.environ.get("USAGE_DAILY_BUDGET_USD", "0") or 0)
+MAX_LOAD_PER_CPU = float(os.environ.get("USAGE_MAX_LOAD_PER_CPU", "0") or 0)
+GUARD_CACHE_SECONDS = 15.0
+
+BUCKET_FORMATS = {"hour": "%Y-%m-%dT%H:00", "day": "%Y-%m-%d"}
+GROUP_COLUMNS = {"agent": "agent", "model": "model", "chat": "chat_id", "kind": "kind"}
+
+_RUN_COLUMNS = ("ts", "kind", "agent", "model", "chat_id", "input_tokens", "output_tokens",
+                "cache_read_tokens", "cost_usd", "duration_ms", "is_error")
+
+
+def usage_from_result(result: Any) -> Dict[str, Any]:
+    """Tokens/cost/error fields from a runner AgentResult (whatever it exposes)."""
+    usage = getattr(result, "usage", None) or {}
+    if not isinstance(usage, dict):
+        usage = {}
+    cost = getattr(result, "cost_usd", None)
+    if cost is None:
+        cost = getattr(result, "total_cost_usd", None)
+    fields = {
+        "input_tokens": usage.get("input_tokens", 0) + usage.get("cache_creation_input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cache_read_tokens": usage.get("cache_read_input_tokens", 0),
+        "cost_usd": cost or 0.0,
+    }
+    status = getattr(result, "status", None)
+    if status is not None:
+        fields["is_error"] = status != "success"
+    elif isinstance(getattr(result, "is_error", None), bool):
+        fields["is_error"] = result.is_error
+    elif isinstance(result, dict) and "error" in result:
+        fields["is_error"] = True
+    model = getattr(result, "model", None)
+    if model:
+        fields["model"] = model
+    return fields
+
+
+class UsageStore:
+    """Buffered SQLite ring buffer of run and resource-sample rows."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_schema()
+        self._pending_runs: List[tuple] = []
+        self._pending_samples: List[tuple] = []
+        self._pending_lock = threading.Lock()
+        self._cpu_samples: Dict[int, tuple] = {}   # Sampler thread only (see sample_process)
+        self._worker: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _init_schema(self):
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    ts                REAL NOT NULL,
+                    kind              TEXT,
+                    agent             TEXT,
+                    model             TEXT,
+                    chat_id           TEXT,
+                    input_tokens      INTEGER DEFAULT 0,
+                    output_tokens     INTEGER DEFAULT 0,
+                    cache_read_tokens INTEGER DEFAULT 0,
+                    cost_usd          REAL DEFAULT 0,
+                    duration_ms       INTEGER DEFAULT 0,
+                    is_error          INTEGER DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_runs_ts ON runs(ts);
+                CREATE TABLE IF NOT EXISTS samples (
+                    ts          REAL NOT NULL,
+                    agent       TEXT,
+                    pid         INTEGER,
+                    cpu_percent REAL,
+                    rss_mb      REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_samples_ts ON samples(ts);
+            """)
+            self._conn.commit()
+
+    # ── Recording ─────────────────────────────────────────────────────────────
+
+    def record_run(self, kind: str, agent: Optional[str] = None, model: Optional[str] = None,
+                   chat_id: Optional[str] = None, input_tokens: int = 0, output_tokens: int = 0,
+                   cache_read_tokens: int = 0, cost_usd: float = 0.0, duration_ms: int = 0,
+                   is_error: bool = False, ts: Optional[float] = None):
+        """Queue one chat turn / agent run row (thread-safe, non-blocking)."""
+        row = (ts or time.time(), kind, agent, model, chat_id, int(input_tokens or 0),
+               int(output_tokens or 0), int(cache_read_tokens or 0), float(cost_usd or 0.0),
+               int(duration_ms or 0), int(bool(is_error)))
+        with self._pending_lock:
+            self._pending_runs.append(row)
+
+    def record_sample(self, agent: str, pid: Optional[int], cpu_percent: float, rss_mb: float,
+                      ts: Optional[float] = None):
+        with self._pending_lock:
+            self._pending_samples.append((ts or time.time(), agent, pid, cpu_percent, rss_mb))
+
+    def flush(self):
+        """Write buffered rows and trim both tables to the ring-buffer limits."""
+        with self._pending_lock:
+            runs, self._pending_runs = self._pending_runs, []
+            samples, self._pending_samples = self._pending_samples, []
+        if not runs and not samples:
+            return
+        cutoff = time.time() - RETENTION_DAYS * 86400
+        with self._lock:
+            if runs:
+                self._conn.executemany(
+                    f"INSERT INTO runs ({', '.join(_RUN_COLUMNS)}) VALUES ({', '.join('?' * len(_RUN_COLUMNS))})",
+                    runs,
+                )
+            if samples:
+                self._conn.executemany(
+                    "INSERT INTO samples (ts, agent, pid, cpu_percent, rss_mb) VALUES (?, ?, ?, ?, ?)",
+                    samples,
+                )
+            for table in ("runs", "samples"):
+                self._conn.execute(f"DELETE FROM {table} WHERE ts < ?", (cutoff,))
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE rowid <= (SELECT MAX(rowid) FROM {table}) - ?", (MAX_ROWS,)
+                )
+            self._conn.commit()
+
+    # ── Resource sampling ─────────────────────────────────────────────────────
+
+    def sample_processes(self):
+        """Record CPU/RSS for registered processes and the server's CLI subprocesses."""
+        from process_registry import get_process_list, sample_process
+
+        now = time.time()
+        seen = set()
+        for entry in get_process_list():
+            pid = entry.get("pid")
+            if pid is None or pid in seen:
+                continue
+            seen.add(pid)
+            usage = sample_process(pid, self._cpu_samples)
+            if usage:
+                self.record_sample(entry.get("agent"), pid, usage["cpu_percent"], usage["rss_mb"], ts=now)
+
+        # SDK-managed agents don't expose their PIDs: account for them as the
+        # server's child processes, in aggregate
+        cpu, rss, found = 0.0, 0.0, False
+        for pid in _child_pids(os.getpid()):
+            seen.add(pid)
+            usage = sample_process(pid, self._cpu_samples)
+            if usage:
+                cpu, rss, found = cpu + usage["cpu_percent"], rss + usage["rss_mb"], True
+        for pid in set(self._cpu_samples) - seen:
+            del self._cpu_samples[pid]
+        if found:
+            self.record_sample("sdk_subprocesses", None, round(cpu, 1), round(rss, 1), ts=now)
+
+    def _run_worker(self):
+        last_sample = 0.0
+        while not self._stop.wait(FLUSH_INTERVAL):
+            try:
+                if time.monotonic() - last_sample >= SAMPLE_INTERVAL:
+                    last_sample = time.monotonic()
+                    self.sample_processes()
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Usage store flush failed: {e}")
+
+    def start(self):
+        """Start the background flush/sampling thread (idempotent)."""
+        if self._worker is None or not self._worker.is_alive():
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run_worker, name="usage-store", daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    # ── Queries ───────────────────────────────────────────────────────────────
+
+    def spend_since(self, since: float) -> float:
+        """Total cost of runs since a timestamp (including unflushed rows)."""
+        with self._pending_lock:
+            pending = sum(r[8] for r in self._pending_runs if r[0] >= since)
+        with self._lock:
+            row = self._conn.execute("SELECT COALESCE(SUM(cost_usd), 0) FROM runs WHERE ts >= ?",
+                                     (since,)).fetchone()
+        return row[0] + pending
+
+    def query(self, bucket: str = "hour", since: Optional[float] = None, until: Optional[float] = None,
+              group_by: str = "agent", agent: Optional[str] = None, chat_id: Optional[str] = None) -> Dict[str, Any]:
+        """Roll runs and resource samples up into hour/day buckets."""
+        if bucket not in BUCKET_FORMATS:
+            raise ValueError(f"bucket must be one of {sorted(BUCKET_FORMATS)}")
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of {sorted(GROUP_COLUMNS)}")
+        self.flush()
+
+        until = until or time.time()
+        if since is None:
+            since = until - (2 if bucket == "hour" else 30) * 86400
+        fmt = BUCKET_FORMATS[bucket]
+        column = GROUP_COLUMNS[group_by]
+        where, params = "ts >= ? AND ts < ?", [since, until]
+        if agent:
+            where += " AND agent = ?"
+            params.append(agent)
+        run_where, run_params = where, list(params)
+        if chat_id:
+            run_where += " AND chat_id = ?"
+            run_params.append(chat_id)
+
+        with self._lock:
+            runs = self._conn.execute(f"""
+                SELECT strftime('{fmt}', ts, 'unixepoch', 'localtime') AS bucket,
+                       {column} AS grp,
+                       COUNT(*) AS runs,
+                       SUM(is_error) AS errors,
+                       SUM(input_tokens) AS input_tokens,
+                       SUM(output_tokens) AS output_tokens,
+                       SUM(cache_read_tokens) AS cache_read_tokens,
+                       SUM(cost_usd) AS cost_usd,
+                       AVG(duration_ms) AS avg_duration_ms,
+                       MAX(duration_ms) AS max_duration_ms
+                FROM runs WHERE {run_where}
+                GROUP BY bucket, grp ORDER BY bucket, grp
+            """, run_params).fetchall()
+            samples = self._conn.execute(f"""
+                SELECT strftime('{fmt}', ts, 'unixepoch', 'localtime') AS bucket,
+                       agent, AVG(cpu_percent) AS avg_cpu_percent, MAX(cpu_percent) AS max_cpu_percent,
+                       AVG(rss_mb) AS avg_rss_mb, MAX(rss_mb) AS max_rss_mb, COUNT(*) AS samples
+                FROM samples WHERE {where}
+                GROUP BY bucket, agent ORDER BY bucket, agent
+            """, params).fetchall()
+
+        run_rows = []
+        totals = {"runs": 0, "errors": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+        for row in runs:
+            item = dict(row)
+            item[group_by] = item.pop("grp")
+            item["cost_usd"] = round(item["cost_usd"] or 0.0, 4)
+            item["avg_duration_ms"] = int(item["avg_duration_ms"] or 0)
+            run_rows.append(item)
+            for name in totals:
+                totals[name] += item[name] or 0
+        totals["cost_usd"] = round(totals["cost_usd"], 4)
+        resource_rows = [
+            {k: (round(v, 1) if isinstance(v, float) else v) for k, v in dict(row).items()}
+            for row in samples
+        ]
+        return {
+            "bucket": bucket,
+            "group_by": group_by,
+            "since": since,
+            "until": until,
+            "totals": totals,
+            "runs": run_rows,
+            "resources": resource_rows,
+        }
+
+
+def _child_pids(parent: int) -> List[int]:
+    """Direct children of a PID, from /proc (empty where /proc is unavailable)."""
+    children = []
+    try:
+        names = os.listdir("/proc")
+    except OSError:
+        return children
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if len(fields) > 1 and fields[1] == str(parent):
+            children.append(int(name))
+    return children
+
+
+class BudgetGuard:
+    """Decides whether background agents should be held back for spend or load."""
+
+    def __init__(self, store: UsageStore, hourly_usd: float = HOURLY_BUDGET_USD,
+                 daily_usd: float = DAILY_BUDGET_USD, max_load_per_cpu: float = MAX_LOAD_PER_CPU):
+        self.store = store
+        self.hourly_usd = hourly_usd
+        self.daily_usd = daily_usd
+        self.max_load_per_cpu = max_load_per_cpu
+        self._checked = 0.0
+        self._reason: Optional[str] = None
+        self.throttle_events = 0
+
+    def _evaluate(self) -> Optional[str]:
+        now = time.time()
+        if self.hourly_usd > 0:
+            spent = self.store.spend_since(now - 3600)
+            if spent >= self.hourly_usd:
+                return f"hourly spend ${spent:.2f} reached the ${self.hourly_usd:.2f} budget"
+        if self.daily_usd > 0:
+            spent = self.store.spend_since(now - 86400)
+            if spent >= self.daily_usd:
+                return f"daily spend ${spent:.2f} reached the ${self.daily_usd:.2f} budget"
+        if self.max_load_per_cpu > 0 and hasattr(os, "getloadavg"):
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+            if load >= self.max_load_per_cpu:
+                return f"load {load:.2f} per CPU exceeds {self.max_load_per_cpu:.2f}"
+        return None
+
+    def throttle_reason(self) -> Optional[str]:
+        """Why background agents should wait right now, or None (cached briefly)."""
+        if not (self.hourly_usd or self.daily_usd or self.max_load_per_cpu):
+            return None
+        if time.monotonic() - self._checked >= GUARD_CACHE_SECONDS:
+            self._checked = time.monotonic()
+            try:
+                reason = self._evaluate()
+            except Exception as e:
+                logger.warning(f"Budget check failed: {e}")
+                reason = None
+            if reason and not self._reason:
+                self.throttle_events += 1
+                logger.warning(f"Throttling background agents: {reason}")
+            elif self._reason and not reason:
+                logger.info("Background agent throttle lifted")
+            self._reason = reason
+        return self._reason
+
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "limits": {
+                "hourly_usd": self.hourly_usd or None,
+                "daily_usd": self.daily_usd or None,
+                "max_load_per_cpu": self.max_load_per_cpu or None,
+            },
+            "spend": {
+                "last_hour_usd": round(self.store.spend_since(now - 3600), 4),
+                "last_day_usd": round(self.store.spend_since(now - 86400), 4),
+            },
+            "throttled": self.throttle_reason(),
+            "throttle_events": self.throttle_events,
+        }
+
+
+# ── Singletons ────────────────────────────────────────────────────────────────
+
+_store: Optional[UsageStore] = None
+_guard: Optional[BudgetGuard] = None
+_store_lock = threading.Lock()
+
+
+def get_usage_store() -> UsageStore:
+    """Get or create the process-wide usage store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = UsageStore()
+    return _store
+
+
+def get_budget_guard() -> BudgetGuard:
+    """Get or create the budget guard over the usage store."""
+    global _guard
+    if _guard is None:
+        store = get_usage_store()
+        with _store_lock:
+            if _guard is None:
+                _guard = BudgetGuard(store)
+    return _guard
@@ -0,0 +1,165 @@
+"""
+Working Memory Service - Shared in-process access to per-agent working memory.
+
+The working_memory module (.claude/scripts) persists each agent's store on
+disk. This service sits in front of it so the prompt builder, the
+working_memory_* tools and the turn-end hook share one cached store per
+agent instead of re-resolving and re-parsing it on every call:
+
+- One store object per agent, created once; mutations go through the
+  store (write-through to disk) and invalidate the cached views
+- Cached item list and formatted prompt block per agent, keyed by a change
+  version and the current minute (deadline countdowns stay fresh)
+- Exchange/TTL advancement for all agents that took part in a turn is
+  applied in a single batched pass at turn end
+- Change events: subscribers get (agent_name, event, detail) after every
+  mutation or TTL pass
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("working_memory_service")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+SCRIPTS_DIR = os.path.join(ROOT_DIR, ".claude", "scripts")
+
+DEFAULT_AGENT = "character"
+
+# listener(agent_name, event, detail); event is "added", "updated", "removed" or "advanced"
+ChangeListener = Callable[[str, str, Dict[str, Any]], None]
+
+
+def _ensure_scripts_path():
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+
+
+class WorkingMemoryService:
+    """Cached, write-through access to every agent's working memory store."""
+
+    def __init__(self):
+        self._stores: Dict[str, Any] = {}
+        self._versions: Dict[str, int] = {}
+        # agent -> (version, minute, items, prompt_block)
+        self._views: Dict[str, Tuple[int, int, List[Any], str]] = {}
+        self._listeners: List[ChangeListener] = []
+        self._lock = threading.RLock()
+
+    # ── Stores ────────────────────────────────────────────────────────────────
+
+    def get_store(self, agent_name: Optional[str] = None):
+        """The cached store for an agent (created on first use)."""
+        agent = agent_name or DEFAULT_AGENT
+        with self._lock:
+            store = self._stores.get(agent)
+            if store is None:
+                _ensure_scripts_path()
+                from working_memory import get_store
+                store = get_store(agent_name=agent)
+                self._stores[agent] = store
+                self._versions.setdefault(agent, 0)
+            return store
+
+    def _view(self, agent: str) -> Tuple[List[Any], str]:
+        minute = int(time.time() // 60)
+        with self._lock:
+            store = self.get_store(agent)
+            version = self._versions.get(agent, 0)
+            cached = self._views.get(agent)
+            if cached and cached[0] == version and cached[1] == minute:
+                return cached[2], cached[3]
+            items = list(store.list_items())
+            block = store.format_prompt_block() or ""
+            self._views[agent] = (version, minute, items, block)
+            return items, block
+
+    def list_items(self, agent_name: Optional[str] = None) -> List[Any]:
+        return list(self._view(agent_name or DEFAULT_AGENT)[0])
+
+    def format_prompt_block(self, agent_name: Optional[str] = None) -> str:
+        return self._view(agent_name or DEFAULT_AGENT)[1]
+
+    # ── Mutations (write-through) ─────────────────────────────────────────────
+
+    def _changed(self, agent: str, event: str, detail: Dict[str, Any]):
+        with self._lock:
+            self._versions[agent] = self._versions.get(agent, 0) + 1
+            self._views.pop(agent, None)
+        for listener in list(self._listeners):
+            try:
+                listener(agent, event, detail)
+            except Exception as e:
+                logger.warning(f"Working memory listener failed for {agent}: {e}")
+
+    def add_item(self, agent_name: Optional[str] = None, **kwargs):
+        agent = agent_name or DEFAULT_AGENT
+        with self._lock:
+            item = self.get_store(agent).add_item(**kwargs)
+        self._changed(agent, "added", {"content": getattr(item, "content", "")})
+        return item
+
+    def update_item(self, agent_name: Optional[str] = None, **kwargs):
+        agent = agent_name or DEFAULT_AGENT
+        with self._lock:
+            item = self.get_store(agent).update_item(**kwargs)
+        self._changed(agent, "updated", {"index": kwargs.get("index")})
+        return item
+
+    def remove_item(self, agent_name: Optional[str], index: int):
+        agent = agent_name or DEFAULT_AGENT
+        with self._lock:
+            item = self.get_store(agent).remove_item(index)
+        self._changed(agent, "removed", {"index": index})
+        return item
+
+    # ── Turn end ──────────────────────────────────────────────────────────────
+
+    def end_turn(self, agent_names: Iterable[Optional[str]]) -> Dict[str, bool]:
+        """
+        Advance exchange TTLs once for every agent that took part in a turn.
+
+        Returns {agent: expired_any}. Each store is advanced (and persisted)
+        exactly once, however many times it was read during the turn.
+        """
+        results: Dict[str, bool] = {}
+        for agent in dict.fromkeys(a or DEFAULT_AGENT for a in agent_names):
+            try:
+                with self._lock:
+                    expired = bool(self.get_store(agent).advance_exchange())
+                results[agent] = expired
+                self._changed(agent, "advanced", {"expired": expired})
+            except Exception as e:
+                logger.debug(f"Working memory advance failed for {agent}: {e}")
+        return results
+
+    # ── Events ────────────────────────────────────────────────────────────────
+
+    def subscribe(self, listener: ChangeListener):
+        """Call listener(agent_name, event, detail) after every change."""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: ChangeListener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_service: Optional[WorkingMemoryService] = None
+_service_lock = threading.Lock()
+
+
+def get_working_memory_service() -> WorkingMemoryService:
+    """Get or create the process-wide working memory service."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = WorkingMemoryService()
+    return _service